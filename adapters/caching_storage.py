@@ -0,0 +1,207 @@
+"""Storage adapter that adds a read-through cache to another storage adapter.
+
+Wraps any Storage implementation, eg:
+>>> storage = CachingStorage(DjangoStorage(), LRUCache(max_size=10000))
+
+Single notes, boards and board user lists are served from the cache when possible. Every write
+that goes through this adapter invalidates the entries it affects, both straight away and again once
+the write is committed, so that rows read by other threads before the commit don't stay cached.
+Writes made directly to the wrapped storage (or the database) are only seen once entries expire, and
+so are writes from other processes, unless the cache is shared between them (eg memcached rather
+than Django's local memory cache).
+
+Roles aren't cached here, since PermissionChecker has its own RoleCache; caching them in both
+would let a revoked role outlive either cache's timeout. Reads that a write will be based on should
+be made within uncached(), so that they never return an out of date entity:
+>>> with storage.uncached():
+...     note = storage.get_note(id)
+"""
+
+import contextlib
+import threading
+from functools import partial
+
+from .storage import StorageWrapper
+
+# Default time to live for each type of cache entry, in seconds
+DEFAULT_TTLS = {
+    'note': 300,
+    'board': 300,
+    'board_users': 60,
+}
+
+
+class CachingStorage(StorageWrapper):
+    """Adapter that caches reads from another storage adapter."""
+
+    # Number of notes loaded at a time when collecting IDs to invalidate for a whole board
+    invalidation_page_size = 500
+
+    def __init__(self, storage, cache, ttls=None):
+        """Instantiate with storage adapter to wrap, and cache adapter (eg LRUCache, DjangoCache).
+
+        ttls can override DEFAULT_TTLS for any entry type.
+        """
+        super().__init__(storage)
+        self.cache = cache
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.hits = dict.fromkeys(self.ttls, 0)
+        self.misses = dict.fromkeys(self.ttls, 0)
+        self._local = threading.local()
+
+    @property
+    def stats(self):
+        """Hit & miss counts for each entry type, plus evictions if the cache reports them."""
+        return {
+            'hits': dict(self.hits),
+            'misses': dict(self.misses),
+            'evictions': getattr(self.cache, 'evictions', None)
+        }
+
+    @staticmethod
+    def _key(entry_type, *ids):
+        return ':'.join([entry_type] + [str(id) for id in ids])
+
+    @contextlib.contextmanager
+    def uncached(self):
+        """Context manager within which reads skip the cache, but still refresh it."""
+        previous = getattr(self._local, 'uncached', False)
+        self._local.uncached = True
+        try:
+            with self.storage.uncached():
+                yield
+        finally:
+            self._local.uncached = previous
+
+    def _get(self, entry_type, ids, fetch):
+        """Return cached value, or fetch & cache it."""
+        key = self._key(entry_type, *ids)
+        cached = None if getattr(self._local, 'uncached', False) else self.cache.get(key)
+        if cached is not None:
+            self.hits[entry_type] += 1
+            return cached[0]
+
+        self.misses[entry_type] += 1
+        value = fetch()
+        self.cache.set(key, (value, ), self.ttls[entry_type])
+        return value
+
+    def _invalidate(self, keys):
+        """Delete cache entries now, so this thread sees its own writes, and again once the writes
+        are committed, in case another thread cached what it read before then."""
+        self.cache.delete_many(keys)
+        self.storage.on_commit(partial(self.cache.delete_many, keys))
+
+    def _invalidate_notes(self, note_ids):
+        self._invalidate([self._key('note', id) for id in note_ids])
+
+    def _invalidate_board_users(self, board_id):
+        self._invalidate([self._key('board_users', board_id)])
+
+    def save_board(self, board):
+        try:
+            board = self.storage.save_board(board)
+        finally:
+            # Also invalidate on Conflict, since the cached board may be the out of date one
+            if board.id is not None:
+                self._invalidate([self._key('board', board.id)])
+        return board
+
+    def get_board(self, id):
+        return self._get('board', (id, ), lambda: self.storage.get_board(id=id))
+
+    def delete_board(self, id):
+        board = self.storage.delete_board(id=id)
+        self._invalidate([self._key('board', id), self._key('board_users', id)])
+        return board
+
+    def save_board_user(self, board_id, user_id, role):
+        result = self.storage.save_board_user(board_id=board_id, user_id=user_id, role=role)
+        self._invalidate_board_users(board_id)
+        return result
+
+    def delete_board_user(self, board_id, user_id):
+        result = self.storage.delete_board_user(board_id=board_id, user_id=user_id)
+        self._invalidate_board_users(board_id)
+        return result
+
+    def delete_board_users(self, board_id):
+        user_ids = self.storage.delete_board_users(board_id=board_id)
+        self._invalidate_board_users(board_id)
+        return user_ids
+
+    def purge_board(self, board_id, limit):
+        purged = self.storage.purge_board(board_id=board_id, limit=limit)
+        self._invalidate_notes(purged['note_ids'])
+        self._invalidate_board_users(board_id)
+        return purged
+
+    def get_board_users(self, id):
+        return self._get('board_users', (id, ), lambda: self.storage.get_board_users(id=id))
+
+    def save_note(self, note):
+        try:
+            note = self.storage.save_note(note)
+        finally:
+            # Also invalidate on Conflict, since the cached note may be the out of date one
+            if note.id is not None:
+                self._invalidate_notes([note.id])
+        return note
+
+    def save_notes(self, notes):
+        try:
+            return self.storage.save_notes(notes)
+        finally:
+            self._invalidate_notes([note.id for note in notes if note.id is not None])
+
+    def move_notes(self, ids, board_id, from_board_ids=None):
+        ids = list(ids)
+        try:
+            return self.storage.move_notes(ids=ids, board_id=board_id,
+                                           from_board_ids=from_board_ids)
+        finally:
+            self._invalidate_notes(ids)
+
+    def update_notes(self, ids, fields, board_ids=None):
+        ids = list(ids)
+        try:
+            return self.storage.update_notes(ids=ids, fields=fields, board_ids=board_ids)
+        finally:
+            self._invalidate_notes(ids)
+
+    def get_note(self, id):
+        return self._get('note', (id, ), lambda: self.storage.get_note(id=id))
+
+    def get_note_with_role(self, id, user_id):
+        # The role has to be read from storage anyway, and the note comes with it in the same
+        # query, so it's never served from the cache, only used to refresh it
+        note, role = self.storage.get_note_with_role(id=id, user_id=user_id)
+        self.cache.set(self._key('note', id), (note, ), self.ttls['note'])
+        return note, role
+
+    def delete_note(self, id):
+        result = self.storage.delete_note(id=id)
+        self._invalidate_notes([id])
+        return result
+
+    def delete_notes(self, ids):
+        ids = list(ids)
+        result = self.storage.delete_notes(ids=ids)
+        self._invalidate_notes(ids)
+        return result
+
+    def delete_board_notes(self, board_id):
+        # Notes are cached by ID alone, so we need to find which ones belong to the board first
+        note_ids = []
+        after_id = None
+        while True:
+            page = self.storage.get_board_notes(
+                id=board_id, after_id=after_id, limit=self.invalidation_page_size)
+            note_ids.extend(note.id for note in page)
+            if len(page) < self.invalidation_page_size:
+                break
+            after_id = page[-1].id
+
+        result = self.storage.delete_board_notes(board_id=board_id)
+        self._invalidate_notes(note_ids)
+        return result
@@ -0,0 +1,197 @@
+"""Storage adapter that coalesces identical concurrent reads.
+
+When many threads in a process ask for the same note or page of board notes at the same time, only
+the first (the leader) calls the wrapped storage; the others wait for it and share its result, or
+its exception. Optionally, a finished result keeps being shared for a short window afterwards.
+
+Any write that goes through this adapter discards all shared results, including reads still in
+flight, so that a thread always sees its own writes.
+
+Reads made inside a transaction are never shared, since the transaction's uncommitted rows would be
+handed to other threads, and rows committed by others could hide the transaction's own writes.
+Neither are reads within uncached(), which must see the latest stored data.
+"""
+
+import contextlib
+import threading
+import time
+
+from .storage import StorageWrapper
+
+
+class _Flight():
+    """A single fetch, shared between all callers with the same key."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.finished_at = None
+        self.result = None
+        self.error = None
+
+
+class SingleFlight():
+    """Run at most one fetch at a time per key, and share its outcome with concurrent callers.
+
+    With window > 0, callers arriving up to that many seconds after a fetch finishes get the same
+    outcome instead of starting a new fetch.
+    """
+
+    # Max number of finished flights kept for the window before expired ones are swept
+    max_finished = 10000
+
+    def __init__(self, window=0):
+        self.window = window
+        self.calls = 0
+        self.collapsed = 0
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def _now(self):
+        return time.monotonic()
+
+    def _expired(self, flight, now):
+        return flight.finished_at is not None and now - flight.finished_at >= self.window
+
+    def do(self, key, fetch):
+        """Return fetch() result, sharing it with any identical calls in flight."""
+        with self._lock:
+            self.calls += 1
+            flight = self._flights.get(key)
+            if flight is not None and self._expired(flight, self._now()):
+                flight = None
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                self.collapsed += 1
+
+        if leader:
+            self._run(key, flight, fetch)
+        else:
+            flight.done.wait()
+
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    def _run(self, key, flight, fetch):
+        try:
+            flight.result = fetch()
+        except Exception as e:
+            flight.error = e
+        finally:
+            with self._lock:
+                flight.finished_at = self._now()
+                if self.window <= 0 and self._flights.get(key) is flight:
+                    del self._flights[key]
+                elif len(self._flights) > self.max_finished:
+                    self._sweep(flight.finished_at)
+            flight.done.set()
+
+    def _sweep(self, now):
+        for key, flight in list(self._flights.items()):
+            if self._expired(flight, now):
+                del self._flights[key]
+
+    def forget(self):
+        """Stop sharing all results. Callers already waiting still get theirs."""
+        with self._lock:
+            self._flights.clear()
+
+    @property
+    def stats(self):
+        return {'calls': self.calls, 'collapsed': self.collapsed}
+
+
+class CoalescingStorage(StorageWrapper):
+    """Adapter that shares identical concurrent note reads between threads."""
+
+    def __init__(self, storage, window=0):
+        """Instantiate with storage adapter to wrap, and seconds to keep sharing finished reads."""
+        super().__init__(storage)
+        self.flights = SingleFlight(window=window)
+        self._local = threading.local()
+
+    @property
+    def stats(self):
+        return self.flights.stats
+
+    @contextlib.contextmanager
+    def uncached(self):
+        """Context manager within which reads aren't shared with other threads."""
+        previous = getattr(self._local, 'uncached', False)
+        self._local.uncached = True
+        try:
+            with self.storage.uncached():
+                yield
+        finally:
+            self._local.uncached = previous
+
+    def _read(self, key, fetch):
+        """Return fetch() result, shared with identical reads unless they mustn't be."""
+        if getattr(self._local, 'uncached', False) or self.storage.in_transaction():
+            return fetch()
+        return self.flights.do(key, fetch)
+
+    def get_note(self, id):
+        return self._read(('note', str(id)), lambda: self.storage.get_note(id=id))
+
+    def get_note_with_role(self, id, user_id):
+        return self._read(('note_with_role', str(id), str(user_id)),
+                          lambda: self.storage.get_note_with_role(id=id, user_id=user_id))
+
+    def get_note_version_with_role(self, id, user_id):
+        return self._read(
+            ('note_version_with_role', str(id), str(user_id)),
+            lambda: self.storage.get_note_version_with_role(id=id, user_id=user_id))
+
+    def get_board_notes(self, id, after_id=None, limit=None):
+        notes = self._read(
+            ('board_notes', str(id), after_id, limit),
+            lambda: self.storage.get_board_notes(id=id, after_id=after_id, limit=limit))
+        # Each caller gets its own list, since lists are mutable
+        return list(notes)
+
+    def _write(self, method, *args, **kwargs):
+        try:
+            return method(*args, **kwargs)
+        finally:
+            self.flights.forget()
+
+    def save_note(self, *args, **kwargs):
+        return self._write(self.storage.save_note, *args, **kwargs)
+
+    def save_notes(self, *args, **kwargs):
+        return self._write(self.storage.save_notes, *args, **kwargs)
+
+    def move_notes(self, *args, **kwargs):
+        return self._write(self.storage.move_notes, *args, **kwargs)
+
+    def update_notes(self, *args, **kwargs):
+        return self._write(self.storage.update_notes, *args, **kwargs)
+
+    def delete_note(self, *args, **kwargs):
+        return self._write(self.storage.delete_note, *args, **kwargs)
+
+    def delete_notes(self, *args, **kwargs):
+        return self._write(self.storage.delete_notes, *args, **kwargs)
+
+    def delete_board_notes(self, *args, **kwargs):
+        return self._write(self.storage.delete_board_notes, *args, **kwargs)
+
+    def delete_board(self, *args, **kwargs):
+        return self._write(self.storage.delete_board, *args, **kwargs)
+
+    def purge_board(self, *args, **kwargs):
+        return self._write(self.storage.purge_board, *args, **kwargs)
+
+    # Roles are returned by get_note_with_role, so membership changes are writes too
+
+    def save_board_user(self, *args, **kwargs):
+        return self._write(self.storage.save_board_user, *args, **kwargs)
+
+    def delete_board_user(self, *args, **kwargs):
+        return self._write(self.storage.delete_board_user, *args, **kwargs)
+
+    def delete_board_users(self, *args, **kwargs):
+        return self._write(self.storage.delete_board_users, *args, **kwargs)
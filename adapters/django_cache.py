@@ -0,0 +1,52 @@
+"""Adapter for Django's cache framework.
+
+Shares the same interface as LRUCache, but stores entries in one of the backends configured in the
+CACHES setting, so they can be shared between requests (and processes, depending on the backend).
+"""
+
+from django.core.cache import caches
+
+
+class DjangoCache():
+    """Adapter to use a Django cache backend."""
+
+    def __init__(self, alias='default', prefix='', ttl=None):
+        self.alias = alias
+        self.prefix = prefix
+        self.ttl = ttl
+
+    @property
+    def _cache(self):
+        # Django cache handles are thread local, so we look them up on each use
+        return caches[self.alias]
+
+    def _key(self, key):
+        return '{}{}'.format(self.prefix, key)
+
+    def _timeout(self, ttl):
+        ttl = self.ttl if ttl is None else ttl
+        return ttl if ttl is not None else self._cache.default_timeout
+
+    def get(self, key, default=None):
+        return self._cache.get(self._key(key), default)
+
+    def get_many(self, keys):
+        keys = list(keys)
+        values = self._cache.get_many([self._key(key) for key in keys])
+        return {key: values[self._key(key)] for key in keys if self._key(key) in values}
+
+    def set(self, key, value, ttl=None):
+        self._cache.set(self._key(key), value, self._timeout(ttl))
+
+    def set_many(self, values, ttl=None):
+        self._cache.set_many(
+            {self._key(key): value for key, value in values.items()}, self._timeout(ttl))
+
+    def delete(self, key):
+        self._cache.delete(self._key(key))
+
+    def delete_many(self, keys):
+        self._cache.delete_many([self._key(key) for key in keys])
+
+    def clear(self):
+        self._cache.clear()
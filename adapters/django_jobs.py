@@ -0,0 +1,87 @@
+"""Job queue adapter that uses the Django ORM as backend.
+
+Should have same API as MemoryJobQueue. Jobs are rows in the database, so they can be queued in
+the same transaction as the writes that need them, and claimed by workers in other processes. A
+worker claims a job with a conditional UPDATE, so no two workers can claim the same one.
+"""
+
+import datetime
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils import timezone
+
+from notes import models as notes_models
+from .memory_jobs import Job, JobNotFound
+
+
+class DjangoJobQueue():
+    """Queue of jobs stored in the database, run oldest first."""
+
+    DoesNotExist = JobNotFound
+
+    def __init__(self, stale_after=300):
+        self.stale_after = stale_after
+
+    def _now(self):
+        return timezone.now()
+
+    def enqueue(self, job_type, params, created_by=None):
+        """Add job to the queue. Returns the job."""
+        django_job = notes_models.Job.objects.create(
+            type=job_type, params=json.dumps(params, cls=DjangoJSONEncoder),
+            created_by=created_by)
+        return self._to_entity(django_job)
+
+    def get(self, id):
+        try:
+            return self._to_entity(notes_models.Job.objects.get(id=id))
+        except notes_models.Job.DoesNotExist:
+            raise self.DoesNotExist('Job {} does not exist.'.format(id))
+
+    def claim(self, worker, attempts=5):
+        """Mark the oldest queued (or stale running) job as running by worker, and return it.
+
+        Returns None if there are no jobs to run. If another worker claims a job first, the next
+        one is tried, up to attempts times.
+        """
+        now = self._now()
+        stale = now - datetime.timedelta(seconds=self.stale_after)
+        claimable = Q(status='queued') | Q(status='running', updated_at__lt=stale)
+        ids = notes_models.Job.objects.filter(claimable).order_by('id').values_list(
+            'id', flat=True)[:attempts]
+
+        for id in ids:
+            claimed = notes_models.Job.objects.filter(claimable, id=id).update(
+                status='running', worker=worker, updated_at=now)
+            if claimed:
+                return self.get(id)
+        return None
+
+    def update(self, id, progress):
+        """Record a running job's progress, which also shows it is still alive."""
+        notes_models.Job.objects.filter(id=id).update(
+            progress=json.dumps(progress, cls=DjangoJSONEncoder), updated_at=self._now())
+        return self.get(id)
+
+    def finish(self, id, error=None):
+        """Mark job as done, or as failed with an error message."""
+        notes_models.Job.objects.filter(id=id).update(
+            status='failed' if error else 'done', error=error or '', updated_at=self._now())
+        return self.get(id)
+
+    @staticmethod
+    def _to_entity(django_job):
+        return Job(
+            type=django_job.type,
+            params=json.loads(django_job.params),
+            id=django_job.id,
+            created_by=django_job.created_by,
+            status=django_job.status,
+            progress=json.loads(django_job.progress),
+            error=django_job.error,
+            worker=django_job.worker,
+            created_at=django_job.created_at,
+            updated_at=django_job.updated_at
+        )
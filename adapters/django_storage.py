@@ -5,6 +5,14 @@ The MemoryStorage class shares the same interface, but doesn't depend on an actu
 be swapped out for this one when testing use cases.
 """
 
+import functools
+import operator
+
+from django.db import connection, transaction
+from django.db.models import Case, Count, F, Max, Q, When, Value
+from django.utils import timezone
+
+from . import search
 from .storage import Storage
 from accounts import models as accounts_models
 from notes import models as notes_models
@@ -13,6 +21,26 @@ from notes import models as notes_models
 class DjangoStorage(Storage):
     """Adapter to use Django ORM as a storage backend."""
 
+    # Max rows per UPDATE statement in save_notes; each row adds a few parameters per field, and
+    # SQLite limits the number of parameters in a statement.
+    update_batch_size = 40
+
+    note_fields = ('title', 'body', 'board_id', 'created_by', 'created_at', 'modified_at', 'status')
+    board_fields = ('name', 'created_at', 'modified_at', 'status')
+
+    def atomic(self):
+        return transaction.atomic()
+
+    def in_transaction(self):
+        return transaction.get_connection().in_atomic_block
+
+    def on_commit(self, callback):
+        """Call callback once the current transaction is committed, or now if there isn't one.
+
+        If the transaction is rolled back, callback is never called.
+        """
+        transaction.on_commit(callback)
+
     def create_user(self, user, password):
         """Create user entity.
 
@@ -27,14 +55,64 @@ class DjangoStorage(Storage):
     def save_board(self, board):
         """Store board entity."""
         django_board = notes_models.Board.objects.from_entity(board)
-        django_board.save()
+        self._save_versioned(django_board, self.board_fields)
         return django_board.to_entity()
 
+    def _save_versioned(self, instance, fields, unchanged=()):
+        """Insert model instance, or update it if its version matches the stored row.
+
+        Updates are usually a single `UPDATE ... WHERE id = ? AND version = ?`. On success the
+        instance is given the next version; otherwise Conflict is raised.
+
+        Fields in unchanged are expected to keep their stored values (eg a note's board), so they
+        are added to the WHERE clause. If any of them did change, a couple more queries are needed,
+        and the stored values are returned. Otherwise returns None.
+        """
+        model = type(instance)
+        if instance.id is None:
+            instance.version = 1
+            instance.save()
+            return None
+
+        instance.modified_at = timezone.now()
+        values = {field: getattr(instance, field) for field in fields}
+        current = model.objects.filter(id=instance.id, version=instance.version)
+        updated = current.filter(**{field: values[field] for field in unchanged}).update(
+            version=instance.version + 1, **values)
+        if updated:
+            instance.version += 1
+            return None
+
+        stored = model.objects.filter(id=instance.id).values('version', *unchanged).first()
+        if stored is None:
+            # Entity was given an ID that isn't stored yet
+            instance.version = 1
+            instance.save(force_insert=True)
+            return None
+        if stored['version'] != instance.version or not current.update(
+                version=instance.version + 1, **values):
+            raise self.Conflict('{} {} was changed by someone else (version {} is out of date).'
+                                .format(model.__name__, instance.id, instance.version))
+        instance.version += 1
+        return stored
+
+    def _record_changes(self, changes):
+        """Append (board_id, entity, entity_id, action) tuples to the change log."""
+        notes_models.Change.objects.bulk_create([
+            notes_models.Change(board_id=board_id, entity=entity, entity_id=entity_id,
+                                action=action)
+            for board_id, entity, entity_id, action in changes
+            # Notes that aren't on a board have nothing to sync
+            if board_id is not None
+        ])
+
     def save_board_user(self, board_id, user_id, role):
-        """Give user access to a board, or change user's role on board."""
-        board_user = notes_models.BoardUser.objects.create(
-            board_id=board_id, user_id=user_id, role=role)
-        return board_user.board.to_entity()
+        """Give user access to a board, or change user's role on board. Returns the membership."""
+        with transaction.atomic():
+            board_user = notes_models.BoardUser.objects.create(
+                board_id=board_id, user_id=user_id, role=role)
+            self._record_changes([(board_id, 'board_user', user_id, 'saved')])
+        return board_user.asdict()
 
     def get_role(self, user_id, board_id):
         """Get user's role on a board. Returns none if user is not on board."""
@@ -44,12 +122,114 @@ class DjangoStorage(Storage):
             return None
         return rel.role
 
+    def get_roles(self, user_id, board_ids):
+        """Get user's roles on many boards in one query. Maps board ID to role, or None."""
+        board_ids = set(board_ids)
+        roles = dict.fromkeys(board_ids)
+        rels = notes_models.BoardUser.objects.filter(
+            user_id=user_id, board_id__in=board_ids).values_list('board_id', 'role')
+        roles.update(rels)
+        return roles
+
     def save_note(self, note):
         """Store note entity."""
         django_note = notes_models.Note.objects.from_entity(note)
-        django_note.save()
+        with transaction.atomic():
+            moved_from = self._save_versioned(django_note, self.note_fields, ('board_id', ))
+            changes = [(django_note.board_id, 'note', django_note.id, 'saved')]
+            if moved_from is not None:
+                changes.append((moved_from['board_id'], 'note', django_note.id, 'deleted'))
+            self._record_changes(changes)
         return django_note.to_entity()
 
+    def save_notes(self, notes):
+        """Store many note entities. Returns saved entities in the order given.
+
+        New notes are inserted in bulk, and existing notes are updated with one statement per
+        batch, all in a single transaction. If any existing note's version is out of date, Conflict
+        is raised and nothing is saved.
+        """
+        now = timezone.now()
+        new = [notes_models.Note.objects.from_entity(n) for n in notes if n.id is None]
+        existing = [notes_models.Note.objects.from_entity(n) for n in notes if n.id is not None]
+
+        with transaction.atomic():
+            for django_note in new:
+                django_note.created_at = django_note.created_at or now
+                django_note.modified_at = now
+                django_note.version = 1
+            self._bulk_create_notes(new)
+
+            changes = [(n.board_id, 'note', n.id, 'saved') for n in new]
+            for django_note in existing:
+                django_note.modified_at = now
+            for i in range(0, len(existing), self.update_batch_size):
+                changes += self._bulk_update_notes(existing[i:i + self.update_batch_size])
+            self._record_changes(changes)
+
+        saved = iter(new)
+        updated = iter(existing)
+        return [next(saved if n.id is None else updated).to_entity() for n in notes]
+
+    def _bulk_create_notes(self, django_notes):
+        """Insert new notes, setting their IDs.
+
+        Backends that return IDs from a bulk insert (eg PostgreSQL) set them on the notes. SQLite
+        doesn't, but a transaction there holds the database's write lock from its first write until
+        it commits, and IDs are autoincrementing, so the rows just inserted have the highest IDs in
+        the table, in insertion order. Other backends make no such guarantee (eg MySQL, where
+        concurrent transactions can interleave IDs), so there notes are inserted one at a time.
+        """
+        if not django_notes:
+            return
+        returns_ids = connection.features.can_return_ids_from_bulk_insert
+        if not returns_ids and connection.vendor != 'sqlite':
+            for django_note in django_notes:
+                django_note.save(force_insert=True)
+            return
+        notes_models.Note.objects.bulk_create(django_notes)
+        if django_notes[0].pk is not None:
+            return
+        ids = notes_models.Note.objects.order_by('-id').values_list('id', flat=True)
+        ids = reversed(ids[:len(django_notes)])
+        for django_note, id in zip(django_notes, ids):
+            django_note.id = id
+
+    def _bulk_update_notes(self, django_notes):
+        """Update a batch of notes in one statement. Returns change log entries for the batch."""
+        if not django_notes:
+            return []
+        # Load stored versions & boards first, to find conflicts and notes moved to other boards
+        stored = {id: (version, board_id) for id, version, board_id in
+                  notes_models.Note.objects.filter(id__in=[n.id for n in django_notes])
+                  .values_list('id', 'version', 'board_id')}
+        changes = []
+        for django_note in django_notes:
+            version, board_id = stored.get(django_note.id, (None, None))
+            if version != django_note.version:
+                raise self.Conflict('Note {} was changed by someone else (version {} is out of '
+                                    'date).'.format(django_note.id, django_note.version))
+            changes.append((django_note.board_id, 'note', django_note.id, 'saved'))
+            if board_id != django_note.board_id:
+                changes.append((board_id, 'note', django_note.id, 'deleted'))
+
+        updates = {
+            field: Case(*[When(id=n.id, then=Value(getattr(n, field))) for n in django_notes],
+                        output_field=notes_models.Note._meta.get_field(field))
+            for field in self.note_fields
+        }
+        # Only rows still at the version that was loaded are updated
+        current = functools.reduce(
+            operator.or_, [Q(id=n.id, version=n.version) for n in django_notes])
+        updated = notes_models.Note.objects.filter(current).update(
+            version=F('version') + 1, **updates)
+        if updated != len(django_notes):
+            raise self.Conflict('Some notes were changed by someone else: {}'.format(
+                ', '.join(str(n.id) for n in django_notes)))
+        for django_note in django_notes:
+            django_note.version += 1
+        return changes
+
     def get_note(self, id):
         """Retrieve note entity by ID."""
         try:
@@ -59,14 +239,168 @@ class DjangoStorage(Storage):
 
         return django_note.to_entity()
 
-    def delete_note(self, id):
-        """Permanently delete note by ID."""
+    def _notes_with_role(self, user_id):
+        """Note queryset that also selects user's role on each note's board, as user_role."""
+        role_sql = ('SELECT role FROM {board_user} WHERE {board_user}.board_id = {note}.board_id '
+                    'AND {board_user}.user_id = %s LIMIT 1').format(
+                        board_user=notes_models.BoardUser._meta.db_table,
+                        note=notes_models.Note._meta.db_table)
+        return notes_models.Note.objects.extra(select={'user_role': role_sql},
+                                               select_params=[user_id])
+
+    def get_note_with_role(self, id, user_id):
+        """Retrieve note entity by ID, and user's role on its board (or None), in one query."""
         try:
-            django_note = notes_models.Note.objects.get(id=id)
+            django_note = self._notes_with_role(user_id).get(id=id)
         except notes_models.Note.DoesNotExist:
             raise self.DoesNotExist('Note {} was not found.'.format(id))
 
-        return django_note.delete()
+        return django_note.to_entity(), django_note.user_role
+
+    def get_note_version_with_role(self, id, user_id):
+        """Get version of note by ID, and user's role on its board (or None), in one query.
+
+        Cheaper than get_note_with_role, since the note's content isn't loaded.
+        """
+        try:
+            return self._notes_with_role(user_id).values_list('version', 'user_role').get(id=id)
+        except notes_models.Note.DoesNotExist:
+            raise self.DoesNotExist('Note {} was not found.'.format(id))
+
+    def get_notes(self, ids):
+        """Retrieve note entities by ID. Notes that are not found are left out of the result."""
+        django_notes = notes_models.Note.objects.filter(id__in=list(ids))
+        return [django_note.to_entity() for django_note in django_notes]
+
+    def get_note_board_ids(self, ids):
+        """Get the board ID of each note, as a dictionary mapping note ID to board ID.
+
+        Notes that are not found are left out of the result.
+        """
+        django_notes = notes_models.Note.objects.filter(id__in=list(ids))
+        return dict(django_notes.values_list('id', 'board_id'))
+
+    def move_notes(self, ids, board_id, from_board_ids=None):
+        """Move many notes to a board with one UPDATE. Returns IDs of the notes moved.
+
+        Notes that are not found, or are already on the board, are skipped. If from_board_ids is
+        given, eg the boards that permissions were checked on, so are notes on any other board.
+        """
+        with transaction.atomic():
+            moved = list(self._notes_on_boards(ids, from_board_ids).exclude(board_id=board_id)
+                         .values_list('id', 'board_id'))
+            self._update_note_boards(moved, board_id=board_id, version=F('version') + 1,
+                                     modified_at=timezone.now())
+            changes = [(from_board_id, 'note', id, 'deleted') for id, from_board_id in moved]
+            changes += [(board_id, 'note', id, 'saved') for id, _ in moved]
+            self._record_changes(changes)
+        return [id for id, _ in moved]
+
+    def update_notes(self, ids, fields, board_ids=None):
+        """Set the same field values on many notes with one UPDATE. Returns IDs of notes updated.
+
+        fields is a dictionary of note fields to set, eg {'status': 'archived'}. Notes that are not
+        found are skipped, and so are notes on boards other than board_ids, if given.
+        """
+        with transaction.atomic():
+            updated = list(self._notes_on_boards(ids, board_ids).values_list('id', 'board_id'))
+            self._update_note_boards(updated, version=F('version') + 1,
+                                     modified_at=timezone.now(), **fields)
+            self._record_changes([(board_id, 'note', id, 'saved') for id, board_id in updated])
+        return [id for id, _ in updated]
+
+    @staticmethod
+    def _notes_on_boards(ids, board_ids):
+        """Notes with the given IDs, on board_ids if given, locked until the transaction ends."""
+        django_notes = notes_models.Note.objects.filter(id__in=list(ids))
+        if board_ids is not None:
+            django_notes = django_notes.filter(board_id__in=list(board_ids))
+        return django_notes.select_for_update()
+
+    def _update_note_boards(self, note_boards, **updates):
+        """Update notes given as (id, board_id) pairs, only while they're still on those boards.
+
+        On backends that don't lock the rows that were selected (eg SQLite), a note could move in
+        between, so Conflict is raised if any note wasn't updated.
+        """
+        if not note_boards:
+            return
+        where = functools.reduce(
+            operator.or_, [Q(id=id, board_id=board_id) for id, board_id in note_boards])
+        updated = notes_models.Note.objects.filter(where).update(**updates)
+        if updated != len(note_boards):
+            raise self.Conflict('Some notes were moved by someone else.')
+
+    def delete_note(self, id):
+        """Permanently delete note by ID."""
+        django_notes = notes_models.Note.objects.filter(id=id)
+        with transaction.atomic():
+            board_ids = list(django_notes.values_list('board_id', flat=True))
+            if not board_ids:
+                raise self.DoesNotExist('Note {} was not found.'.format(id))
+            deleted = django_notes.delete()
+            self._record_changes([(board_ids[0], 'note', id, 'deleted')])
+
+        return deleted
+
+    def delete_notes(self, ids):
+        """Permanently delete many notes by ID. Returns number of notes deleted."""
+        django_notes = notes_models.Note.objects.filter(id__in=list(ids))
+        with transaction.atomic():
+            changes = [(board_id, 'note', id, 'deleted')
+                       for id, board_id in django_notes.values_list('id', 'board_id')]
+            deleted, _ = django_notes.delete()
+            self._record_changes(changes)
+        return deleted
+
+    def delete_board_notes(self, board_id):
+        """Permanently delete all notes within a board. Returns number of notes deleted."""
+        with transaction.atomic():
+            deleted, _ = notes_models.Note.objects.filter(board_id=board_id).delete()
+            # One entry for the lot, so the log doesn't grow with the size of the board
+            self._record_changes([(board_id, 'note', None, 'cleared')])
+        return deleted
+
+    def search_notes(self, user_id, query, roles, limit=20, offset=0):
+        """Find notes containing every word in query, on boards where user has one of roles.
+
+        Uses the notes_note_fts full-text index (SQLite FTS5), which is kept up to date by
+        triggers. Notes are ranked with BM25, best first, then by ID. Other backends don't have the
+        index (see migration 0006), so there notes are found with a slower, unranked scan instead.
+        """
+        match = search.fts_query(query)
+        roles = list(roles)
+        if match is None or not roles:
+            return []
+        if connection.vendor != 'sqlite':
+            return self._scan_notes(user_id, search.tokenize(query), roles, limit, offset)
+
+        sql = (
+            'SELECT {note}.* FROM notes_note_fts '
+            'JOIN {note} ON {note}.id = notes_note_fts.rowid '
+            'JOIN {board_user} ON {board_user}.board_id = {note}.board_id '
+            'WHERE notes_note_fts MATCH %s AND {board_user}.user_id = %s '
+            'AND {board_user}.role IN ({roles}) '
+            'ORDER BY bm25(notes_note_fts, %s, %s), {note}.id LIMIT %s OFFSET %s'
+        ).format(note=notes_models.Note._meta.db_table,
+                 board_user=notes_models.BoardUser._meta.db_table,
+                 roles=', '.join(['%s'] * len(roles)))
+        params = [match, user_id] + roles + [search.TITLE_WEIGHT, search.BODY_WEIGHT, limit,
+                                             offset]
+        return [note.to_entity() for note in notes_models.Note.objects.raw(sql, params)]
+
+    def _scan_notes(self, user_id, words, roles, limit, offset):
+        """Find notes with every word in their title or body, ordered by ID, without an index.
+
+        Words match anywhere, ignoring case, so they can also match within longer words.
+        """
+        board_ids = notes_models.BoardUser.objects.filter(
+            user_id=user_id, role__in=roles).values('board_id')
+        django_notes = notes_models.Note.objects.filter(board_id__in=board_ids)
+        for word in words:
+            django_notes = django_notes.filter(Q(title__icontains=word) | Q(body__icontains=word))
+        django_notes = django_notes.order_by('id')[offset:offset + limit]
+        return [note.to_entity() for note in django_notes]
 
     def get_board(self, id):
         """Get board metadata."""
@@ -77,10 +411,44 @@ class DjangoStorage(Storage):
 
         return django_note.to_entity()
 
-    def get_board_notes(self, id):
-        """Get notes within a board."""
-        django_notes = notes_models.Note.objects.filter(board_id=id).all()
-        return [note.to_entity() for note in django_notes]
+    def get_board_notes(self, id, after_id=None, limit=None):
+        """Get notes within a board, ordered by ID.
+
+        To page through a board, pass the ID of the last note on the previous page as after_id.
+        """
+        django_notes = notes_models.Note.objects.filter(board_id=id).order_by('id')
+        if after_id is not None:
+            django_notes = django_notes.filter(id__gt=after_id)
+        if limit is not None:
+            django_notes = django_notes[:limit]
+        return [note.to_entity() for note in django_notes.iterator()]
+
+    def get_user_boards(self, user_id):
+        """Get summaries of all active boards a user is on, in one query, ordered by board ID.
+
+        Each is a dictionary with the board entity, the user's role, its number of notes, and when
+        it or any of its notes was last modified.
+        """
+        rows = notes_models.BoardUser.objects.filter(user_id=user_id).exclude(
+            board__status='deleted').values(
+                'role', 'board_id', 'board__name', 'board__created_at', 'board__modified_at',
+                'board__status', 'board__version').annotate(
+                    note_count=Count('board__note'),
+                    notes_modified_at=Max('board__note__modified_at')).order_by('board_id')
+
+        summaries = []
+        for row in rows:
+            board = notes_models.Board(
+                id=row['board_id'], name=row['board__name'], created_at=row['board__created_at'],
+                modified_at=row['board__modified_at'], status=row['board__status'],
+                version=row['board__version']).to_entity()
+            summaries.append({
+                'board': board,
+                'role': row['role'],
+                'note_count': row['note_count'],
+                'last_modified': _latest(board.modified_at, row['notes_modified_at'])
+            })
+        return summaries
 
     def get_board_users(self, id):
         """Get list of users that are joined to a board."""
@@ -97,9 +465,20 @@ class DjangoStorage(Storage):
         except notes_models.BoardUser.DoesNotExist:
             raise self.DoesNotExist('User {} is not joined to board {}'.format(user_id, board_id))
 
-        django_board_user.delete()
+        with transaction.atomic():
+            django_board_user.delete()
+            self._record_changes([(board_id, 'board_user', user_id, 'deleted')])
         return django_board_user.asdict()
 
+    def delete_board_users(self, board_id):
+        """Remove all users from a board. Returns IDs of users removed."""
+        board_users = notes_models.BoardUser.objects.filter(board_id=board_id)
+        with transaction.atomic():
+            user_ids = list(board_users.values_list('user_id', flat=True))
+            board_users.delete()
+            self._record_changes([(board_id, 'board_user', None, 'cleared')])
+        return user_ids
+
     def delete_board(self, id):
         try:
             django_board = notes_models.Board.objects.get(id=id)
@@ -107,6 +486,57 @@ class DjangoStorage(Storage):
             raise self.DoesNotExist('Board {} does not exist.'.format(id))
 
         django_board.status = 'deleted'
+        django_board.version += 1
         django_board.save()
 
         return django_board.to_entity()
+
+    def purge_board(self, board_id, limit):
+        """Permanently remove up to limit of a deleted board's users, notes & change log entries.
+
+        Users are removed first, then notes, then changes, so that access is revoked first. Nothing
+        is recorded in the change log, since nobody can sync a deleted board. Returns dictionary
+        with IDs of users & notes removed, and number of changes removed; if they add up to less
+        than limit, the board is empty.
+        """
+        with transaction.atomic():
+            board_users = notes_models.BoardUser.objects.filter(board_id=board_id)
+            user_ids = list(board_users.values_list('user_id', flat=True)[:limit])
+            if user_ids:
+                board_users.filter(user_id__in=user_ids).delete()
+            limit -= len(user_ids)
+
+            note_ids = []
+            if limit > 0:
+                notes = notes_models.Note.objects.filter(board_id=board_id)
+                note_ids = list(notes.values_list('id', flat=True)[:limit])
+                if note_ids:
+                    notes_models.Note.objects.filter(id__in=note_ids).delete()
+                limit -= len(note_ids)
+
+            changes = 0
+            if limit > 0:
+                change_ids = list(notes_models.Change.objects.filter(
+                    board_id=board_id).values_list('id', flat=True)[:limit])
+                if change_ids:
+                    changes, _ = notes_models.Change.objects.filter(id__in=change_ids).delete()
+
+        return {'user_ids': user_ids, 'note_ids': note_ids, 'changes': changes}
+
+    def get_board_changes(self, board_id, after_seq=0, limit=None):
+        """Get changes to a board made after change after_seq, in order."""
+        changes = notes_models.Change.objects.filter(
+            board_id=board_id, id__gt=after_seq).order_by('id')
+        if limit is not None:
+            changes = changes[:limit]
+        return [change.to_entity() for change in changes]
+
+    def get_last_change_seq(self, board_id):
+        """Get seq of latest change to a board, or 0 if it has none."""
+        seqs = notes_models.Change.objects.filter(board_id=board_id).order_by('-id')
+        return seqs.values_list('id', flat=True).first() or 0
+
+
+def _latest(*dates):
+    """Latest of the dates given, ignoring any that are None."""
+    return max((date for date in dates if date is not None), default=None)
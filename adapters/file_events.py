@@ -0,0 +1,94 @@
+"""Event log adapter that shares events between processes on one host through a local file.
+
+Should have same API as MemoryEventLog. Events are appended to the file as JSON lines, and each
+process keeps the most recent ones in memory, reading any lines appended by other processes before
+each read. Waiting clients poll the file's size, so they hold no database connection or open file.
+
+Appends are serialized with an exclusive lock on a separate lock file. Once the file holds twice
+max_events lines, it is compacted to the most recent max_events by replacing it.
+"""
+
+import contextlib
+import fcntl
+import json
+import os
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .memory_events import Event, MemoryEventLog
+
+
+class FileEventLog(MemoryEventLog):
+    """Bounded, append-only log of board events, shared through a file."""
+
+    def __init__(self, path, max_events=10000, poll_interval=0.5):
+        super().__init__(max_events)
+        self.path = path
+        self.poll_interval = poll_interval
+        # Which file, and how much of it, has been read into memory
+        self._inode = None
+        self._position = 0
+        self._lines = 0
+
+    def append(self, board_id, event_type, data):
+        with self._condition, self._lock():
+            self._refresh()
+            event = Event(offset=self.last_offset + 1, board_id=board_id, type=event_type,
+                          data=data)
+            with open(self.path, 'a', encoding='utf8') as f:
+                f.write(self._encode(event))
+            # Load the event back, so data is the same as other processes will see
+            self._refresh()
+            event = self._events[-1]
+            if self._lines >= 2 * self.max_events:
+                self._compact()
+        return event
+
+    @contextlib.contextmanager
+    def _lock(self):
+        with open(self.path + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _encode(event):
+        return json.dumps(event.asdict(), cls=DjangoJSONEncoder) + '\n'
+
+    def _refresh(self):
+        """Read any events appended to the file since it was last read."""
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            stat = os.fstat(f.fileno())
+            if stat.st_ino != self._inode or stat.st_size < self._position:
+                # File was compacted by another process, so read it again from the start
+                self._inode, self._position, self._lines = stat.st_ino, 0, 0
+            if stat.st_size == self._position:
+                return
+            f.seek(self._position)
+            chunk = f.read()
+
+        # Leave any line that is still being written for next time
+        end = chunk.rfind(b'\n') + 1
+        for line in chunk[:end].splitlines():
+            self._lines += 1
+            event = Event(**json.loads(line.decode('utf8')))
+            if event.offset > self.last_offset:
+                self._add(event)
+        self._position += end
+
+    def _compact(self):
+        """Replace the file with one holding only the events kept in memory. Call with lock held."""
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf8') as f:
+            for event in self._events:
+                f.write(self._encode(event))
+        os.replace(temp_path, self.path)
+
+        stat = os.stat(self.path)
+        self._inode, self._position, self._lines = stat.st_ino, stat.st_size, len(self._events)
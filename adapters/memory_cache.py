@@ -0,0 +1,76 @@
+"""Cache adapter that uses system memory as backend.
+
+Should have same API as the Django cache adapter, so either can be plugged in wherever a cache is
+accepted.
+"""
+
+import time
+from collections import OrderedDict
+
+
+class LRUCache():
+    """Size-bounded, least recently used cache with optional expiry time for entries."""
+
+    def __init__(self, max_size=1024, ttl=None):
+        if max_size < 1:
+            raise ValueError('Cache max_size must be at least 1.')
+        self.max_size = max_size
+        self.ttl = ttl
+        self.evictions = 0
+        self._entries = OrderedDict()
+
+    def _now(self):
+        return time.monotonic()
+
+    def get(self, key, default=None):
+        """Return cached value, or default if key is missing or expired."""
+        try:
+            value, expires_at = self._entries[key]
+        except KeyError:
+            return default
+
+        if expires_at is not None and expires_at <= self._now():
+            del self._entries[key]
+            return default
+
+        self._entries.move_to_end(key)
+        return value
+
+    def get_many(self, keys):
+        """Return dictionary of all keys that are present in the cache."""
+        missing = object()
+        values = {}
+        for key in keys:
+            value = self.get(key, missing)
+            if value is not missing:
+                values[key] = value
+        return values
+
+    def set(self, key, value, ttl=None):
+        """Store value, evicting least recently used entries if cache is full."""
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = None if ttl is None else self._now() + ttl
+
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def set_many(self, values, ttl=None):
+        for key, value in values.items():
+            self.set(key, value, ttl)
+
+    def delete(self, key):
+        self._entries.pop(key, None)
+
+    def delete_many(self, keys):
+        for key in keys:
+            self.delete(key)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,113 @@
+"""Event log adapter that uses system memory as backend.
+
+The event log is an append-only feed of what happens on each board, which clients can follow from
+any offset they have seen. Only the most recent events are kept, so a client that falls too far
+behind gets an Expired error, and should resync the board (see NoteUseCases.sync_board) before
+following the feed again.
+
+Waiting for events only involves a thread lock, so waiting clients hold no other resources. Every
+process has its own MemoryEventLog; see FileEventLog for one shared between processes.
+"""
+
+import collections
+import itertools
+import math
+import threading
+import time
+
+import attr
+
+from topsy.entities import Entity
+
+
+class Expired(Exception):
+    """Exception to be raised when events after the requested offset are no longer retained."""
+    pass
+
+
+@attr.s(frozen=True)
+class Event(Entity):
+    """Something that happened on a board. Offsets increase by one with each event in the log."""
+
+    offset = attr.ib()
+    board_id = attr.ib()
+    type = attr.ib()
+    data = attr.ib()
+
+
+class MemoryEventLog():
+    """Bounded, append-only log of board events."""
+
+    Expired = Expired
+
+    # Seconds between checks for events appended elsewhere while waiting, or None if they can only
+    # be appended from this process
+    poll_interval = None
+
+    def __init__(self, max_events=10000):
+        self.max_events = max_events
+        self.last_offset = 0
+        self._events = collections.deque(maxlen=max_events)
+        self._condition = threading.Condition()
+
+    def _now(self):
+        return time.monotonic()
+
+    def append(self, board_id, event_type, data):
+        """Add event to the log, waking anyone waiting for it. Returns the event."""
+        with self._condition:
+            event = self._add(Event(offset=self.last_offset + 1, board_id=board_id,
+                                    type=event_type, data=data))
+        return event
+
+    def _add(self, event):
+        self._events.append(event)
+        self.last_offset = event.offset
+        self._condition.notify_all()
+        return event
+
+    def _refresh(self):
+        """Load events appended elsewhere. Nothing to do when everything is in this process."""
+        pass
+
+    def read(self, board_id, after=0, limit=100):
+        """Get up to limit events for board with offsets greater than after, oldest first.
+
+        Raises Expired if events after that offset have been discarded, or the offset is from
+        another log (eg before a restart).
+        """
+        with self._condition:
+            self._refresh()
+            return self._read(board_id, after, limit)
+
+    def _read(self, board_id, after, limit):
+        if after > self.last_offset or (self._events and after < self._events[0].offset - 1):
+            raise self.Expired('Events after offset {} are no longer available.'.format(after))
+        if not self._events:
+            return []
+
+        # Offsets are contiguous, so we can skip straight to the first event after the offset
+        start = max(after - self._events[0].offset + 1, 0)
+        events = (event for event in itertools.islice(self._events, start, None)
+                  if event.board_id == board_id)
+        return list(itertools.islice(events, limit))
+
+    def wait(self, board_id, after=0, limit=100, timeout=30):
+        """Like read, but if there are no events yet, wait until some arrive or timeout passes.
+
+        A timeout that isn't a finite number of seconds (eg nan) is treated as 0, since the
+        deadline would never pass.
+        """
+        if not math.isfinite(timeout):
+            timeout = 0
+        deadline = self._now() + timeout
+        with self._condition:
+            while True:
+                self._refresh()
+                events = self._read(board_id, after, limit)
+                remaining = deadline - self._now()
+                if events or remaining <= 0:
+                    return events
+                if self.poll_interval is not None:
+                    remaining = min(remaining, self.poll_interval)
+                self._condition.wait(remaining)
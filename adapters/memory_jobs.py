@@ -0,0 +1,102 @@
+"""Job queue adapter that uses system memory as backend.
+
+Jobs are slow pieces of work, like purging a deleted board's notes, which are queued by a request
+and run later by a worker (see topsy.jobs.JobWorker), so the request can return straight away.
+Clients poll a job to follow its progress. Should have same API as DjangoJobQueue, which shares
+jobs between processes through the database.
+
+A job left running by a worker that died is claimed again once it hasn't been updated for
+stale_after seconds, so handlers must be safe to run again.
+"""
+
+import datetime
+import itertools
+import threading
+
+import attr
+from django.utils import timezone
+
+from topsy.entities import Entity
+
+
+class JobNotFound(Exception):
+    """Exception to be raised when a job does not exist."""
+    pass
+
+
+@attr.s(frozen=True)
+class Job(Entity):
+    """Queued piece of work. status is 'queued', 'running', 'done' or 'failed'.
+
+    params are what the handler for its type is called with, and progress is whatever the handler
+    last reported, eg counts of what it has done so far. Both are dictionaries.
+    """
+
+    type = attr.ib()
+    params = attr.ib()
+    id = attr.ib(default=None)
+    created_by = attr.ib(default=None)
+    status = attr.ib(default='queued')
+    progress = attr.ib(default=attr.Factory(dict))
+    error = attr.ib(default='')
+    worker = attr.ib(default='')
+    created_at = attr.ib(default=None)
+    updated_at = attr.ib(default=None)
+
+
+class MemoryJobQueue():
+    """Queue of jobs, run oldest first."""
+
+    DoesNotExist = JobNotFound
+
+    def __init__(self, stale_after=300):
+        self.stale_after = stale_after
+        self.jobs = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _now(self):
+        return timezone.now()
+
+    def enqueue(self, job_type, params, created_by=None):
+        """Add job to the queue. Returns the job."""
+        now = self._now()
+        with self._lock:
+            job = Job(type=job_type, params=params, id=next(self._ids), created_by=created_by,
+                      created_at=now, updated_at=now)
+            self.jobs[job.id] = job
+        return job
+
+    def get(self, id):
+        try:
+            return self.jobs[id]
+        except KeyError:
+            raise self.DoesNotExist('Job {} does not exist.'.format(id))
+
+    def claim(self, worker):
+        """Mark the oldest queued (or stale running) job as running by worker, and return it.
+
+        Returns None if there are no jobs to run.
+        """
+        now = self._now()
+        stale = now - datetime.timedelta(seconds=self.stale_after)
+        with self._lock:
+            for job in self.jobs.values():
+                if job.status == 'queued' or (job.status == 'running' and job.updated_at < stale):
+                    return self._set(job.replace(status='running', worker=worker, updated_at=now))
+        return None
+
+    def update(self, id, progress):
+        """Record a running job's progress, which also shows it is still alive."""
+        with self._lock:
+            return self._set(self.get(id).replace(progress=progress, updated_at=self._now()))
+
+    def finish(self, id, error=None):
+        """Mark job as done, or as failed with an error message."""
+        with self._lock:
+            return self._set(self.get(id).replace(
+                status='failed' if error else 'done', error=error or '', updated_at=self._now()))
+
+    def _set(self, job):
+        self.jobs[job.id] = job
+        return job
@@ -1,9 +1,50 @@
 """Storage adapter that uses system memory as backend.
 
 Should have same API as database adapter.
+
+Besides the primary stores for each entity type, we keep secondary indexes for the lookups that
+use cases perform most often (role by board & user, users by board, notes by board, notes by word),
+so that they don't require a scan of every stored record. Any method that writes to a primary
+store is also responsible for keeping the indexes consistent.
 """
 
+import bisect
+import heapq
+import itertools
+
+from . import search
 from .storage import Storage
+from notes import entities as notes_entities
+
+
+class IdSequence():
+    """Monotonic ID allocator for a single entity type.
+
+    IDs are never handed out twice, even if the entity with the highest ID is deleted. Entities
+    saved with an explicit ID advance the sequence past that ID.
+    """
+
+    def __init__(self):
+        self.last_id = 0
+
+    def next(self):
+        """Allocate a single ID."""
+        self.last_id += 1
+        return self.last_id
+
+    def reserve(self, count):
+        """Allocate a contiguous range of IDs."""
+        if count < 0:
+            raise ValueError('Cannot reserve a negative number of IDs.')
+        start = self.last_id + 1
+        self.last_id += count
+        return range(start, self.last_id + 1)
+
+    def observe(self, id):
+        """Make sure an explicitly assigned ID will not be allocated later."""
+        if id > self.last_id:
+            self.last_id = id
+
 
 class MemoryStorage(Storage):
     """Adapter to use system memory as a storage backend."""
@@ -13,18 +54,55 @@ class MemoryStorage(Storage):
         self.notes = {}
         self.boards = {}
         self.users = {}
-        self.board_users = []
+        self.sequences = {'user': IdSequence(), 'note': IdSequence(), 'board': IdSequence()}
+
+        # Board user records, keyed by (board_id, user_id)
+        self._board_users = {}
+        # Indexes: board_id -> {user_id: None}, user_id -> {board_id: None} & board_id ->
+        # {note_id: None}. Dicts are used as insertion ordered sets.
+        self._board_user_index = {}
+        self._user_board_index = {}
+        self._board_note_index = {}
+        # Latest modified_at of each board's notes, dropped when the latest note leaves the board &
+        # recomputed when next needed
+        self._board_note_modified = {}
+
+        # Change log, where each change's seq is its position + 1, and index: board_id -> [seq]
+        self.changes = []
+        self._board_change_index = {}
+
+        # Full-text index: word -> {note_id: (count in title, count in body)}, plus number of words
+        # in each note's title & body, and in all notes, for ranking
+        self._word_index = {}
+        self._note_lengths = {}
+        self._total_length = 0
+
+    @property
+    def board_users(self):
+        """List of all board user records (for inspection; not used for lookups)."""
+        return list(self._board_users.values())
 
     def create_user(self, user, password):
         """Create user entity."""
         if user.id is None:
-            existing_ids = self.users.keys()
-            new_id = 1 if len(existing_ids) == 0 else max(existing_ids) + 1
-            user = user.replace(id=new_id)
+            user = user.replace(id=self.sequences['user'].next())
+        else:
+            self.sequences['user'].observe(user.id)
 
         self.users[user.id] = user
         return user
 
+    def reserve_ids(self, entity_type, count):
+        """Reserve a contiguous range of IDs for a batch of new entities.
+
+        The returned range can be assigned to entities before saving them, e.g. by a bulk loader.
+        """
+        try:
+            sequence = self.sequences[entity_type]
+        except KeyError:
+            raise ValueError('Unknown entity type: {}'.format(entity_type))
+        return sequence.reserve(count)
+
     def get_user(self, id):
         try:
             return self.users[id]
@@ -34,13 +112,47 @@ class MemoryStorage(Storage):
     def save_note(self, note):
         """Store note entity."""
         if note.id is None:
-            existing_ids = self.notes.keys()
-            new_id = 1 if len(existing_ids) == 0 else max(existing_ids) + 1
-            note = note.replace(id=new_id)
+            note = note.replace(id=self.sequences['note'].next())
+        else:
+            self.sequences['note'].observe(note.id)
+
+        previous = self.notes.get(note.id)
+        note = self._next_version(note, previous)
+        if previous is not None:
+            if previous.board_id != note.board_id:
+                self._unindex_note(previous)
+                self._record_change(previous.board_id, 'note', note.id, 'deleted')
+            else:
+                self._unindex_modified(previous)
+            self._unindex_words(previous)
 
         self.notes[note.id] = note
+        self._index_note(note)
+        self._index_words(note)
+        self._record_change(note.board_id, 'note', note.id, 'saved')
         return note
 
+    def _next_version(self, entity, previous):
+        """Return entity with its next version, raising Conflict if it is out of date."""
+        if previous is None:
+            return entity.replace(version=1)
+        if previous.version != entity.version:
+            raise self.Conflict('{} {} was changed by someone else (version {} is out of date).'
+                                .format(type(entity).__name__, entity.id, entity.version))
+        return entity.replace(version=entity.version + 1)
+
+    def save_notes(self, notes):
+        """Store many note entities. Nothing is saved if any note's version is out of date.
+
+        New notes are given IDs from a single range reserved for the batch.
+        """
+        for note in notes:
+            # Raises Conflict before anything is saved
+            self._next_version(note, self.notes.get(note.id))
+        ids = iter(self.reserve_ids('note', sum(1 for note in notes if note.id is None)))
+        return [self.save_note(note if note.id is not None else note.replace(id=next(ids)))
+                for note in notes]
+
     def get_note(self, id):
         """Retrieve note entity by ID."""
         try:
@@ -48,30 +160,146 @@ class MemoryStorage(Storage):
         except KeyError:
             raise self.DoesNotExist('Note {} was not found'.format(id))
 
+    def get_note_with_role(self, id, user_id):
+        """Retrieve note entity by ID, and user's role on its board (or None)."""
+        note = self.get_note(id)
+        return note, self.get_role(user_id, note.board_id)
+
+    def get_note_version_with_role(self, id, user_id):
+        """Get version of note by ID, and user's role on its board (or None)."""
+        note, role = self.get_note_with_role(id, user_id)
+        return note.version, role
+
+    def get_notes(self, ids):
+        """Retrieve note entities by ID. Notes that are not found are left out of the result."""
+        return [self.notes[id] for id in ids if id in self.notes]
+
+    def get_note_board_ids(self, ids):
+        """Get the board ID of each note, as a dictionary mapping note ID to board ID."""
+        return {id: self.notes[id].board_id for id in ids if id in self.notes}
+
+    def move_notes(self, ids, board_id, from_board_ids=None):
+        """Move many notes to a board, if they're on from_board_ids. Returns IDs of notes moved."""
+        return [self.save_note(note.replace(board_id=board_id)).id
+                for note in self._notes_on_boards(ids, from_board_ids)
+                if note.board_id != board_id]
+
+    def update_notes(self, ids, fields, board_ids=None):
+        """Set the same field values on many notes, if they're on board_ids. Returns IDs updated."""
+        return [self.save_note(note.replace(**fields)).id
+                for note in self._notes_on_boards(ids, board_ids)]
+
+    def _notes_on_boards(self, ids, board_ids):
+        notes = [self.notes[id] for id in ids if id in self.notes]
+        if board_ids is None:
+            return notes
+        return [note for note in notes if note.board_id in board_ids]
+
     def delete_note(self, id):
         try:
-            del self.notes[id]
+            note = self.notes.pop(id)
         except KeyError:
             raise self.DoesNotExist('Note {} was not found'.format(id))
 
+        self._unindex_note(note)
+        self._unindex_words(note)
+        self._record_change(note.board_id, 'note', note.id, 'deleted')
         return True
 
+    def delete_notes(self, ids):
+        deleted = 0
+        for id in ids:
+            note = self.notes.pop(id, None)
+            if note is not None:
+                self._unindex_note(note)
+                self._unindex_words(note)
+                self._record_change(note.board_id, 'note', note.id, 'deleted')
+                deleted += 1
+        return deleted
+
+    def delete_board_notes(self, board_id):
+        note_ids = self._board_note_index.pop(board_id, {})
+        self._board_note_modified.pop(board_id, None)
+        for note_id in note_ids:
+            self._unindex_words(self.notes.pop(note_id))
+        self._record_change(board_id, 'note', None, 'cleared')
+        return len(note_ids)
+
+    def _index_note(self, note):
+        """Add note to the board index. Use _index_words to add it to the word index."""
+        self._board_note_index.setdefault(note.board_id, {})[note.id] = None
+        if note.board_id in self._board_note_modified and note.modified_at is not None:
+            latest = self._board_note_modified[note.board_id]
+            if latest is None or note.modified_at > latest:
+                self._board_note_modified[note.board_id] = note.modified_at
+
+    def _unindex_note(self, note):
+        """Remove note from the board index. Use _unindex_words to remove it from the word index."""
+        note_ids = self._board_note_index.get(note.board_id)
+        if note_ids is None:
+            return
+        note_ids.pop(note.id, None)
+        if not note_ids:
+            del self._board_note_index[note.board_id]
+        self._unindex_modified(note)
+
+    def _unindex_modified(self, note):
+        """Forget the board's latest modified_at if it was this note's."""
+        if note.modified_at is not None and (
+                self._board_note_modified.get(note.board_id) == note.modified_at):
+            del self._board_note_modified[note.board_id]
+
+    def _last_note_modified(self, board_id):
+        """Latest modified_at of a board's notes, or None."""
+        if board_id not in self._board_note_modified:
+            dates = (self.notes[note_id].modified_at
+                     for note_id in self._board_note_index.get(board_id, ()))
+            self._board_note_modified[board_id] = max(
+                (date for date in dates if date is not None), default=None)
+        return self._board_note_modified[board_id]
+
+    def _index_words(self, note):
+        title, body = search.tokenize(note.title), search.tokenize(note.body)
+        counts = {}
+        for word in title:
+            counts[word] = (counts.get(word, (0, 0))[0] + 1, 0)
+        for word in body:
+            title_count, body_count = counts.get(word, (0, 0))
+            counts[word] = (title_count, body_count + 1)
+
+        for word, count in counts.items():
+            self._word_index.setdefault(word, {})[note.id] = count
+        self._note_lengths[note.id] = len(title) + len(body)
+        self._total_length += len(title) + len(body)
+
+    def _unindex_words(self, note):
+        words = set(search.tokenize(note.title)) | set(search.tokenize(note.body))
+        for word in words:
+            note_ids = self._word_index[word]
+            del note_ids[note.id]
+            if not note_ids:
+                del self._word_index[word]
+        self._total_length -= self._note_lengths.pop(note.id)
+
     def save_board(self, board):
         """Store board entity."""
         if board.id is None:
-            existing_ids = self.boards.keys()
-            new_id = 1 if len(existing_ids) == 0 else max(existing_ids) + 1
-            board = board.replace(id=new_id)
+            board = board.replace(id=self.sequences['board'].next())
+        else:
+            self.sequences['board'].observe(board.id)
 
+        board = self._next_version(board, self.boards.get(board.id))
         self.boards[board.id] = board
         return board
 
     def save_board_user(self, board_id, user_id, role):
         """Give user access to a board, or change user's role on board."""
-        for board_user in self.board_users:
-            if board_user['board_id'] == board_id and board_user['user_id'] == user_id:
-                board_user['role'] = role
-                return board_user
+        key = (board_id, user_id)
+        board_user = self._board_users.get(key)
+        self._record_change(board_id, 'board_user', user_id, 'saved')
+        if board_user is not None:
+            board_user['role'] = role
+            return board_user
 
         record = {
             'board_id': board_id,
@@ -79,17 +307,42 @@ class MemoryStorage(Storage):
             'role': role
         }
 
-        self.board_users.append(record)
+        self._board_users[key] = record
+        self._board_user_index.setdefault(board_id, {})[user_id] = None
+        self._user_board_index.setdefault(user_id, {})[board_id] = None
 
         return record
 
     def delete_board_user(self, board_id, user_id):
-        for key, board_user in enumerate(self.board_users):
-            if board_user['board_id'] == board_id and board_user['user_id'] == user_id:
-                bu = self.board_users.pop(key)
-                return bu
+        if (board_id, user_id) not in self._board_users:
+            raise ValueError('User {} not joined to board {}.'.format(board_id, user_id))
+
+        bu = self._remove_board_user(board_id, user_id)
+        self._record_change(board_id, 'board_user', user_id, 'deleted')
+        return bu
+
+    def _remove_board_user(self, board_id, user_id):
+        bu = self._board_users.pop((board_id, user_id))
+        user_ids = self._board_user_index[board_id]
+        del user_ids[user_id]
+        if not user_ids:
+            del self._board_user_index[board_id]
+        self._unindex_user_board(user_id, board_id)
+        return bu
 
-        raise ValueError('User {} not joined to board {}.'.format(board_id, user_id))
+    def delete_board_users(self, board_id):
+        user_ids = list(self._board_user_index.pop(board_id, {}))
+        for user_id in user_ids:
+            del self._board_users[(board_id, user_id)]
+            self._unindex_user_board(user_id, board_id)
+        self._record_change(board_id, 'board_user', None, 'cleared')
+        return user_ids
+
+    def _unindex_user_board(self, user_id, board_id):
+        board_ids = self._user_board_index[user_id]
+        del board_ids[board_id]
+        if not board_ids:
+            del self._user_board_index[user_id]
 
     def get_board(self, id):
         """Retrieve board entity by ID."""
@@ -104,30 +357,137 @@ class MemoryStorage(Storage):
     def get_board_users(self, id):
         """Return list of users who have access to board."""
         users = []
-        user_roles = [(bu['user_id'], bu['role'])
-                      for bu in self.board_users if bu['board_id'] == id]
-
-        for role in user_roles:
-            for u in self.users.values():
-                if u.id == role[0]:
-                    users.append({
-                        'id': u.id,
-                        'name': u.name,
-                        'email': u.email,
-                        'role': role[1]
-                    })
+
+        for user_id in self._board_user_index.get(id, ()):
+            u = self.users.get(user_id)
+            if u is None:
+                continue
+            users.append({
+                'id': u.id,
+                'name': u.name,
+                'email': u.email,
+                'role': self._board_users[(id, user_id)]['role']
+            })
 
         return users
 
+    def get_user_boards(self, user_id):
+        """Get summaries of all active boards a user is on, ordered by board ID.
+
+        Each is a dictionary with the board entity, the user's role, its number of notes, and when
+        it or any of its notes was last modified.
+        """
+        summaries = []
+        for board_id in sorted(self._user_board_index.get(user_id, ())):
+            board = self.boards.get(board_id)
+            if board is None or board.status == 'deleted':
+                continue
+            dates = [self._last_note_modified(board_id), board.modified_at]
+            summaries.append({
+                'board': board,
+                'role': self._board_users[(board_id, user_id)]['role'],
+                'note_count': len(self._board_note_index.get(board_id, ())),
+                'last_modified': max((date for date in dates if date is not None), default=None)
+            })
+        return summaries
+
     def get_role(self, user_id, board_id):
-        for bu in self.board_users:
-            if bu['board_id'] == board_id and bu['user_id'] == user_id:
-                return bu['role']
+        board_user = self._board_users.get((board_id, user_id))
+        if board_user is None:
+            return None
+
+        return board_user['role']
+
+    def get_roles(self, user_id, board_ids):
+        return {board_id: self.get_role(user_id, board_id) for board_id in board_ids}
+
+    def get_board_notes(self, id, after_id=None, limit=None):
+        """Get notes within a board, ordered by ID."""
+        note_ids = self._board_note_index.get(id, ())
+        if after_id is not None:
+            note_ids = (note_id for note_id in note_ids if note_id > after_id)
+        if limit is None:
+            note_ids = sorted(note_ids)
+        else:
+            note_ids = heapq.nsmallest(limit, note_ids)
+        return [self.notes[note_id] for note_id in note_ids]
+
+    def search_notes(self, user_id, query, roles, limit=20, offset=0):
+        """Find notes containing every word in query, on boards where user has one of roles.
+
+        Notes are ranked with BM25, best first, then by ID.
+        """
+        words = set(search.tokenize(query))
+        if not words:
+            return []
+
+        # Start from the rarest word, so we check as few notes as possible
+        postings = sorted((self._word_index.get(word, {}) for word in words), key=len)
+        note_ids = [id for id in postings[0] if all(id in other for other in postings[1:])]
 
-        return None
+        total = len(self._note_lengths)
+        average_length = self._total_length / total if total else 0
+        idfs = [search.bm25_idf(total, len(note_counts)) for note_counts in postings]
+        roles = set(roles)
+        ranked = []
+        for id in note_ids:
+            if self.get_role(user_id, self.notes[id].board_id) not in roles:
+                continue
+            score = 0.0
+            for idf, note_counts in zip(idfs, postings):
+                title_count, body_count = note_counts[id]
+                frequency = search.TITLE_WEIGHT * title_count + search.BODY_WEIGHT * body_count
+                score += idf * search.bm25_term(frequency, self._note_lengths[id], average_length)
+            ranked.append((-score, id))
 
-    def get_board_notes(self, id):
-        return [note for note in self.notes.values() if note.board_id == id]
+        ranked = heapq.nsmallest(offset + limit, ranked)[offset:]
+        return [self.notes[id] for score, id in ranked]
 
     def delete_board(self, id):
         return self.boards.pop(id)
+
+    def purge_board(self, board_id, limit):
+        """Permanently remove up to limit of a deleted board's users, notes & change log entries.
+
+        Returns dictionary with IDs of users & notes removed, and number of changes removed.
+        """
+        user_ids = list(itertools.islice(self._board_user_index.get(board_id, ()), limit))
+        for user_id in user_ids:
+            self._remove_board_user(board_id, user_id)
+        limit -= len(user_ids)
+
+        note_ids = list(itertools.islice(self._board_note_index.get(board_id, ()), limit))
+        for note_id in note_ids:
+            note = self.notes.pop(note_id)
+            self._unindex_note(note)
+            self._unindex_words(note)
+        limit -= len(note_ids)
+
+        # Entries stay in the log, so that seqs still match positions, but are unindexed
+        seqs = self._board_change_index.get(board_id, [])
+        changes = len(seqs[:limit])
+        del seqs[:limit]
+        if not seqs:
+            self._board_change_index.pop(board_id, None)
+        return {'user_ids': user_ids, 'note_ids': note_ids, 'changes': changes}
+
+    def _record_change(self, board_id, entity, entity_id, action):
+        """Append change to the log. Notes that aren't on a board have nothing to sync."""
+        if board_id is None:
+            return
+        change = notes_entities.Change(board_id=board_id, entity=entity, entity_id=entity_id,
+                                       action=action, seq=len(self.changes) + 1)
+        self.changes.append(change)
+        self._board_change_index.setdefault(board_id, []).append(change.seq)
+
+    def get_board_changes(self, board_id, after_seq=0, limit=None):
+        """Get changes to a board made after change after_seq, in order."""
+        seqs = self._board_change_index.get(board_id, [])
+        start = bisect.bisect_right(seqs, after_seq)
+        end = None if limit is None else start + limit
+        return [self.changes[seq - 1] for seq in seqs[start:end]]
+
+    def get_last_change_seq(self, board_id):
+        """Get seq of latest change to a board, or 0 if it has none."""
+        seqs = self._board_change_index.get(board_id)
+        return seqs[-1] if seqs else 0
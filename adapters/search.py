@@ -0,0 +1,52 @@
+"""Shared helpers for full-text search of notes in storage adapters.
+
+Text is split into lowercase words, close to what SQLite's default FTS5 tokenizer does, so the
+memory and database adapters match the same notes. Every word in a query must match. Results are
+ranked with BM25, with matches in the title weighted above matches in the body.
+"""
+
+import math
+import re
+
+TITLE_WEIGHT = 10.0
+BODY_WEIGHT = 1.0
+
+# BM25 parameters, as used by SQLite's bm25() function
+K1 = 1.2
+B = 0.75
+
+_word = re.compile(r'\w+')
+
+
+def tokenize(text):
+    """Split text into lowercase words."""
+    return _word.findall((text or '').lower())
+
+
+def fts_query(query):
+    """Convert user input into an FTS5 query that requires every word, or None if it has none.
+
+    Each word is quoted, so that punctuation & keywords like OR are never treated as syntax.
+    """
+    words = tokenize(query)
+    if not words:
+        return None
+    return ' '.join('"{}"'.format(word) for word in words)
+
+
+def bm25_idf(total, matching):
+    """Inverse document frequency of a term found in matching of total documents."""
+    # Like SQLite, keep very common terms from scoring below zero
+    return max(math.log((total - matching + 0.5) / (matching + 0.5)), 1e-6)
+
+
+def bm25_term(frequency, length, average_length):
+    """Score of a term in a note, before multiplying by its IDF, like SQLite's bm25().
+
+    frequency is the number of times the term appears in each field, multiplied by the field's
+    weight & summed, and length is the total number of words in the note.
+    """
+    if not frequency:
+        return 0.0
+    norm = K1 * (1 - B + B * length / (average_length or 1))
+    return frequency * (K1 + 1) / (frequency + norm)
@@ -1,14 +1,48 @@
 """Contains shared classes for storage adapters, including abstract base class."""
 
 import abc
+import contextlib
 
 class DoesNotExist(Exception):
     """Exception to be raised when an entity is not found in storage."""
     pass
 
+class Conflict(Exception):
+    """Exception to be raised when saving an entity that has changed since it was loaded."""
+    pass
+
 class Storage(abc.ABC):
-    """Base class for storage adapters."""
+    """Base class for storage adapters.
+
+    Notes & boards are versioned: saving an existing entity only succeeds if its version matches
+    the stored one (otherwise Conflict is raised), and the saved entity has the next version.
+
+    Every write to a board's notes or users is also appended to that board's change log, in the
+    same transaction (see notes.entities.Change).
+    """
     DoesNotExist = DoesNotExist
+    Conflict = Conflict
+
+    @contextlib.contextmanager
+    def atomic(self):
+        """Context manager grouping storage calls into one transaction, if backend supports it."""
+        yield
+
+    def on_commit(self, callback):
+        """Call callback once the writes made so far are stored. Unless they are buffered, now."""
+        callback()
+
+    def in_transaction(self):
+        """Whether the current thread is in a transaction, whose writes others can't see yet."""
+        return False
+
+    @contextlib.contextmanager
+    def uncached(self):
+        """Context manager for reads that must see the latest stored data, eg to base a write on.
+
+        Only adapters that cache reads need to do anything.
+        """
+        yield
 
     @abc.abstractmethod
     def create_user(self, *args, **kwargs):
@@ -26,18 +60,62 @@ class Storage(abc.ABC):
     def get_role(self, *args, **kwargs):
         pass
 
+    @abc.abstractmethod
+    def get_roles(self, *args, **kwargs):
+        pass
+
     @abc.abstractmethod
     def save_note(self, *args, **kwargs):
         pass
 
+    @abc.abstractmethod
+    def save_notes(self, *args, **kwargs):
+        pass
+
     @abc.abstractmethod
     def get_note(self, *args, **kwargs):
         pass
 
+    @abc.abstractmethod
+    def get_note_with_role(self, *args, **kwargs):
+        pass
+
+    @abc.abstractmethod
+    def get_note_version_with_role(self, *args, **kwargs):
+        pass
+
+    @abc.abstractmethod
+    def get_notes(self, *args, **kwargs):
+        pass
+
+    @abc.abstractmethod
+    def get_note_board_ids(self, *args, **kwargs):
+        pass
+
+    @abc.abstractmethod
+    def move_notes(self, *args, **kwargs):
+        pass
+
+    @abc.abstractmethod
+    def update_notes(self, *args, **kwargs):
+        pass
+
     @abc.abstractmethod
     def delete_note(self, *args, **kwargs):
         pass
 
+    @abc.abstractmethod
+    def delete_notes(self, *args, **kwargs):
+        pass
+
+    @abc.abstractmethod
+    def delete_board_notes(self, *args, **kwargs):
+        pass
+
+    @abc.abstractmethod
+    def search_notes(self, *args, **kwargs):
+        pass
+
     @abc.abstractmethod
     def get_board(self, *args, **kwargs):
         pass
@@ -46,6 +124,10 @@ class Storage(abc.ABC):
     def get_board_notes(self, *args, **kwargs):
         pass
 
+    @abc.abstractmethod
+    def get_user_boards(self, *args, **kwargs):
+        pass
+
     @abc.abstractmethod
     def get_board_users(self, *args, **kwargs):
         pass
@@ -54,6 +136,135 @@ class Storage(abc.ABC):
     def delete_board_user(self, *args, **kwargs):
         pass
 
+    @abc.abstractmethod
+    def delete_board_users(self, *args, **kwargs):
+        pass
+
     @abc.abstractmethod
     def delete_board(self, *args, **kwargs):
         pass
+
+    @abc.abstractmethod
+    def purge_board(self, *args, **kwargs):
+        pass
+
+    @abc.abstractmethod
+    def get_board_changes(self, *args, **kwargs):
+        pass
+
+    @abc.abstractmethod
+    def get_last_change_seq(self, *args, **kwargs):
+        pass
+
+
+class StorageWrapper(Storage):
+    """Base class for adapters that add behavior to another storage adapter.
+
+    Every call is passed through to the wrapped adapter, so subclasses only need to override the
+    methods they change.
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+
+    def __getattr__(self, name):
+        # Pass through anything specific to the wrapped adapter, eg MemoryStorage.get_user
+        if name == 'storage':
+            raise AttributeError(name)
+        return getattr(self.storage, name)
+
+    def atomic(self):
+        return self.storage.atomic()
+
+    def on_commit(self, callback):
+        return self.storage.on_commit(callback)
+
+    def in_transaction(self):
+        return self.storage.in_transaction()
+
+    def uncached(self):
+        return self.storage.uncached()
+
+    def create_user(self, *args, **kwargs):
+        return self.storage.create_user(*args, **kwargs)
+
+    def save_board(self, *args, **kwargs):
+        return self.storage.save_board(*args, **kwargs)
+
+    def save_board_user(self, *args, **kwargs):
+        return self.storage.save_board_user(*args, **kwargs)
+
+    def get_role(self, *args, **kwargs):
+        return self.storage.get_role(*args, **kwargs)
+
+    def get_roles(self, *args, **kwargs):
+        return self.storage.get_roles(*args, **kwargs)
+
+    def save_note(self, *args, **kwargs):
+        return self.storage.save_note(*args, **kwargs)
+
+    def save_notes(self, *args, **kwargs):
+        return self.storage.save_notes(*args, **kwargs)
+
+    def get_note(self, *args, **kwargs):
+        return self.storage.get_note(*args, **kwargs)
+
+    def get_note_with_role(self, *args, **kwargs):
+        return self.storage.get_note_with_role(*args, **kwargs)
+
+    def get_note_version_with_role(self, *args, **kwargs):
+        return self.storage.get_note_version_with_role(*args, **kwargs)
+
+    def get_notes(self, *args, **kwargs):
+        return self.storage.get_notes(*args, **kwargs)
+
+    def get_note_board_ids(self, *args, **kwargs):
+        return self.storage.get_note_board_ids(*args, **kwargs)
+
+    def move_notes(self, *args, **kwargs):
+        return self.storage.move_notes(*args, **kwargs)
+
+    def update_notes(self, *args, **kwargs):
+        return self.storage.update_notes(*args, **kwargs)
+
+    def delete_note(self, *args, **kwargs):
+        return self.storage.delete_note(*args, **kwargs)
+
+    def delete_notes(self, *args, **kwargs):
+        return self.storage.delete_notes(*args, **kwargs)
+
+    def delete_board_notes(self, *args, **kwargs):
+        return self.storage.delete_board_notes(*args, **kwargs)
+
+    def search_notes(self, *args, **kwargs):
+        return self.storage.search_notes(*args, **kwargs)
+
+    def get_board(self, *args, **kwargs):
+        return self.storage.get_board(*args, **kwargs)
+
+    def get_board_notes(self, *args, **kwargs):
+        return self.storage.get_board_notes(*args, **kwargs)
+
+    def get_user_boards(self, *args, **kwargs):
+        return self.storage.get_user_boards(*args, **kwargs)
+
+    def get_board_users(self, *args, **kwargs):
+        return self.storage.get_board_users(*args, **kwargs)
+
+    def delete_board_user(self, *args, **kwargs):
+        return self.storage.delete_board_user(*args, **kwargs)
+
+    def delete_board_users(self, *args, **kwargs):
+        return self.storage.delete_board_users(*args, **kwargs)
+
+    def delete_board(self, *args, **kwargs):
+        return self.storage.delete_board(*args, **kwargs)
+
+    def purge_board(self, *args, **kwargs):
+        return self.storage.purge_board(*args, **kwargs)
+
+    def get_board_changes(self, *args, **kwargs):
+        return self.storage.get_board_changes(*args, **kwargs)
+
+    def get_last_change_seq(self, *args, **kwargs):
+        return self.storage.get_last_change_seq(*args, **kwargs)
@@ -0,0 +1,118 @@
+"""Test read-through caching adapter, wrapping memory storage."""
+
+import unittest
+
+from ..caching_storage import CachingStorage
+from ..memory_cache import LRUCache
+from ..memory_storage import MemoryStorage
+from notes import entities as notes_entities
+from accounts import entities as accounts_entities
+
+
+class CachingStorageTestCase(unittest.TestCase):
+    def setUp(self):
+        self.inner = MemoryStorage()
+        self.storage = CachingStorage(self.inner, LRUCache(max_size=100))
+        self.user = self.storage.create_user(
+            accounts_entities.User(name='Bob', email='bob@subgenius.com'), 'sl4ck')
+        self.board = self.storage.save_board(notes_entities.Board(name='board'))
+        self.note = self.storage.save_note(
+            notes_entities.Note(title='title', body='body', board_id=self.board.id))
+
+    def test_get_note_cached(self):
+        self.storage.get_note(self.note.id)
+        self.inner.notes[self.note.id] = self.note.replace(title='changed behind our back')
+
+        note = self.storage.get_note(self.note.id)
+
+        self.assertEqual(note.title, 'title')
+        self.assertEqual(self.storage.stats['hits']['note'], 1)
+        self.assertEqual(self.storage.stats['misses']['note'], 1)
+
+    def test_save_note_invalidates(self):
+        self.storage.get_note(self.note.id)
+        self.storage.save_note(self.note.replace(title='new title'))
+
+        self.assertEqual(self.storage.get_note(self.note.id).title, 'new title')
+
+    def test_delete_board_notes_invalidates(self):
+        self.storage.get_note(self.note.id)
+        self.storage.delete_board_notes(self.board.id)
+
+        with self.assertRaises(self.storage.DoesNotExist):
+            self.storage.get_note(self.note.id)
+
+    def test_board_users_invalidated_on_membership_change(self):
+        self.storage.save_board_user(self.board.id, self.user.id, 'reader')
+        self.assertEqual(len(self.storage.get_board_users(self.board.id)), 1)
+
+        self.storage.delete_board_user(board_id=self.board.id, user_id=self.user.id)
+
+        self.assertEqual(self.storage.get_board_users(self.board.id), [])
+
+    def test_roles_not_cached(self):
+        self.storage.save_board_user(self.board.id, self.user.id, 'reader')
+        self.storage.get_role(self.user.id, self.board.id)
+        self.inner.delete_board_user(self.board.id, self.user.id)
+
+        self.assertIsNone(self.storage.get_role(self.user.id, self.board.id))
+        self.assertEqual(self.storage.get_roles(self.user.id, [self.board.id]),
+                         {self.board.id: None})
+
+    def test_uncached_reads_refresh_cache(self):
+        self.storage.get_note(self.note.id)
+        changed = self.inner.save_note(self.note.replace(title='changed behind our back'))
+
+        with self.storage.uncached():
+            self.assertEqual(self.storage.get_note(self.note.id), changed)
+        self.assertEqual(self.storage.get_note(self.note.id), changed)
+
+    def test_invalidated_again_on_commit(self):
+        inner = DeferredCommitStorage()
+        storage = CachingStorage(inner, LRUCache(max_size=100))
+        note = storage.save_note(notes_entities.Note(title='title', body='body'))
+        inner.commit()
+
+        storage.save_note(note.replace(title='new title'))
+        # Another thread reads the note before the write is committed
+        storage.cache.set(storage._key('note', note.id), (note, ))
+        inner.commit()
+
+        self.assertEqual(storage.get_note(note.id).title, 'new title')
+
+    def test_evictions_reported(self):
+        storage = CachingStorage(self.inner, LRUCache(max_size=1))
+        storage.get_note(self.note.id)
+        storage.get_board(self.board.id)
+
+        self.assertEqual(storage.stats['evictions'], 1)
+
+    def test_passes_through_adapter_methods(self):
+        self.assertEqual(self.storage.get_user(self.user.id), self.user)
+
+    def test_get_note_with_role_refreshes_cache(self):
+        self.storage.save_board_user(self.board.id, self.user.id, 'reader')
+        self.storage.get_note(self.note.id)
+        changed = self.inner.save_note(self.note.replace(title='changed behind our back'))
+
+        note, role = self.storage.get_note_with_role(self.note.id, self.user.id)
+
+        self.assertEqual((note, role), (changed, 'reader'))
+        self.assertEqual(self.storage.get_note(self.note.id), changed)
+        self.assertEqual(self.storage.stats['hits'], {'note': 1, 'board': 0, 'board_users': 0})
+
+
+class DeferredCommitStorage(MemoryStorage):
+    """Memory storage that holds on_commit callbacks until commit is called."""
+
+    def __init__(self):
+        super().__init__()
+        self.callbacks = []
+
+    def on_commit(self, callback):
+        self.callbacks.append(callback)
+
+    def commit(self):
+        callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            callback()
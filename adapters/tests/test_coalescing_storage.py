@@ -0,0 +1,102 @@
+"""Test adapter that coalesces concurrent reads, wrapping memory storage."""
+
+import threading
+import time
+import unittest
+
+from ..coalescing_storage import CoalescingStorage, SingleFlight
+from ..memory_storage import MemoryStorage
+from notes import entities as notes_entities
+
+
+class SingleFlightTestCase(unittest.TestCase):
+    def test_concurrent_calls_collapsed(self):
+        flights = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        fetches = []
+
+        def fetch():
+            fetches.append(1)
+            started.set()
+            release.wait(5)
+            return 'result'
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(flights.do('key', fetch)))
+        leader.start()
+        started.wait(5)
+        followers = [threading.Thread(target=lambda: results.append(flights.do('key', fetch)))
+                     for i in range(3)]
+        for thread in followers:
+            thread.start()
+        # Followers block until the leader finishes
+        while flights.calls < 4:
+            time.sleep(0.001)
+        release.set()
+        for thread in [leader] + followers:
+            thread.join(5)
+
+        self.assertEqual(results, ['result'] * 4)
+        self.assertEqual(len(fetches), 1)
+        self.assertEqual(flights.stats, {'calls': 4, 'collapsed': 3})
+
+    def test_no_window_refetches(self):
+        flights = SingleFlight()
+        flights.do('key', lambda: 1)
+
+        self.assertEqual(flights.do('key', lambda: 2), 2)
+
+    def test_window_shares_finished_result(self):
+        flights = SingleFlight(window=60)
+        flights.do('key', lambda: 1)
+
+        self.assertEqual(flights.do('key', lambda: 2), 1)
+        self.assertEqual(flights.collapsed, 1)
+
+
+class CoalescingStorageTestCase(unittest.TestCase):
+    def setUp(self):
+        self.storage = CoalescingStorage(MemoryStorage(), window=60)
+        self.note = self.storage.save_note(notes_entities.Note(title='title', body='body'))
+
+    def test_write_forgets_shared_results(self):
+        self.storage.get_note(self.note.id)
+        self.storage.save_note(self.note.replace(title='new title'))
+
+        self.assertEqual(self.storage.get_note(self.note.id).title, 'new title')
+
+    def test_errors_shared(self):
+        with self.assertRaises(self.storage.DoesNotExist):
+            self.storage.get_note(5000)
+        with self.assertRaises(self.storage.DoesNotExist):
+            self.storage.get_note(5000)
+        self.assertEqual(self.storage.stats['collapsed'], 1)
+
+    def test_uncached_reads_not_shared(self):
+        self.storage.get_note(self.note.id)
+        self.storage.storage.save_note(self.note.replace(title='new title'))
+
+        with self.storage.uncached():
+            note = self.storage.get_note(self.note.id)
+
+        self.assertEqual(note.title, 'new title')
+
+    def test_reads_in_transaction_not_shared(self):
+        storage = CoalescingStorage(TransactionMemoryStorage(), window=60)
+        note = storage.save_note(notes_entities.Note(title='title', body='body'))
+        storage.get_note(note.id)
+        storage.storage.save_note(note.replace(title='new title'))
+
+        storage.storage.transaction = True
+        self.assertEqual(storage.get_note(note.id).title, 'new title')
+        self.assertEqual(storage.stats, {'calls': 1, 'collapsed': 0})
+
+
+class TransactionMemoryStorage(MemoryStorage):
+    """Memory storage that can pretend to be in a transaction."""
+
+    transaction = False
+
+    def in_transaction(self):
+        return self.transaction
@@ -0,0 +1,42 @@
+"""Test job queue adapter for Django ORM."""
+
+import datetime
+
+from django.test import TestCase
+
+from ..django_jobs import DjangoJobQueue
+
+
+class DjangoJobQueueTestCase(TestCase):
+    def setUp(self):
+        self.queue = DjangoJobQueue(stale_after=60)
+
+    def test_claim_oldest_first(self):
+        first = self.queue.enqueue('board.purge', {'board_id': 1}, created_by=2)
+        second = self.queue.enqueue('board.purge', {'board_id': 3})
+
+        claimed = self.queue.claim('a')
+        self.assertEqual((claimed.id, claimed.status, claimed.worker), (first.id, 'running', 'a'))
+        self.assertEqual(claimed.params, {'board_id': 1})
+        self.assertEqual(self.queue.claim('b').id, second.id)
+        self.assertIsNone(self.queue.claim('c'))
+
+    def test_progress_and_finish(self):
+        job = self.queue.enqueue('board.purge', {'board_id': 1})
+        self.queue.claim('a')
+
+        self.assertEqual(self.queue.update(job.id, {'notes': 5}).progress, {'notes': 5})
+        self.assertEqual(self.queue.finish(job.id).status, 'done')
+
+    def test_stale_job_claimed_again(self):
+        job = self.queue.enqueue('board.purge', {'board_id': 1})
+        self.queue.claim('a')
+        now = self.queue._now()
+        self.queue._now = lambda: now + datetime.timedelta(seconds=61)
+
+        self.assertEqual(self.queue.claim('b').worker, 'b')
+        self.assertEqual(self.queue.get(job.id).worker, 'b')
+
+    def test_missing_job(self):
+        with self.assertRaises(self.queue.DoesNotExist):
+            self.queue.get(1)
@@ -1,10 +1,15 @@
 """Test adapter for Django ORM."""
 
-from django.test import TestCase
+from unittest.mock import patch
+
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
 
 from ..django_storage import DjangoStorage
 from notes import models as notes_models
 from notes import entities as notes_entities
+from accounts import entities as accounts_entities
 from . import model_factories
 
 storage = DjangoStorage()
@@ -22,6 +27,321 @@ class SaveNoteTestCase(TestCase):
         self.assertEqual(note.title, saved_note.title)
 
 
+class InTransactionTestCase(TransactionTestCase):
+    def test_in_transaction(self):
+        self.assertFalse(storage.in_transaction())
+        with storage.atomic():
+            self.assertTrue(storage.in_transaction())
+
+
+class VersionTestCase(TestCase):
+    """Tests for optimistic concurrency control."""
+
+    def test_save_increments_version(self):
+        note = storage.save_note(notes_entities.Note(title='title', body='body'))
+
+        edited = storage.save_note(note.replace(title='new title'))
+
+        self.assertEqual(edited.version, note.version + 1)
+        self.assertEqual(storage.get_note(note.id).version, edited.version)
+
+    def test_stale_save_conflicts(self):
+        note = storage.save_note(notes_entities.Note(title='title', body='body'))
+        storage.save_note(note.replace(title='first edit'))
+
+        with self.assertRaises(storage.Conflict):
+            storage.save_note(note.replace(title='second edit'))
+        self.assertEqual(storage.get_note(note.id).title, 'first edit')
+
+    def test_stale_save_notes_saves_nothing(self):
+        notes = storage.save_notes([notes_entities.Note(title='title', body='body')
+                                    for i in range(2)])
+        storage.save_note(notes[1].replace(title='first edit'))
+
+        with self.assertRaises(storage.Conflict):
+            storage.save_notes([note.replace(title='second edit') for note in notes])
+        self.assertEqual(storage.get_note(notes[0].id).title, 'title')
+
+    def test_stale_save_board_conflicts(self):
+        board = storage.save_board(notes_entities.Board(name='board'))
+        storage.save_board(board.replace(name='first edit'))
+
+        with self.assertRaises(storage.Conflict):
+            storage.save_board(board.replace(name='second edit'))
+
+
+class ChangeLogTestCase(TestCase):
+    """Tests for recording changes to boards."""
+
+    def setUp(self):
+        self.board = model_factories.Board()
+        self.other_board = model_factories.Board()
+        self.after_seq = storage.get_last_change_seq(self.board.id)
+
+    def changes(self, board_id):
+        return [(c.entity, c.entity_id, c.action)
+                for c in storage.get_board_changes(board_id, after_seq=self.after_seq)]
+
+    def test_note_changes(self):
+        note = storage.save_note(notes_entities.Note(title='t', body='b', board_id=self.board.id))
+        others = storage.save_notes([notes_entities.Note(title='t', body='b',
+                                                         board_id=self.board.id)
+                                     for i in range(2)])
+        storage.delete_note(note.id)
+        storage.delete_notes([others[0].id])
+
+        self.assertEqual(self.changes(self.board.id), [
+            ('note', note.id, 'saved'), ('note', others[0].id, 'saved'),
+            ('note', others[1].id, 'saved'), ('note', note.id, 'deleted'),
+            ('note', others[0].id, 'deleted')])
+
+    def test_moved_notes(self):
+        notes = storage.save_notes([notes_entities.Note(title='t', body='b',
+                                                        board_id=self.board.id)
+                                    for i in range(2)])
+
+        storage.save_note(notes[0].replace(board_id=self.other_board.id))
+        storage.save_notes([notes[1].replace(board_id=self.other_board.id)])
+
+        self.assertEqual(self.changes(self.other_board.id), [
+            ('note', notes[0].id, 'saved'), ('note', notes[1].id, 'saved')])
+        self.assertEqual(self.changes(self.board.id)[2:], [
+            ('note', notes[0].id, 'deleted'), ('note', notes[1].id, 'deleted')])
+
+    def test_board_user_changes(self):
+        user = model_factories.User()
+        storage.save_board_user(self.board.id, user.id, 'reader')
+        storage.delete_board_user(user.id, self.board.id)
+        storage.delete_board_notes(self.board.id)
+        storage.delete_board_users(self.board.id)
+
+        self.assertEqual(self.changes(self.board.id), [
+            ('board_user', user.id, 'saved'), ('board_user', user.id, 'deleted'),
+            ('note', None, 'cleared'), ('board_user', None, 'cleared')])
+
+    def test_get_board_changes_pages(self):
+        notes = storage.save_notes([notes_entities.Note(title='t', body='b',
+                                                        board_id=self.board.id)
+                                    for i in range(3)])
+
+        first = storage.get_board_changes(self.board.id, after_seq=self.after_seq, limit=2)
+        second = storage.get_board_changes(self.board.id, after_seq=first[-1].seq, limit=2)
+
+        self.assertEqual([c.entity_id for c in first + second], [n.id for n in notes])
+        self.assertEqual(storage.get_last_change_seq(self.board.id), second[-1].seq)
+
+
+class BulkUpdateNotesTestCase(TestCase):
+    """Tests for moving & editing many notes at once."""
+
+    def setUp(self):
+        self.board = model_factories.Board()
+        self.other_board = model_factories.Board()
+        self.notes = [model_factories.Note(board=self.board, version=1) for i in range(3)]
+        self.after_seq = storage.get_last_change_seq(self.other_board.id)
+
+    def updates(self, context):
+        return [q['sql'] for q in context.captured_queries if q['sql'].startswith('UPDATE')]
+
+    def test_move_notes(self):
+        note_ids = [note.id for note in self.notes]
+        model_factories.Note(board=self.other_board)
+
+        with CaptureQueriesContext(connection) as context:
+            moved = storage.move_notes(note_ids + [note_ids[-1] + 100], self.other_board.id)
+
+        self.assertEqual(len(self.updates(context)), 1)
+        self.assertEqual(sorted(moved), note_ids)
+        self.assertEqual(storage.get_note_board_ids(note_ids),
+                         dict.fromkeys(note_ids, self.other_board.id))
+        self.assertEqual(storage.get_note(note_ids[0]).version, 2)
+        changes = storage.get_board_changes(self.board.id)
+        self.assertEqual(sorted(c.entity_id for c in changes if c.action == 'deleted'), note_ids)
+        changes = storage.get_board_changes(self.other_board.id, after_seq=self.after_seq)
+        self.assertEqual(sorted(c.entity_id for c in changes), note_ids)
+
+    def test_notes_already_on_board_not_moved(self):
+        moved = storage.move_notes([self.notes[0].id], self.board.id)
+
+        self.assertEqual(moved, [])
+        self.assertEqual(storage.get_note(self.notes[0].id).version, 1)
+
+    def test_only_notes_on_given_boards_changed(self):
+        note_ids = [note.id for note in self.notes]
+        other_note = model_factories.Note(board=self.other_board)
+        third_board = model_factories.Board()
+
+        moved = storage.move_notes(note_ids[:2] + [other_note.id], third_board.id,
+                                   from_board_ids=[self.board.id])
+        updated = storage.update_notes(note_ids + [other_note.id], {'title': 'Owls'},
+                                       board_ids=[self.board.id, third_board.id])
+
+        self.assertEqual(sorted(moved), note_ids[:2])
+        self.assertEqual(sorted(updated), note_ids)
+        self.assertEqual(storage.get_note(other_note.id).board_id, self.other_board.id)
+        self.assertEqual(storage.get_note(other_note.id).title, other_note.title)
+
+    def test_note_moved_during_update_conflicts(self):
+        """If a note's board changes between selecting & updating it, nothing is updated."""
+        note_id = self.notes[0].id
+
+        with self.assertRaises(storage.Conflict):
+            storage._update_note_boards([(note_id, self.other_board.id)], title='Owls')
+
+        self.assertEqual(storage.get_note(note_id).title, self.notes[0].title)
+
+    def test_update_notes(self):
+        note_ids = [note.id for note in self.notes[:2]]
+
+        with CaptureQueriesContext(connection) as context:
+            updated = storage.update_notes(note_ids, {'title': 'Owls', 'status': 'archived'})
+
+        self.assertEqual(len(self.updates(context)), 1)
+        self.assertEqual(sorted(updated), note_ids)
+        note = storage.get_note(note_ids[0])
+        self.assertEqual((note.title, note.status, note.version), ('Owls', 'archived', 2))
+        self.assertEqual(storage.get_note(self.notes[2].id).title, self.notes[2].title)
+        # Search index follows the new titles
+        user = model_factories.User()
+        model_factories.BoardUser(user=user, board=self.board, role='reader')
+        found = storage.search_notes(user.id, 'owls', roles=['reader'])
+        self.assertEqual(sorted(n.id for n in found), note_ids)
+
+
+class PurgeBoardTestCase(TestCase):
+    """Tests for removing a deleted board's contents in batches."""
+
+    def test_purge_board(self):
+        board = model_factories.Board(status='deleted')
+        users = [model_factories.User(email='{}@example.com'.format(i)) for i in range(2)]
+        for user in users:
+            model_factories.BoardUser(user=user, board=board, role='reader')
+        notes = [storage.save_note(notes_entities.Note(title='t', body='b', board_id=board.id))
+                 for i in range(3)]
+        other_note = model_factories.Note(board=model_factories.Board())
+
+        first = storage.purge_board(board.id, limit=4)
+        second = storage.purge_board(board.id, limit=4)
+        third = storage.purge_board(board.id, limit=4)
+
+        self.assertEqual(sorted(first['user_ids']), [user.id for user in users])
+        self.assertEqual(first['note_ids'] + second['note_ids'], [note.id for note in notes])
+        self.assertEqual((second['changes'], third['changes']), (3, 0))
+        self.assertFalse(notes_models.BoardUser.objects.filter(board=board).exists())
+        self.assertFalse(notes_models.Note.objects.filter(board=board).exists())
+        self.assertTrue(notes_models.Note.objects.filter(id=other_note.id).exists())
+
+
+class SearchNotesTestCase(TestCase):
+    """Tests for full-text search."""
+
+    def setUp(self):
+        self.user = model_factories.User()
+        self.board = model_factories.Board()
+        model_factories.BoardUser(user=self.user, board=self.board, role='reader')
+        self.roles = ['reader', 'editor', 'owner']
+
+    def save_note(self, title, body, board=None):
+        return storage.save_note(notes_entities.Note(
+            title=title, body=body, board_id=(board or self.board).id))
+
+    def search(self, query, **kwargs):
+        return [n.id for n in storage.search_notes(self.user.id, query, self.roles, **kwargs)]
+
+    def test_title_matches_rank_first(self):
+        in_body = self.save_note('Diary', 'The owls are not what they seem')
+        in_title = self.save_note('Owls', 'Something else entirely')
+        self.save_note('Coffee', 'Damn fine')
+
+        self.assertEqual(self.search('owls'), [in_title.id, in_body.id])
+
+    def test_all_words_required(self):
+        both = self.save_note('Black lodge', 'Red room')
+        self.save_note('White lodge', 'Red room')
+
+        self.assertEqual(self.search('lodge, BLACK!'), [both.id])
+        self.assertEqual(self.search('"OR" -'), [])
+
+    def test_only_readable_boards(self):
+        other_board = model_factories.Board()
+        self.save_note('Owls', 'Owls', board=other_board)
+
+        self.assertEqual(self.search('owls'), [])
+
+    def test_index_follows_edits_and_deletes(self):
+        note = self.save_note('Owls', 'Body')
+        other = self.save_note('Owls', 'Body')
+
+        storage.save_note(note.replace(title='Logs'))
+        storage.delete_note(other.id)
+
+        self.assertEqual(self.search('owls'), [])
+        self.assertEqual(self.search('logs'), [note.id])
+
+    def test_other_backends_scan_notes(self):
+        """Backends without the FTS5 index should still find notes, in ID order."""
+        in_body = self.save_note('Diary', 'The owls are not what they seem')
+        in_title = self.save_note('Owls', 'Something else entirely')
+        self.save_note('Owls', 'Something else', board=model_factories.Board())
+
+        with patch.object(connection, 'vendor', 'postgresql'):
+            self.assertEqual(self.search('OWLS seem'), [in_body.id])
+            self.assertEqual(self.search('owls'), [in_body.id, in_title.id])
+            self.assertEqual(self.search('owls', limit=1, offset=1), [in_title.id])
+
+    def test_pages(self):
+        notes = [self.save_note('Owls', 'Body') for i in range(3)]
+
+        pages = [self.search('owls', limit=2), self.search('owls', limit=2, offset=2)]
+
+        self.assertEqual(pages, [[notes[0].id, notes[1].id], [notes[2].id]])
+
+
+class SaveNotesTestCase(TestCase):
+    """Tests for saving many notes at once."""
+
+    def test_save_new_and_existing_notes(self):
+        existing = model_factories.Note(title='old title')
+        notes = [
+            notes_entities.Note(title='first', body='body'),
+            storage.get_note(existing.id).replace(title='new title'),
+            notes_entities.Note(title='second', body='body'),
+        ]
+
+        saved = storage.save_notes(notes)
+
+        self.assertEqual([n.title for n in saved], ['first', 'new title', 'second'])
+        self.assertEqual(saved[1].id, existing.id)
+        for note in saved:
+            self.assertEqual(storage.get_note(note.id).title, note.title)
+
+    def test_new_notes_inserted_one_at_a_time_on_other_backends(self):
+        """Backends that can't return bulk inserted IDs, other than SQLite, insert each note."""
+        notes = [notes_entities.Note(title=title, body='body') for title in ('first', 'second')]
+
+        with patch.object(connection, 'vendor', 'mysql'):
+            with CaptureQueriesContext(connection) as context:
+                saved = storage.save_notes(notes)
+
+        inserts = [q['sql'] for q in context.captured_queries
+                   if q['sql'].startswith('INSERT INTO "notes_note"')]
+        self.assertEqual(len(inserts), 2)
+        for note in saved:
+            self.assertEqual(storage.get_note(note.id).title, note.title)
+
+    def test_save_notes_queries(self):
+        board = model_factories.Board()
+        existing = [model_factories.Note(board=board) for i in range(3)]
+        notes = [notes_entities.Note(title='new', body='body', board_id=board.id)
+                 for i in range(3)]
+        notes += [storage.get_note(n.id).replace(title='edited') for n in existing]
+
+        # Savepoint, INSERT, SELECT inserted IDs, SELECT stored versions, UPDATE, INSERT changes,
+        # release savepoint
+        with self.assertNumQueries(7):
+            storage.save_notes(notes)
+
+
 class GetNoteTestCase(TestCase):
     """Tests for retrieving notes."""
 
@@ -47,3 +367,189 @@ class DeleteNoteTestCase(TestCase):
 
         with self.assertRaises(storage.DoesNotExist):
             storage.get_note(id=note.id)
+
+
+class DeleteBoardContentsTestCase(TestCase):
+    """Tests for deleting all notes & users on a board."""
+
+    def setUp(self):
+        self.board = model_factories.Board()
+        self.other_board = model_factories.Board()
+        for i in range(3):
+            model_factories.Note(board=self.board)
+            user = model_factories.User(email='user{}@example.com'.format(i))
+            model_factories.BoardUser(user=user, board=self.board, role='reader')
+        model_factories.Note(board=self.other_board)
+
+    def test_delete_board_notes(self):
+        deleted = storage.delete_board_notes(self.board.id)
+
+        self.assertEqual(deleted, 3)
+        self.assertEqual(storage.get_board_notes(self.board.id), [])
+        self.assertEqual(len(storage.get_board_notes(self.other_board.id)), 1)
+
+    def test_delete_board_users(self):
+        user_ids = storage.delete_board_users(self.board.id)
+
+        self.assertEqual(len(user_ids), 3)
+        self.assertEqual(storage.get_board_users(self.board.id), [])
+
+
+class GetUserBoardsTestCase(TestCase):
+    """Tests for summarizing a user's boards."""
+
+    def test_get_user_boards(self):
+        user = model_factories.User()
+        board = model_factories.Board(name='Sprints')
+        empty_board = model_factories.Board()
+        deleted_board = model_factories.Board(status='deleted')
+        other_board = model_factories.Board()
+        model_factories.BoardUser(user=user, board=board, role='editor')
+        model_factories.BoardUser(user=user, board=empty_board, role='owner')
+        model_factories.BoardUser(user=user, board=deleted_board, role='owner')
+        for i in range(3):
+            model_factories.Note(board=board)
+        model_factories.Note(board=other_board)
+
+        with self.assertNumQueries(1):
+            boards = storage.get_user_boards(user.id)
+
+        self.assertEqual([b['board'].id for b in boards], [board.id, empty_board.id])
+        self.assertEqual(boards[0]['board'].name, 'Sprints')
+        self.assertEqual([b['role'] for b in boards], ['editor', 'owner'])
+        self.assertEqual([b['note_count'] for b in boards], [3, 0])
+        self.assertIsNotNone(boards[0]['last_modified'])
+
+
+class GetRolesTestCase(TestCase):
+    """Tests for retrieving roles on many boards."""
+
+    def test_get_roles(self):
+        user = model_factories.User()
+        board = model_factories.Board()
+        other_board = model_factories.Board()
+        model_factories.BoardUser(user=user, board=board, role='editor')
+
+        with self.assertNumQueries(1):
+            roles = storage.get_roles(user.id, [board.id, other_board.id])
+
+        self.assertEqual(roles, {board.id: 'editor', other_board.id: None})
+
+
+class QueryCountTestCase(TestCase):
+    """Guard against N+1 queries creeping into storage methods.
+
+    Fixtures include several rows per relation, so a per-row query would change the count.
+    """
+
+    def setUp(self):
+        self.board = model_factories.Board()
+        self.users = [model_factories.User(email='user{}@example.com'.format(i))
+                      for i in range(3)]
+        for user in self.users:
+            model_factories.BoardUser(user=user, board=self.board, role='editor')
+        self.notes = [model_factories.Note(board=self.board) for i in range(3)]
+
+    def test_create_user(self):
+        user = accounts_entities.User(name='Bob', email='bob@subgenius.com')
+        with self.assertNumQueries(1):
+            storage.create_user(user, 'sl4ck')
+
+    def test_save_board(self):
+        with self.assertNumQueries(1):
+            storage.save_board(notes_entities.Board(name='board'))
+
+    def test_save_board_user(self):
+        user = model_factories.User(email='new@example.com')
+        # Savepoint, insert membership & change, release savepoint
+        with self.assertNumQueries(4):
+            board_user = storage.save_board_user(self.board.id, user.id, 'reader')
+
+        self.assertEqual(board_user, {'board_id': self.board.id, 'user_id': user.id,
+                                      'role': 'reader'})
+
+    def test_get_role(self):
+        with self.assertNumQueries(1):
+            storage.get_role(self.users[0].id, self.board.id)
+
+    def test_get_roles(self):
+        with self.assertNumQueries(1):
+            storage.get_roles(self.users[0].id, [self.board.id])
+
+    def test_save_note(self):
+        # Savepoint, insert note & change, release savepoint
+        with self.assertNumQueries(4):
+            storage.save_note(notes_entities.Note(title='t', body='b', board_id=self.board.id))
+
+    def test_get_note(self):
+        with self.assertNumQueries(1):
+            storage.get_note(self.notes[0].id)
+
+    def test_get_note_with_role(self):
+        with self.assertNumQueries(1):
+            note, role = storage.get_note_with_role(self.notes[0].id, self.users[0].id)
+        self.assertEqual(note.id, self.notes[0].id)
+        self.assertEqual(role, 'editor')
+
+    def test_get_note_version_with_role(self):
+        with self.assertNumQueries(1):
+            version, role = storage.get_note_version_with_role(self.notes[0].id, self.users[0].id)
+        self.assertEqual((version, role), (self.notes[0].version, 'editor'))
+
+    def test_get_note_with_no_role(self):
+        user = model_factories.User(email='new@example.com')
+        note, role = storage.get_note_with_role(self.notes[0].id, user.id)
+        self.assertIsNone(role)
+
+    def test_get_notes(self):
+        with self.assertNumQueries(1):
+            notes = storage.get_notes([n.id for n in self.notes])
+        self.assertEqual(len(notes), len(self.notes))
+
+    def test_delete_note(self):
+        # Savepoint, load board ID, delete, insert change, release savepoint
+        with self.assertNumQueries(5):
+            storage.delete_note(self.notes[0].id)
+
+    def test_get_board(self):
+        with self.assertNumQueries(1):
+            storage.get_board(self.board.id)
+
+    def test_get_board_notes(self):
+        with self.assertNumQueries(1):
+            notes = storage.get_board_notes(self.board.id)
+        self.assertEqual(len(notes), len(self.notes))
+
+    def test_get_board_changes(self):
+        with self.assertNumQueries(1):
+            storage.get_board_changes(self.board.id, after_seq=0, limit=10)
+
+    def test_get_board_users(self):
+        with self.assertNumQueries(1):
+            users = storage.get_board_users(self.board.id)
+        self.assertEqual(len(users), len(self.users))
+
+    def test_delete_board_user(self):
+        # Load membership to return it, then savepoint, delete, insert change, release savepoint
+        with self.assertNumQueries(5):
+            storage.delete_board_user(self.users[0].id, self.board.id)
+
+    def test_delete_notes(self):
+        # Savepoint, load board IDs, delete, insert changes, release savepoint
+        with self.assertNumQueries(5):
+            storage.delete_notes([n.id for n in self.notes])
+
+    def test_delete_board_notes(self):
+        # Savepoint, delete, insert change, release savepoint
+        with self.assertNumQueries(4):
+            storage.delete_board_notes(self.board.id)
+
+    def test_delete_board_users(self):
+        # Savepoint, load user IDs, delete, insert change, release savepoint
+        with self.assertNumQueries(5):
+            storage.delete_board_users(self.board.id)
+
+    def test_delete_board(self):
+        # Load board, then update its status
+        with self.assertNumQueries(2):
+            storage.delete_board(self.board.id)
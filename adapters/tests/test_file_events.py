@@ -0,0 +1,43 @@
+"""Test adapter for file event log."""
+
+import os
+import tempfile
+import unittest
+
+from ..file_events import FileEventLog
+
+
+class FileEventLogTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'events.log')
+        # Two logs sharing a file, as two processes would
+        self.events = FileEventLog(self.path, max_events=3, poll_interval=0.01)
+        self.other_events = FileEventLog(self.path, max_events=3, poll_interval=0.01)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_events_shared_through_file(self):
+        first = self.events.append(1, 'note.edit', {'id': 1})
+        second = self.other_events.append(1, 'note.edit', {'id': 2})
+
+        self.assertEqual(second.offset, first.offset + 1)
+        self.assertEqual(self.events.read(1), [first, second])
+        self.assertEqual(self.other_events.read(1), [first, second])
+
+    def test_compaction_keeps_recent_events(self):
+        for i in range(7):
+            self.events.append(1, 'note.edit', {'id': i})
+
+        with open(self.path) as f:
+            self.assertLess(len(f.readlines()), 6)
+        self.assertEqual([e.data['id'] for e in self.other_events.read(1, after=4)], [4, 5, 6])
+        self.assertEqual(self.other_events.append(1, 'note.edit', {'id': 7}).offset, 8)
+
+    def test_wait_polls_file(self):
+        self.other_events.append(1, 'note.edit', {'id': 1})
+
+        events = self.events.wait(1, timeout=1)
+
+        self.assertEqual([e.offset for e in events], [1])
@@ -0,0 +1,27 @@
+"""Test adapter for system memory cache."""
+
+import unittest
+
+from ..memory_cache import LRUCache
+
+
+class LRUCacheTestCase(unittest.TestCase):
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(max_size=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+
+        cache.set('c', 3)
+
+        self.assertEqual(cache.get_many(['a', 'b', 'c']), {'a': 1, 'c': 3})
+        self.assertEqual(cache.evictions, 1)
+
+    def test_expired_entry(self):
+        cache = LRUCache(ttl=10)
+        cache.set('a', 1)
+
+        cache._now = lambda: float('inf')
+
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(len(cache), 0)
@@ -0,0 +1,51 @@
+"""Test adapter for system memory event log."""
+
+import threading
+import unittest
+
+from ..memory_events import MemoryEventLog
+
+
+class MemoryEventLogTestCase(unittest.TestCase):
+    def setUp(self):
+        self.events = MemoryEventLog(max_events=5)
+
+    def test_read_board_events_after_offset(self):
+        first = self.events.append(1, 'note.edit', {'id': 1})
+        self.events.append(2, 'note.edit', {'id': 2})
+        third = self.events.append(1, 'note.edit', {'id': 3})
+
+        self.assertEqual(self.events.read(1), [first, third])
+        self.assertEqual(self.events.read(1, after=first.offset), [third])
+        self.assertEqual(self.events.read(1, limit=1), [first])
+        self.assertEqual(self.events.read(1, after=third.offset), [])
+
+    def test_old_events_expire(self):
+        for i in range(6):
+            self.events.append(1, 'note.edit', {'id': i})
+
+        self.assertEqual([e.offset for e in self.events.read(1, after=1)], [2, 3, 4, 5, 6])
+        with self.assertRaises(self.events.Expired):
+            self.events.read(1, after=0)
+
+    def test_offset_from_another_log_expired(self):
+        with self.assertRaises(self.events.Expired):
+            self.events.read(1, after=10)
+
+    def test_wait_wakes_on_append(self):
+        timer = threading.Timer(0.01, self.events.append, (1, 'note.edit', {'id': 1}))
+        timer.start()
+
+        events = self.events.wait(1, timeout=5)
+        timer.join()
+
+        self.assertEqual([e.offset for e in events], [1])
+
+    def test_wait_times_out(self):
+        self.events.append(2, 'note.edit', {'id': 1})
+
+        self.assertEqual(self.events.wait(1, timeout=0.01), [])
+
+    def test_wait_with_invalid_timeout(self):
+        for timeout in (float('nan'), float('inf'), -1):
+            self.assertEqual(self.events.wait(1, timeout=timeout), [])
@@ -0,0 +1,42 @@
+"""Test job queue adapter for system memory."""
+
+import datetime
+import unittest
+
+from ..memory_jobs import MemoryJobQueue
+
+
+class MemoryJobQueueTestCase(unittest.TestCase):
+    def setUp(self):
+        self.queue = MemoryJobQueue(stale_after=60)
+
+    def test_claim_oldest_first(self):
+        first = self.queue.enqueue('board.purge', {'board_id': 1}, created_by=2)
+        second = self.queue.enqueue('board.purge', {'board_id': 3})
+
+        self.assertEqual(self.queue.claim('a').id, first.id)
+        self.assertEqual(self.queue.claim('b').id, second.id)
+        self.assertIsNone(self.queue.claim('c'))
+        self.assertEqual(self.queue.get(first.id).worker, 'a')
+
+    def test_progress_and_finish(self):
+        job = self.queue.enqueue('board.purge', {'board_id': 1})
+        self.queue.claim('a')
+
+        self.queue.update(job.id, {'notes': 5})
+        job = self.queue.finish(job.id, error='Oops')
+
+        self.assertEqual((job.status, job.progress, job.error), ('failed', {'notes': 5}, 'Oops'))
+        self.assertEqual(self.queue.finish(job.id).status, 'done')
+
+    def test_stale_job_claimed_again(self):
+        job = self.queue.enqueue('board.purge', {'board_id': 1})
+        self.queue.claim('a')
+        now = self.queue._now()
+        self.queue._now = lambda: now + datetime.timedelta(seconds=61)
+
+        self.assertEqual(self.queue.claim('b').id, job.id)
+
+    def test_missing_job(self):
+        with self.assertRaises(self.queue.DoesNotExist):
+            self.queue.get(1)
@@ -0,0 +1,266 @@
+"""Test adapter for system memory storage."""
+
+import datetime
+import unittest
+
+from ..memory_storage import MemoryStorage
+from notes import entities as notes_entities
+from accounts import entities as accounts_entities
+
+
+class BoardUserIndexTestCase(unittest.TestCase):
+    """Tests for keeping board user indexes consistent."""
+
+    def setUp(self):
+        self.storage = MemoryStorage()
+        self.user = self.storage.create_user(
+            accounts_entities.User(name='Bob', email='bob@subgenius.com'), 'sl4ck')
+        self.board = self.storage.save_board(notes_entities.Board(name='board'))
+
+    def test_change_role(self):
+        self.storage.save_board_user(self.board.id, self.user.id, 'reader')
+        self.storage.save_board_user(self.board.id, self.user.id, 'editor')
+
+        self.assertEqual(self.storage.get_role(self.user.id, self.board.id), 'editor')
+        self.assertEqual(len(self.storage.get_board_users(self.board.id)), 1)
+
+    def test_delete_board_user(self):
+        self.storage.save_board_user(self.board.id, self.user.id, 'reader')
+
+        self.storage.delete_board_user(self.board.id, self.user.id)
+
+        self.assertIsNone(self.storage.get_role(self.user.id, self.board.id))
+        self.assertEqual(self.storage.get_board_users(self.board.id), [])
+        self.assertEqual(self.storage.get_user_boards(self.user.id), [])
+
+    def test_delete_board_users(self):
+        self.storage.save_board_user(self.board.id, self.user.id, 'reader')
+
+        self.storage.delete_board_users(self.board.id)
+
+        self.assertEqual(self.storage.get_user_boards(self.user.id), [])
+
+
+class BoardNoteIndexTestCase(unittest.TestCase):
+    """Tests for keeping board note index consistent."""
+
+    def setUp(self):
+        self.storage = MemoryStorage()
+        self.board = self.storage.save_board(notes_entities.Board(name='board'))
+        self.other_board = self.storage.save_board(notes_entities.Board(name='other'))
+        self.note = self.storage.save_note(
+            notes_entities.Note(title='title', body='body', board_id=self.board.id))
+
+    def test_move_note(self):
+        self.storage.save_note(self.note.replace(board_id=self.other_board.id))
+
+        self.assertEqual(self.storage.get_board_notes(self.board.id), [])
+        self.assertEqual(
+            [n.id for n in self.storage.get_board_notes(self.other_board.id)], [self.note.id])
+
+    def test_delete_note(self):
+        self.storage.delete_note(self.note.id)
+
+        self.assertEqual(self.storage.get_board_notes(self.board.id), [])
+
+    def test_last_modified_follows_notes(self):
+        user = self.storage.create_user(accounts_entities.User(name='Bird', email='b@f.com'), 'w')
+        self.storage.save_board_user(self.board.id, user.id, 'reader')
+        board_modified = datetime.datetime(2017, 1, 1)
+        self.storage.boards[self.board.id] = self.board.replace(modified_at=board_modified)
+        self.storage.save_note(self.note.replace(modified_at=datetime.datetime(2017, 2, 1)))
+
+        def last_modified():
+            return self.storage.get_user_boards(user.id)[0]['last_modified']
+
+        self.assertEqual(last_modified(), datetime.datetime(2017, 2, 1))
+        newer = self.storage.save_note(notes_entities.Note(
+            title='title', body='body', board_id=self.board.id,
+            modified_at=datetime.datetime(2017, 3, 1)))
+        self.assertEqual(last_modified(), datetime.datetime(2017, 3, 1))
+        self.storage.save_note(newer.replace(board_id=self.other_board.id))
+        self.assertEqual(last_modified(), datetime.datetime(2017, 2, 1))
+        self.storage.delete_note(self.note.id)
+        self.assertEqual(last_modified(), board_modified)
+
+
+class BulkUpdateNotesTestCase(unittest.TestCase):
+    """Tests for moving & editing many notes at once."""
+
+    def setUp(self):
+        self.storage = MemoryStorage()
+        self.board = self.storage.save_board(notes_entities.Board(name='board'))
+        self.other_board = self.storage.save_board(notes_entities.Board(name='other'))
+        self.notes = [self.storage.save_note(
+            notes_entities.Note(title='title', body='body', board_id=self.board.id))
+            for i in range(2)]
+
+    def test_move_notes(self):
+        note_ids = [note.id for note in self.notes]
+
+        moved = self.storage.move_notes(note_ids + [100], self.other_board.id)
+
+        self.assertEqual(moved, note_ids)
+        self.assertEqual(self.storage.get_board_notes(self.board.id), [])
+        self.assertEqual(self.storage.get_note_board_ids(note_ids),
+                         dict.fromkeys(note_ids, self.other_board.id))
+        self.assertEqual(self.storage.move_notes(note_ids, self.other_board.id), [])
+
+    def test_only_notes_on_given_boards_changed(self):
+        note_ids = [note.id for note in self.notes]
+
+        moved = self.storage.move_notes(note_ids, self.other_board.id,
+                                        from_board_ids=[self.other_board.id])
+        updated = self.storage.update_notes(note_ids, {'title': 'Owls'},
+                                            board_ids=[self.other_board.id])
+
+        self.assertEqual((moved, updated), ([], []))
+        self.assertEqual(self.storage.get_note(note_ids[0]).title, 'title')
+
+    def test_update_notes(self):
+        updated = self.storage.update_notes([self.notes[0].id], {'title': 'Owls'})
+
+        self.assertEqual(updated, [self.notes[0].id])
+        self.assertEqual(self.storage.get_note(self.notes[0].id).title, 'Owls')
+        self.assertEqual(self.storage.get_note(self.notes[0].id).version, 2)
+
+
+class PurgeBoardTestCase(unittest.TestCase):
+    """Tests for removing a deleted board's contents in batches."""
+
+    def test_purge_board(self):
+        storage = MemoryStorage()
+        board = storage.save_board(notes_entities.Board(name='board'))
+        storage.save_board_user(board.id, 1, 'owner')
+        notes = [storage.save_note(notes_entities.Note(title='owls', body='b', board_id=board.id))
+                 for i in range(2)]
+        storage.delete_board(board.id)
+
+        first = storage.purge_board(board.id, limit=2)
+        second = storage.purge_board(board.id, limit=2)
+        third = storage.purge_board(board.id, limit=2)
+
+        self.assertEqual((first['user_ids'], first['note_ids']), ([1], [notes[0].id]))
+        self.assertEqual((second['note_ids'], second['changes']), ([notes[1].id], 1))
+        self.assertEqual(third['changes'], 2)
+        self.assertEqual(storage.get_board_notes(board.id), [])
+        self.assertEqual(storage.get_user_boards(1), [])
+        self.assertEqual(storage.search_notes(1, 'owls', ['owner']), [])
+        self.assertEqual(storage.get_board_changes(board.id), [])
+
+
+class IdSequenceTestCase(unittest.TestCase):
+    """Tests for allocating entity IDs."""
+
+    def setUp(self):
+        self.storage = MemoryStorage()
+
+    def test_deleted_id_not_reused(self):
+        first = self.storage.save_note(notes_entities.Note(title='title', body='body'))
+        self.storage.delete_note(first.id)
+
+        second = self.storage.save_note(notes_entities.Note(title='title', body='body'))
+
+        self.assertNotEqual(first.id, second.id)
+
+    def test_explicit_id_advances_sequence(self):
+        self.storage.save_board(notes_entities.Board(id=10, name='board'))
+
+        board = self.storage.save_board(notes_entities.Board(name='board'))
+
+        self.assertEqual(board.id, 11)
+
+    def test_reserve_ids(self):
+        self.storage.save_note(notes_entities.Note(title='title', body='body'))
+
+        ids = self.storage.reserve_ids('note', 3)
+        note = self.storage.save_note(notes_entities.Note(title='title', body='body'))
+
+        self.assertEqual(list(ids), [2, 3, 4])
+        self.assertEqual(note.id, 5)
+
+    def test_reserve_ids_unknown_type(self):
+        with self.assertRaises(ValueError):
+            self.storage.reserve_ids('widget', 3)
+
+
+class VersionTestCase(unittest.TestCase):
+    """Tests for optimistic concurrency control."""
+
+    def setUp(self):
+        self.storage = MemoryStorage()
+        self.note = self.storage.save_note(notes_entities.Note(title='title', body='body'))
+
+    def test_save_increments_version(self):
+        note = self.storage.save_note(self.note.replace(title='new title'))
+
+        self.assertEqual(note.version, self.note.version + 1)
+
+    def test_stale_save_conflicts(self):
+        self.storage.save_note(self.note.replace(title='first edit'))
+
+        with self.assertRaises(self.storage.Conflict):
+            self.storage.save_note(self.note.replace(title='second edit'))
+        self.assertEqual(self.storage.get_note(self.note.id).title, 'first edit')
+
+    def test_stale_save_notes_saves_nothing(self):
+        other = self.storage.save_note(notes_entities.Note(title='other', body='body'))
+        self.storage.save_note(self.note.replace(title='first edit'))
+
+        with self.assertRaises(self.storage.Conflict):
+            self.storage.save_notes([other.replace(title='edit'), self.note.replace(title='edit')])
+        self.assertEqual(self.storage.get_note(other.id).title, 'other')
+
+
+class SearchNotesTestCase(unittest.TestCase):
+    """Tests for full-text search with the word index."""
+
+    def setUp(self):
+        self.storage = MemoryStorage()
+        self.storage.save_board_user(1, 1, 'reader')
+        self.roles = ['reader']
+
+    def save_note(self, title, body, board_id=1):
+        return self.storage.save_note(notes_entities.Note(title=title, body=body,
+                                                          board_id=board_id))
+
+    def search(self, query, **kwargs):
+        return [n.id for n in self.storage.search_notes(1, query, self.roles, **kwargs)]
+
+    def test_title_matches_rank_first(self):
+        in_body = self.save_note('Diary', 'The owls are not what they seem')
+        in_title = self.save_note('Owls', 'Something else entirely')
+        self.save_note('Coffee', 'Damn fine')
+
+        self.assertEqual(self.search('owls'), [in_title.id, in_body.id])
+
+    def test_all_words_required(self):
+        both = self.save_note('Black lodge', 'Red room')
+        self.save_note('White lodge', 'Red room')
+
+        self.assertEqual(self.search('lodge, BLACK!'), [both.id])
+
+    def test_only_readable_boards(self):
+        self.save_note('Owls', 'Owls', board_id=2)
+
+        self.assertEqual(self.search('owls'), [])
+
+    def test_index_follows_edits_and_deletes(self):
+        note = self.save_note('Owls', 'Body')
+        other = self.save_note('Owls', 'Body')
+        board_note = self.save_note('Owls', 'Body', board_id=2)
+
+        self.storage.save_note(note.replace(title='Logs'))
+        self.storage.delete_note(other.id)
+        self.storage.delete_board_notes(2)
+
+        self.assertEqual(self.search('owls'), [])
+        self.assertEqual(self.search('logs'), [note.id])
+        self.assertNotIn(board_note.id, self.storage._note_lengths)
+
+    def test_pages(self):
+        notes = [self.save_note('Owls', 'Body') for i in range(3)]
+
+        pages = [self.search('owls', limit=2), self.search('owls', limit=2, offset=2)]
+
+        self.assertEqual(pages, [[notes[0].id, notes[1].id], [notes[2].id]])
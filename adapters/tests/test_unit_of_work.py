@@ -0,0 +1,115 @@
+"""Test unit of work adapter, wrapping memory storage."""
+
+import unittest
+
+from ..memory_storage import MemoryStorage
+from ..unit_of_work import UnitOfWorkStorage
+from notes import entities as notes_entities
+
+
+class UnitOfWorkTestCase(unittest.TestCase):
+    def setUp(self):
+        self.inner = MemoryStorage()
+        self.storage = UnitOfWorkStorage(self.inner)
+        self.note = self.storage.save_note(notes_entities.Note(title='title', body='body'))
+
+    def test_identity_map(self):
+        with self.storage.unit_of_work():
+            first = self.storage.get_note(self.note.id)
+            del self.inner.notes[self.note.id]
+            second = self.storage.get_note(str(self.note.id))
+
+        self.assertIs(first, second)
+
+    def test_writes_buffered_until_end(self):
+        with self.storage.unit_of_work():
+            self.storage.save_note(self.note.replace(title='new title'))
+            self.assertEqual(self.inner.get_note(self.note.id).title, 'title')
+            self.assertEqual(self.storage.get_note(self.note.id).title, 'new title')
+
+        self.assertEqual(self.inner.get_note(self.note.id).title, 'new title')
+
+    def test_delete_buffered_until_end(self):
+        with self.storage.unit_of_work():
+            self.storage.delete_note(self.note.id)
+            self.inner.get_note(self.note.id)
+            with self.assertRaises(self.storage.DoesNotExist):
+                self.storage.get_note(self.note.id)
+
+        with self.assertRaises(self.storage.DoesNotExist):
+            self.inner.get_note(self.note.id)
+
+    def test_exception_discards_writes(self):
+        with self.assertRaises(RuntimeError):
+            with self.storage.unit_of_work():
+                self.storage.save_note(self.note.replace(title='new title'))
+                raise RuntimeError()
+
+        self.assertEqual(self.inner.get_note(self.note.id).title, 'title')
+        self.assertIsNone(self.storage.work)
+
+    def test_nested_flushes_at_outermost(self):
+        with self.storage.unit_of_work():
+            with self.storage.unit_of_work():
+                self.storage.save_note(self.note.replace(title='new title'))
+            self.assertEqual(self.inner.get_note(self.note.id).title, 'title')
+
+        self.assertEqual(self.inner.get_note(self.note.id).title, 'new title')
+
+    def test_bulk_read_sees_buffered_writes(self):
+        with self.storage.unit_of_work():
+            self.storage.save_note(self.note.replace(title='new title'))
+            notes = self.storage.get_notes([self.note.id])
+
+        self.assertEqual(notes[0].title, 'new title')
+
+    def test_decorator(self):
+        @self.storage.unit_of_work()
+        def edit():
+            self.storage.save_note(self.note.replace(title='new title'))
+            return self.inner.get_note(self.note.id).title
+
+        self.assertEqual(edit(), 'title')
+        self.assertEqual(self.inner.get_note(self.note.id).title, 'new title')
+
+    def test_saved_version(self):
+        """Saves should return the version that will be written, however often they're saved."""
+        with self.storage.unit_of_work():
+            note = self.storage.save_note(self.note.replace(title='new title'))
+            note = self.storage.save_note(note.replace(body='new body'))
+            self.assertEqual(note.version, self.note.version + 1)
+
+        saved = self.inner.get_note(self.note.id)
+        self.assertEqual((saved.title, saved.body), ('new title', 'new body'))
+        self.assertEqual(saved.version, note.version)
+
+    def test_failed_flush_discards_writes(self):
+        self.inner.save_note(self.note.replace(title='changed elsewhere'))
+
+        with self.storage.unit_of_work():
+            self.storage.save_note(self.note.replace(title='new title'))
+            with self.assertRaises(self.storage.Conflict):
+                self.storage.flush()
+
+        self.assertEqual(self.inner.get_note(self.note.id).title, 'changed elsewhere')
+
+    def test_on_commit_waits_for_flush(self):
+        committed = []
+        with self.storage.unit_of_work():
+            self.storage.save_note(self.note.replace(title='new title'))
+            self.storage.on_commit(lambda: committed.append(self.inner.get_note(self.note.id)))
+            self.assertEqual(committed, [])
+
+        self.assertEqual([note.title for note in committed], ['new title'])
+
+    def test_on_commit_dropped_on_conflict(self):
+        committed = []
+        self.inner.save_note(self.note.replace(title='changed elsewhere'))
+
+        with self.storage.unit_of_work():
+            self.storage.save_note(self.note.replace(title='new title'))
+            self.storage.on_commit(lambda: committed.append(True))
+            with self.assertRaises(self.storage.Conflict):
+                self.storage.flush()
+
+        self.assertEqual(committed, [])
@@ -0,0 +1,304 @@
+"""Storage adapter that adds a request-scoped identity map & unit of work to another adapter.
+
+Inside a unit of work (usually one request), repeated reads of the same note or board return the
+entity that was already loaded, and changes to existing notes & boards, plus note deletions, are
+buffered. They are written in one transaction when the unit of work ends:
+>>> storage = UnitOfWorkStorage(DjangoStorage())
+>>> @storage.unit_of_work()
+... def edit_note(request):
+...     ...
+
+New entities are still saved immediately, since callers need their IDs. Any other write, and any
+read of notes that can't be answered from the identity map, first flushes the buffered writes, so
+that the wrapped storage sees writes in the order they were made. Callbacks passed to on_commit
+while writes are buffered run once they are flushed, or are dropped if the flush fails. Outside a
+unit of work, every call is passed straight through.
+"""
+
+import contextlib
+import threading
+
+from .storage import StorageWrapper
+
+
+class UnitOfWork():
+    """Identity map & buffered writes for a single scope."""
+
+    def __init__(self):
+        self.depth = 0
+        self.notes = {}
+        self.boards = {}
+        self.dirty_notes = {}
+        self.dirty_boards = {}
+        self.deleted_notes = {}
+        self.callbacks = []
+
+    @property
+    def pending(self):
+        return bool(self.dirty_notes or self.dirty_boards or self.deleted_notes)
+
+
+class _UnitOfWorkScope(contextlib.ContextDecorator):
+    """Context manager & decorator that runs code within a unit of work."""
+
+    def __init__(self, storage):
+        self.storage = storage
+
+    def __enter__(self):
+        self.storage.begin()
+        return self.storage
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.storage.end(commit=exc_type is None)
+        return False
+
+
+class UnitOfWorkStorage(StorageWrapper):
+    """Adapter that buffers writes & caches loaded entities within a unit of work."""
+
+    def __init__(self, storage):
+        super().__init__(storage)
+        self._local = threading.local()
+
+    @property
+    def work(self):
+        """Current thread's unit of work, or None."""
+        return getattr(self._local, 'work', None)
+
+    def unit_of_work(self):
+        """Return context manager/decorator for a unit of work. Units of work can be nested."""
+        return _UnitOfWorkScope(self)
+
+    def begin(self):
+        if self.work is None:
+            self._local.work = UnitOfWork()
+        self.work.depth += 1
+
+    def end(self, commit=True):
+        """Leave unit of work, flushing buffered writes if it was the outermost."""
+        work = self.work
+        work.depth -= 1
+        if work.depth > 0:
+            return
+        try:
+            if commit:
+                self.flush()
+        finally:
+            self._local.work = None
+
+    def on_commit(self, callback):
+        work = self.work
+        if work is None or not work.pending:
+            return self.storage.on_commit(callback)
+        work.callbacks.append(callback)
+
+    def flush(self):
+        """Write all buffered changes to the wrapped storage, then run on_commit callbacks."""
+        work = self.work
+        if work is None or not work.pending:
+            return
+
+        writes = len(work.dirty_notes) + len(work.dirty_boards) + bool(work.deleted_notes)
+        transaction = self.storage.atomic() if writes > 1 else _no_transaction()
+        try:
+            with transaction:
+                if len(work.dirty_notes) > 1:
+                    saved = self.storage.save_notes(list(work.dirty_notes.values()))
+                else:
+                    saved = [self.storage.save_note(note) for note in work.dirty_notes.values()]
+                for board in work.dirty_boards.values():
+                    work.boards[_key(board.id)] = self.storage.save_board(board)
+                if work.deleted_notes:
+                    self.storage.delete_notes(list(work.deleted_notes.values()))
+        except Exception:
+            # Buffered writes can't be applied (eg Conflict), so forget them & what we loaded
+            work.notes.clear()
+            work.boards.clear()
+            raise
+        else:
+            work.notes.update((_key(note.id), note) for note in saved)
+        finally:
+            work.dirty_notes.clear()
+            work.dirty_boards.clear()
+            work.deleted_notes.clear()
+            callbacks, work.callbacks = work.callbacks, []
+
+        for callback in callbacks:
+            self.storage.on_commit(callback)
+
+    def _flushed(method_name):
+        """Make a method that flushes buffered writes, then passes the call through."""
+        def method(self, *args, **kwargs):
+            self.flush()
+            return getattr(self.storage, method_name)(*args, **kwargs)
+        method.__name__ = method_name
+        return method
+
+    def get_note(self, id):
+        work = self.work
+        if work is None:
+            return self.storage.get_note(id=id)
+        if _key(id) in work.deleted_notes:
+            raise self.DoesNotExist('Note {} was not found'.format(id))
+        if _key(id) not in work.notes:
+            work.notes[_key(id)] = self.storage.get_note(id=id)
+        return work.notes[_key(id)]
+
+    def get_note_with_role(self, id, user_id):
+        work = self.work
+        if work is None:
+            return self.storage.get_note_with_role(id=id, user_id=user_id)
+        if _key(id) in work.notes or _key(id) in work.deleted_notes:
+            note = self.get_note(id)
+            return note, self.storage.get_role(user_id=user_id, board_id=note.board_id)
+
+        note, role = self.storage.get_note_with_role(id=id, user_id=user_id)
+        work.notes[_key(id)] = note
+        return note, role
+
+    def get_note_version_with_role(self, id, user_id):
+        work = self.work
+        if work is None or not (_key(id) in work.notes or _key(id) in work.deleted_notes):
+            return self.storage.get_note_version_with_role(id=id, user_id=user_id)
+        note = self.get_note(id)
+        return note.version, self.storage.get_role(user_id=user_id, board_id=note.board_id)
+
+    def save_note(self, note):
+        work = self.work
+        if work is None:
+            return self.storage.save_note(note)
+        if note.id is None:
+            self.flush()
+            note = self.storage.save_note(note)
+        else:
+            note = self._buffer(work.dirty_notes, note)
+        work.notes[_key(note.id)] = note
+        return note
+
+    def _buffer(self, dirty, entity):
+        """Buffer save of existing entity, returning it with the version it will be saved as.
+
+        However many times an entity is saved within the unit of work, it is written once, checked
+        against the version it had when first saved.
+        """
+        key = _key(entity.id)
+        pending = dirty.get(key)
+        if pending is None:
+            dirty[key] = entity
+        elif entity.version == pending.version + 1:
+            dirty[key] = entity.replace(version=pending.version)
+            return entity
+        else:
+            raise self.Conflict('{} {} was changed since it was loaded (version {} is out of date).'
+                                .format(type(entity).__name__, entity.id, entity.version))
+        return entity.replace(version=entity.version + 1)
+
+    def delete_note(self, id):
+        work = self.work
+        if work is None:
+            return self.storage.delete_note(id=id)
+        # Make sure note exists, as the wrapped storage would
+        note = self.get_note(id)
+        work.dirty_notes.pop(_key(id), None)
+        del work.notes[_key(id)]
+        work.deleted_notes[_key(id)] = note.id
+        return True
+
+    def get_board(self, id):
+        work = self.work
+        if work is None:
+            return self.storage.get_board(id=id)
+        if _key(id) not in work.boards:
+            work.boards[_key(id)] = self.storage.get_board(id=id)
+        return work.boards[_key(id)]
+
+    def save_board(self, board):
+        work = self.work
+        if work is None:
+            return self.storage.save_board(board)
+        if board.id is None:
+            self.flush()
+            board = self.storage.save_board(board)
+        else:
+            board = self._buffer(work.dirty_boards, board)
+        work.boards[_key(board.id)] = board
+        return board
+
+    def delete_board(self, id):
+        self.flush()
+        board = self.storage.delete_board(id=id)
+        if self.work is not None:
+            self.work.boards.pop(_key(id), None)
+        return board
+
+    def purge_board(self, board_id, limit):
+        self.flush()
+        purged = self.storage.purge_board(board_id=board_id, limit=limit)
+        self._forget_notes(purged['note_ids'])
+        return purged
+
+    def delete_board_notes(self, board_id):
+        self.flush()
+        result = self.storage.delete_board_notes(board_id=board_id)
+        if self.work is not None:
+            self.work.notes.clear()
+        return result
+
+    def save_notes(self, notes):
+        self.flush()
+        saved = self.storage.save_notes(notes)
+        if self.work is not None:
+            self.work.notes.update((_key(note.id), note) for note in saved)
+        return saved
+
+    def move_notes(self, ids, board_id, from_board_ids=None):
+        self.flush()
+        ids = list(ids)
+        result = self.storage.move_notes(ids=ids, board_id=board_id, from_board_ids=from_board_ids)
+        self._forget_notes(ids)
+        return result
+
+    def update_notes(self, ids, fields, board_ids=None):
+        self.flush()
+        ids = list(ids)
+        result = self.storage.update_notes(ids=ids, fields=fields, board_ids=board_ids)
+        self._forget_notes(ids)
+        return result
+
+    def _forget_notes(self, ids):
+        """Drop notes changed in the wrapped storage from the identity map."""
+        if self.work is not None:
+            for id in ids:
+                self.work.notes.pop(_key(id), None)
+
+    def delete_notes(self, ids):
+        self.flush()
+        ids = list(ids)
+        result = self.storage.delete_notes(ids=ids)
+        self._forget_notes(ids)
+        return result
+
+    # Roles & board users don't depend on buffered writes, so those reads are passed through as is
+    create_user = _flushed('create_user')
+    save_board_user = _flushed('save_board_user')
+    get_notes = _flushed('get_notes')
+    get_note_board_ids = _flushed('get_note_board_ids')
+    get_board_notes = _flushed('get_board_notes')
+    get_user_boards = _flushed('get_user_boards')
+    delete_board_user = _flushed('delete_board_user')
+    delete_board_users = _flushed('delete_board_users')
+    search_notes = _flushed('search_notes')
+    get_board_changes = _flushed('get_board_changes')
+    get_last_change_seq = _flushed('get_last_change_seq')
+
+    del _flushed
+
+
+def _key(id):
+    # IDs may arrive as strings from URLs
+    return str(id)
+
+
+@contextlib.contextmanager
+def _no_transaction():
+    yield
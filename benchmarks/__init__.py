@@ -0,0 +1,4 @@
+"""Microbenchmarks for performance sensitive code paths.
+
+Each module can be run directly, eg `python -m benchmarks.permission_decorator`.
+"""
@@ -0,0 +1,48 @@
+"""Measure overhead of the @permission action decorator.
+
+Compares the previous style of permission check (a tuple of permission names, checked with `in`)
+against the compiled PermissionSet bitmask check, for the first and last permissions of the owner
+role, and against an undecorated method as a baseline.
+"""
+
+import timeit
+
+from topsy.action_decorators import permission
+from topsy.permissions import board_permissions
+
+NUMBER = 1000000
+
+owner_tuple = tuple(board_permissions['owner'])
+owner_set = board_permissions['owner']
+
+
+class Actions():
+    def undecorated(self, note_id):
+        return note_id
+
+    @permission('view_notes')
+    def first_permission(self, note_id):
+        return note_id
+
+    @permission('delete')
+    def last_permission(self, note_id):
+        return note_id
+
+
+def run(number=NUMBER):
+    actions = Actions()
+    cases = [
+        ('undecorated', lambda: actions.undecorated(1)),
+        ('tuple, first permission', lambda: actions.first_permission(1, permissions=owner_tuple)),
+        ('tuple, last permission', lambda: actions.last_permission(1, permissions=owner_tuple)),
+        ('bitmask, first permission', lambda: actions.first_permission(1, permissions=owner_set)),
+        ('bitmask, last permission', lambda: actions.last_permission(1, permissions=owner_set)),
+    ]
+
+    for name, func in cases:
+        seconds = min(timeit.repeat(func, number=number, repeat=3))
+        print('{:<28}{:>8.1f} ns/call'.format(name, seconds / number * 1e9))
+
+
+if __name__ == '__main__':
+    run()
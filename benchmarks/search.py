@@ -0,0 +1,118 @@
+"""Measure full-text search over a large corpus of notes.
+
+Builds a corpus (1M notes by default) from a Zipf-distributed vocabulary, spread over boards the
+searching user can read and boards they can't, then times search_notes for rare, common and
+multi-word queries. MemoryStorage is searched with its word index, and DjangoStorage with its FTS5
+table, in a temporary SQLite database.
+
+Run with `python -m benchmarks.search [number of notes] [memory|django]`. The memory index needs
+a few GB of RAM for 1M notes.
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+NUMBER_OF_NOTES = 1000000
+BOARDS = 100
+VOCABULARY = 20000
+TITLE_WORDS = 3
+BODY_WORDS = 8
+REPEAT = 20
+
+QUERIES = [
+    ('rare word', 'w19000'),
+    ('common word', 'w3'),
+    ('two common words', 'w3 w5'),
+    ('common & rare word', 'w3 w15000'),
+]
+
+
+def corpus(number):
+    """Generate (board_id, title, body) for each note. Odd numbered boards are readable."""
+    rng = random.Random(0)
+    weights = [1 / rank for rank in range(1, VOCABULARY + 1)]
+    words = ['w{}'.format(i) for i in range(VOCABULARY)]
+    batch = 10000
+    for start in range(0, number, batch):
+        count = min(batch, number - start)
+        per_note = TITLE_WORDS + BODY_WORDS
+        sample = rng.choices(words, weights, k=count * per_note)
+        for i in range(count):
+            note_words = sample[i * per_note:(i + 1) * per_note]
+            yield (rng.randint(1, BOARDS), ' '.join(note_words[:TITLE_WORDS]),
+                   ' '.join(note_words[TITLE_WORDS:]))
+
+
+def time_queries(search):
+    for name, query in QUERIES:
+        start = time.perf_counter()
+        for i in range(REPEAT):
+            results = search(query)
+        seconds = (time.perf_counter() - start) / REPEAT
+        print('  {:<22}{:>9.2f} ms/query  ({} results)'.format(name, seconds * 1e3, len(results)))
+
+
+def run_memory(number):
+    from adapters.memory_storage import MemoryStorage
+    from notes.entities import Note
+
+    storage = MemoryStorage()
+    for board_id in range(1, BOARDS + 1, 2):
+        storage.save_board_user(board_id, 1, 'reader')
+
+    start = time.perf_counter()
+    for board_id, title, body in corpus(number):
+        storage.save_note(Note(title=title, body=body, board_id=board_id))
+    print('MemoryStorage: indexed {} notes in {:.0f} s'.format(
+        number, time.perf_counter() - start))
+
+    time_queries(lambda query: storage.search_notes(1, query, ['reader'], limit=20))
+
+
+def run_django(number):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'topsy.settings')
+    directory = tempfile.TemporaryDirectory()
+    from django.conf import settings
+    settings.DATABASES['default']['NAME'] = os.path.join(directory.name, 'search.sqlite3')
+
+    import django
+    django.setup()
+    from django.core.management import call_command
+    from django.db import connection, transaction
+    from accounts.entities import User
+    from adapters.django_storage import DjangoStorage
+    from notes.entities import Board
+
+    call_command('migrate', verbosity=0)
+    storage = DjangoStorage()
+    user = storage.create_user(User(name='Bob', email='bob@example.com'), 'p4ssw0rd')
+    for board_id in range(1, BOARDS + 1):
+        storage.save_board(Board(id=board_id, name='board'))
+        if board_id % 2:
+            storage.save_board_user(board_id, user.id, 'reader')
+
+    start = time.perf_counter()
+    with transaction.atomic(), connection.cursor() as cursor:
+        # The FTS index is filled by triggers as notes are inserted
+        cursor.executemany('INSERT INTO notes_note (board_id, title, body, status, version) '
+                           'VALUES (%s, %s, %s, "active", 1)', corpus(number))
+    print('DjangoStorage (SQLite FTS5): indexed {} notes in {:.0f} s'.format(
+        number, time.perf_counter() - start))
+
+    time_queries(lambda query: storage.search_notes(user.id, query, ['reader'], limit=20))
+    directory.cleanup()
+
+
+def run(number=NUMBER_OF_NOTES, backends=('memory', 'django')):
+    if 'memory' in backends:
+        run_memory(number)
+    if 'django' in backends:
+        run_django(number)
+
+
+if __name__ == '__main__':
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else NUMBER_OF_NOTES
+    run(number, sys.argv[2:] or ('memory', 'django'))
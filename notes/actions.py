@@ -5,47 +5,209 @@ behavior to actions performaned by users. The examples we show are decorators fo
 transation data and checking permissions on a per-action basis.
 """
 
-from topsy.action_decorators import permission, log
+from topsy.action_decorators import permission, log, publish
+from topsy.permissions import PermissionError
 from .use_cases import NoteUseCases
 
 
 class NoteActions():
-    def __init__(self, storage, logging):
-        self.use_cases = NoteUseCases(storage)
+    def __init__(self, storage, logging, role_cache=None, events=None, jobs=None):
+        """Instantiate with storage & logging. Pass an event log to publish each board's changes,
+        and a job queue to delete boards in the background."""
+        self.use_cases = NoteUseCases(storage, role_cache=role_cache, jobs=jobs)
+        self.storage = storage
         self.logging = logging
+        self.events = events
 
     # Anyone can create a board anytime, no permissions required
     @log('board.create')
+    @publish('board.create')
     def create_board(self, name, user_id):
         return self.use_cases.create_board(name, user_id)
 
     @log('board.delete')
     @permission('delete')
+    @publish('board.delete')
     def delete_board(self, id):
         return self.use_cases.delete_board(id)
 
+    # Lines are passed positionally, to keep the file or request out of the log
+    @permission('add_note')
+    @log('board.import_notes')
+    def import_notes(self, board_id, lines, user_id, batch_size=500):
+        return self.use_cases.import_notes(lines, user_id, board_id, batch_size=batch_size)
+
+    # Only lists boards the user is on, so no permissions are needed
+    def get_user_boards(self, user_id):
+        return self.use_cases.get_user_boards(user_id)
+
+    # The board is marked deleted straight away, and its contents purged by a job
+    @log('board.delete')
+    @permission('delete')
+    @publish('board.delete')
+    def start_board_deletion(self, id, user_id):
+        board, job = self.use_cases.start_board_deletion(id, user_id=user_id)
+        return {'board_id': board.id, 'board': board.asdict(), 'job': job.asdict()}
+
     # We're not going to log every view request, but we will check permissions
     @permission('view_notes')
     def get_board(self, board_id):
         return self.use_cases.get_board(board_id)
 
+    # Waits up to timeout seconds for events after the given offset in the board's change feed
+    @permission('view_notes')
+    def get_board_events(self, board_id, after=0, limit=100, timeout=0):
+        return self.events.wait(board_id, after=after, limit=limit, timeout=timeout)
+
+    @permission('view_notes')
+    @log('board.export')
+    def export_board(self, board_id, after_id=None):
+        return self.use_cases.export_board(board_id, after_id=after_id)
+
+    @permission('view_notes')
+    def sync_board(self, board_id, token=None, limit=1000):
+        return self.use_cases.sync_board(board_id, token=token, limit=limit)
+
+    @permission('view_notes')
+    def get_board_notes(self, board_id, after_id=None, limit=None):
+        return self.use_cases.get_board_notes(board_id, after_id=after_id, limit=limit)
+
+    @permission('view_notes')
+    def iter_board_notes(self, board_id):
+        return self.use_cases.iter_board_notes(board_id)
+
+    # Note entity can be passed if it was already loaded to check permissions (see
+    # NoteUseCases.get_note_with_role), to save loading it again.
     @permission('view_notes') # Permissions should be for parent board object
-    def get_note(self, note_id):
+    def get_note(self, note_id, note=None):
+        if note is not None:
+            return note
         return self.use_cases.get_note(note_id)
 
+    # Version is passed in after loading it alongside the role to check permissions (see
+    # NoteUseCases.get_note_version_with_role).
     @permission('view_notes') # Permissions should be for parent board object
+    def get_note_version(self, note_id, version):
+        return version
+
+    def get_notes(self, note_ids, permissions):
+        """Get many notes, checking view_notes permission on each parent board.
+
+        Since notes may belong to different boards, permissions is a function that takes a set of
+        board IDs and returns a dictionary mapping each to permissions, eg
+        functools.partial(get_perms.many, user_id).
+
+        Returns dictionary of notes found, and IDs of notes that are missing or forbidden.
+        """
+        notes = self.use_cases.get_notes(note_ids)
+        board_perms = permissions({note.board_id for note in notes})
+
+        found = {note.id for note in notes}
+        allowed, forbidden = [], []
+        for note in notes:
+            if 'view_notes' in board_perms[note.board_id]:
+                allowed.append(note)
+            else:
+                forbidden.append(note.id)
+
+        return {
+            'notes': allowed,
+            'missing': [id for id in note_ids if id not in found],
+            'forbidden': forbidden
+        }
+
+    # Like get_notes, permissions is a function that takes a set of board IDs, eg
+    # functools.partial(get_perms.many, user_id). It's passed positionally so it isn't logged.
+    @log('note.move_many')
+    @publish('note.move_many')
+    def move_notes(self, permissions, note_ids, board_id):
+        """Move many notes to a board, with delete_note permission on their boards & add_note on
+        the new one. If any permission is missing, PermissionError is raised and nothing is moved.
+
+        Returns dictionary with IDs of the notes moved, missing & skipped, and of every board
+        affected. Notes are skipped if they were moved to a board whose permissions weren't checked
+        after they were looked up.
+        """
+        note_boards = self.use_cases.get_note_board_ids(note_ids)
+        board_perms = permissions(set(note_boards.values()) | {board_id})
+        _check_boards(board_perms, 'add_note', [board_id])
+        _check_boards(board_perms, 'delete_note', note_boards.values())
+
+        moved = self.use_cases.move_notes(list(note_boards), board_id,
+                                          from_board_ids=set(note_boards.values()))
+        return {
+            'board_id': board_id,
+            'board_ids': sorted(set(note_boards[id] for id in moved) | {board_id}),
+            'notes': moved,
+            'missing': [id for id in note_ids if id not in note_boards],
+            'skipped': [id for id in note_boards
+                        if id not in moved and note_boards[id] != board_id]
+        }
+
+    @log('note.edit_many')
+    @publish('note.edit_many')
+    def edit_notes(self, permissions, note_ids, fields):
+        """Set the same field values on many notes, with edit_note permission on their boards.
+
+        permissions is a function, as for move_notes. Returns dictionary with IDs of the notes
+        edited, missing & skipped (as for move_notes), and of every board affected.
+        """
+        note_boards = self.use_cases.get_note_board_ids(note_ids)
+        _check_boards(permissions(set(note_boards.values())), 'edit_note', note_boards.values())
+
+        edited = self.use_cases.edit_notes(list(note_boards), fields,
+                                           board_ids=set(note_boards.values()))
+        return {
+            'board_ids': sorted(set(note_boards[id] for id in edited)),
+            'notes': edited,
+            'missing': [id for id in note_ids if id not in note_boards],
+            'skipped': [id for id in note_boards if id not in edited]
+        }
+
+    # Results are limited to boards the user can read, so no permissions are needed
+    def search_notes(self, user_id, query, limit=20, offset=0):
+        return self.use_cases.search_notes(user_id, query, limit=limit, offset=offset)
+
+    @permission('add_note')
+    @log('note.create')
+    @publish('note.create')
+    def create_note(self, board_id, note_dict, user_id):
+        return self.use_cases.create_note(dict(note_dict, board_id=board_id), user_id)
+
+    # Note entity must be passed, after loading it to check permissions, so it can be published
+    @permission('delete_note') # Permissions should be for parent board object
+    @log('note.delete')
+    @publish('note.delete')
+    def delete_note(self, note_id, note):
+        self.use_cases.delete_note(note_id)
+        return note
+
+    @permission('edit_note') # Permissions should be for parent board object
     @log('note.edit')
-    def edit_note(self, note_id, title=None, body=None):
-        return self.use_cases.edit_note(note_id, title=title, body=body)
+    @publish('note.edit')
+    def edit_note(self, note_id, title=None, body=None, note=None, version=None):
+        return self.use_cases.edit_note(note_id, title=title, body=body, note=note,
+                                        version=version)
 
     # Adding user to a board requires permissions, and we want to log the transaction
     @permission('add_user')
     @log('board.add_user')
+    @publish('board.add_user')
     def add_user_to_board(self, board_id, user_id, role):
         # Could have other side effects here, like sending a notification to the user added
         return self.use_cases.add_user_to_board(board_id, user_id, role)
 
     @permission('remove_user')
     @log('board.remove_user')
+    @publish('board.remove_user')
     def remove_user_from_board(self, board_id, user_id):
         return self.use_cases.remove_user_from_board(board_id, user_id)
+
+
+def _check_boards(board_perms, permission_required, board_ids):
+    """Raise PermissionError unless permission is in the permissions for every board."""
+    forbidden = sorted(set(board_id for board_id in board_ids
+                           if permission_required not in board_perms[board_id]), key=str)
+    if forbidden:
+        raise PermissionError('User lacks permission: {} (boards {})'.format(
+            permission_required, ', '.join(str(board_id) for board_id in forbidden)))
@@ -37,6 +37,7 @@ class Note(Entity):
     created_at = attr.ib(default=datetime.utcnow())
     modified_at = attr.ib(default=datetime.utcnow())
     status = attr.ib(default='active')
+    version = attr.ib(default=0)
 
 
 @attr.s(frozen=True)
@@ -48,3 +49,20 @@ class Board(Entity):
     created_at = attr.ib(default=datetime.utcnow())
     modified_at = attr.ib(default=datetime.utcnow())
     status = attr.ib(default='active')
+    version = attr.ib(default=0)
+
+
+@attr.s(frozen=True)
+class Change(Entity):
+    """Entry in a board's change log, which lets clients sync only what changed since they last did.
+
+    entity is 'note' or 'board_user', and entity_id the note or user ID. action is 'saved' or
+    'deleted', or 'cleared' if every entity of that type was removed from the board at once (in
+    which case entity_id is None). seq orders all changes, and is assigned by storage.
+    """
+
+    board_id = attr.ib()
+    entity = attr.ib()
+    entity_id = attr.ib()
+    action = attr.ib()
+    seq = attr.ib(default=None)
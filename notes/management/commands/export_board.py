@@ -0,0 +1,63 @@
+"""Export a board's metadata, members & notes to a gzip-compressed NDJSON file.
+
+    python manage.py export_board 12 board-12.ndjson.gz
+
+Notes are read one page at a time and compressed as they are written, so boards of any size can be
+exported. If an export is interrupted, the file is still closed as a complete gzip file, and the ID
+of the last note in it is reported; resume with --after to write the remaining notes to another
+file. gzip files can be concatenated, eg `cat board-12.ndjson.gz board-12-rest.ndjson.gz`, though
+the board row is repeated in each.
+"""
+
+import gzip
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+
+from adapters.django_storage import DjangoStorage
+from notes.use_cases import NoteUseCases
+
+
+class Command(BaseCommand):
+    help = 'Export a board to a gzip-compressed file of newline-delimited JSON objects.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('board_id', type=int)
+        parser.add_argument('path', help='File to write, or - for standard output')
+        parser.add_argument('--after', type=int, dest='after_id',
+                            help='Only export notes after this note ID, to resume an export')
+        parser.add_argument('--page-size', type=int, default=1000,
+                            help='Number of notes read per query')
+
+    def handle(self, board_id, path, after_id, page_size, **options):
+        storage = DjangoStorage()
+        try:
+            rows = NoteUseCases(storage).export_board(board_id, after_id=after_id,
+                                                      page_size=page_size)
+        except storage.DoesNotExist as e:
+            raise CommandError(str(e))
+
+        self.notes, self.last_id = 0, after_id
+        try:
+            if path == '-':
+                self._write(sys.stdout.buffer, rows)
+            else:
+                with open(path, 'wb') as f:
+                    self._write(f, rows)
+        except (Exception, KeyboardInterrupt):
+            if self.last_id is not None:
+                self.stderr.write('Export stopped; resume with --after {}'.format(self.last_id))
+            raise
+
+        self.stderr.write('Exported {} notes (last note ID {}).'.format(self.notes, self.last_id))
+
+    def _write(self, f, rows):
+        # Closing the GzipFile, even on error, finishes the file with everything written so far
+        encoder = DjangoJSONEncoder()
+        with gzip.GzipFile(fileobj=f, mode='wb') as gzip_file:
+            for row in rows:
+                gzip_file.write((encoder.encode(row) + '\n').encode('utf8'))
+                if row['type'] == 'note':
+                    self.notes += 1
+                    self.last_id = row['note']['id']
@@ -0,0 +1,56 @@
+"""Import notes into a board from a file with one JSON object per line (NDJSON).
+
+    python manage.py import_notes 12 notes.ndjson --user 3
+
+Notes are saved in batches, each in its own transaction, and the file is read a line at a time,
+so files of any size can be imported. Invalid lines are skipped and reported.
+"""
+
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from adapters.django_storage import DjangoStorage
+from notes.use_cases import NoteUseCases
+
+
+class Command(BaseCommand):
+    help = 'Import notes into a board from a file of newline-delimited JSON objects.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('board_id', type=int)
+        parser.add_argument('path', help='NDJSON file to import, or - for standard input')
+        parser.add_argument('--user', type=int, dest='user_id',
+                            help='ID of the user importing the notes (required)')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of notes saved per transaction')
+
+    def handle(self, board_id, path, user_id, batch_size, **options):
+        if user_id is None:
+            raise CommandError('User ID is required (--user).')
+        storage = DjangoStorage()
+        try:
+            storage.get_board(board_id)
+        except storage.DoesNotExist as e:
+            raise CommandError(str(e))
+        if batch_size < 1:
+            raise CommandError('Batch size must be at least 1.')
+
+        use_cases = NoteUseCases(storage)
+        if path == '-':
+            result = use_cases.import_notes(sys.stdin.buffer, user_id, board_id,
+                                            batch_size=batch_size)
+        else:
+            try:
+                f = open(path, 'rb')
+            except OSError as e:
+                raise CommandError(str(e))
+            with f:
+                result = use_cases.import_notes(f, user_id, board_id, batch_size=batch_size)
+
+        for error in result['errors']:
+            self.stderr.write('Line {line}: {error}'.format(**error))
+        if result['failed'] > len(result['errors']):
+            self.stderr.write('... and {} more errors'.format(
+                result['failed'] - len(result['errors'])))
+        self.stdout.write('Imported {imported} notes; {failed} lines failed.'.format(**result))
@@ -0,0 +1,75 @@
+"""Run background jobs, eg purging deleted boards, from the database job queue.
+
+    python manage.py run_jobs --workers 2
+
+Each worker process runs one job at a time, polling the queue when it's empty. Boards are purged
+in batches of --batch-size rows, each in its own short transaction, with --pause seconds between
+batches so requests can still write to the database. Pass --once to run queued jobs & exit.
+"""
+
+import multiprocessing
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from adapters.caching_storage import CachingStorage
+from adapters.django_cache import DjangoCache
+from adapters.django_jobs import DjangoJobQueue
+from adapters.django_logging import django_logging
+from adapters.django_storage import DjangoStorage
+from notes.use_cases import NoteUseCases, PURGE_BOARD_JOB
+from topsy.jobs import JobWorker
+from topsy.permissions import RoleCache
+
+
+class Command(BaseCommand):
+    help = 'Run background jobs from the job queue.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Number of worker processes')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit when there are no more jobs, instead of waiting for more')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of rows removed per transaction when purging a board')
+        parser.add_argument('--pause', type=float, default=0.1,
+                            help='Seconds to pause between batches')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds between checks for new jobs when the queue is empty')
+
+    def handle(self, workers, once, batch_size, pause, poll_interval, **options):
+        if workers < 1 or batch_size < 1:
+            raise CommandError('Workers & batch size must be at least 1.')
+
+        if workers == 1:
+            return self._work(once, batch_size, pause, poll_interval)
+
+        # Children must open their own database connections
+        connections.close_all()
+        processes = [multiprocessing.Process(target=self._work,
+                                             args=(once, batch_size, pause, poll_interval))
+                     for i in range(workers)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+    def _work(self, once, batch_size, pause, poll_interval):
+        # Same cache aliases as requests use. Purged notes & roles are only invalidated for requests
+        # if those are a shared backend (eg memcached); with per-process local memory, requests may
+        # still serve them until they expire, after the 'permissions' TIMEOUT for roles (60s) and
+        # CachingStorage's DEFAULT_TTLS for notes (300s). Users already lost access to the board
+        # when its deletion started, so those stale entries don't grant access to the notes.
+        storage = CachingStorage(DjangoStorage(), DjangoCache('storage'))
+        use_cases = NoteUseCases(storage, role_cache=RoleCache(DjangoCache('permissions')))
+
+        def purge_board(board_id, progress):
+            use_cases.purge_board(board_id, batch_size=batch_size, pause=pause,
+                                  progress=progress)
+
+        worker = JobWorker(DjangoJobQueue(), {PURGE_BOARD_JOB: purge_board}, django_logging,
+                           poll_interval=poll_interval)
+        try:
+            worker.run(once=once)
+        except KeyboardInterrupt:
+            pass
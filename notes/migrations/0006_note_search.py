@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+# Full-text index of note titles & bodies, kept in sync with the notes table by triggers, so that
+# every write path (including bulk inserts & deletes) updates it in the same transaction.
+FORWARD_SQL = [
+    "CREATE VIRTUAL TABLE notes_note_fts USING fts5("
+    "title, body, content='notes_note', content_rowid='id')",
+    "CREATE TRIGGER notes_note_fts_insert AFTER INSERT ON notes_note BEGIN "
+    "INSERT INTO notes_note_fts (rowid, title, body) VALUES (new.id, new.title, new.body); "
+    "END",
+    "CREATE TRIGGER notes_note_fts_delete AFTER DELETE ON notes_note BEGIN "
+    "INSERT INTO notes_note_fts (notes_note_fts, rowid, title, body) "
+    "VALUES ('delete', old.id, old.title, old.body); "
+    "END",
+    "CREATE TRIGGER notes_note_fts_update AFTER UPDATE OF title, body ON notes_note BEGIN "
+    "INSERT INTO notes_note_fts (notes_note_fts, rowid, title, body) "
+    "VALUES ('delete', old.id, old.title, old.body); "
+    "INSERT INTO notes_note_fts (rowid, title, body) VALUES (new.id, new.title, new.body); "
+    "END",
+    "INSERT INTO notes_note_fts (notes_note_fts) VALUES ('rebuild')",
+]
+
+REVERSE_SQL = [
+    "DROP TRIGGER notes_note_fts_update",
+    "DROP TRIGGER notes_note_fts_delete",
+    "DROP TRIGGER notes_note_fts_insert",
+    "DROP TABLE notes_note_fts",
+]
+
+
+def run_sql(statements):
+    def run(apps, schema_editor):
+        # FTS5 is SQLite only
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0005_change_log'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_sql(FORWARD_SQL), run_sql(REVERSE_SQL)),
+    ]
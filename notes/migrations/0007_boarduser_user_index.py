@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.6 on 2026-10-18 16:12
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('notes', '0006_note_search'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='boarduser',
+            index_together=set([('user', 'board', 'role')]),
+        ),
+    ]
@@ -25,7 +25,8 @@ class NoteManager(models.Manager):
             created_by=entity.created_by,
             created_at=entity.created_at,
             modified_at=entity.modified_at,
-            status=entity.status
+            status=entity.status,
+            version=entity.version
         )
 
 
@@ -39,6 +40,8 @@ class Note(models.Model):
     created_at = models.DateField(null=True)
     modified_at = models.DateField(null=True)
     status = models.CharField(max_length=50, default='active')
+    # Incremented on every save, for optimistic concurrency control
+    version = models.IntegerField(default=1)
 
     objects = NoteManager()
 
@@ -55,11 +58,12 @@ class Note(models.Model):
             id=self.id,
             title=self.title,
             body=self.body,
-            board_id=self.board.id if self.board else None,
+            board_id=self.board_id,
             created_by=self.created_by,
             created_at=self.created_at,
             modified_at=self.modified_at,
-            status=self.status
+            status=self.status,
+            version=self.version
         )
 
 
@@ -72,7 +76,8 @@ class BoardManager(models.Manager):
             name=entity.name,
             created_at=entity.created_at,
             modified_at=entity.modified_at,
-            status=entity.status
+            status=entity.status,
+            version=entity.version
         )
 
 
@@ -83,6 +88,8 @@ class Board(models.Model):
     created_at = models.DateField(null=True)
     modified_at = models.DateField(null=True)
     status = models.CharField(max_length=50, default='active')
+    # Incremented on every save, for optimistic concurrency control
+    version = models.IntegerField(default=1)
 
     objects = BoardManager()
 
@@ -100,7 +107,8 @@ class Board(models.Model):
             name=self.name,
             created_at=self.created_at,
             modified_at=self.modified_at,
-            status=self.status
+            status=self.status,
+            version=self.version
         )
 
 
@@ -111,9 +119,56 @@ class BoardUser(models.Model):
     user = models.ForeignKey('accounts.User')
     role = models.CharField(max_length=150)
 
+    class Meta:
+        # Covers listing a user's boards, and looking up their role on one, without reading rows
+        index_together = [('user', 'board', 'role')]
+
     def asdict(self):
         return {
-            'board_id': self.board.id,
-            'user_id': self.user.id,
+            'board_id': self.board_id,
+            'user_id': self.user_id,
             'role': self.role
         }
+
+
+class Change(models.Model):
+    """Entry in a board's change log. IDs give the order changes were made in."""
+
+    board = models.ForeignKey(Board)
+    entity = models.CharField(max_length=50)
+    entity_id = models.IntegerField(null=True)
+    action = models.CharField(max_length=50)
+
+    class Meta:
+        # Changes are always read by board, in order
+        index_together = [('board', 'id')]
+
+    def to_entity(self):
+        return entities.Change(
+            board_id=self.board_id,
+            entity=self.entity,
+            entity_id=self.entity_id,
+            action=self.action,
+            seq=self.id
+        )
+
+
+class Job(models.Model):
+    """Background job, eg purging a deleted board. See adapters.django_jobs.
+
+    params & progress are dictionaries, stored as JSON.
+    """
+
+    type = models.CharField(max_length=150)
+    params = models.TextField()
+    created_by = models.IntegerField(null=True)
+    status = models.CharField(max_length=50, default='queued')
+    progress = models.TextField(default='{}')
+    error = models.TextField(default='')
+    worker = models.CharField(max_length=150, default='')
+    created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        # Workers look for the oldest queued job
+        index_together = [('status', 'id')]
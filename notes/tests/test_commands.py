@@ -0,0 +1,83 @@
+"""Tests for management commands."""
+
+import gzip
+import io
+import json
+import os
+import tempfile
+
+from django.core.management import call_command, CommandError
+from django.test import TestCase
+
+from adapters.django_jobs import DjangoJobQueue
+from adapters.django_storage import DjangoStorage
+from adapters.tests import model_factories
+from notes import models as notes_models
+from notes.use_cases import NoteUseCases
+
+
+class ImportNotesTestCase(TestCase):
+    def setUp(self):
+        self.board = model_factories.Board()
+        self.user = model_factories.User()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'notes.ndjson')
+        with open(self.path, 'w') as f:
+            f.write('{"title": "Owls", "body": "..."}\n{"body": "No title"}\n')
+
+    def test_import_notes(self):
+        stdout, stderr = io.StringIO(), io.StringIO()
+
+        call_command('import_notes', self.board.id, self.path, user_id=self.user.id,
+                     batch_size=1, stdout=stdout, stderr=stderr)
+
+        self.assertEqual(list(self.board.note_set.values_list('title', flat=True)), ['Owls'])
+        self.assertIn('Imported 1 notes; 1 lines failed.', stdout.getvalue())
+        self.assertIn('Line 2: Title required', stderr.getvalue())
+
+    def test_board_must_exist(self):
+        with self.assertRaises(CommandError):
+            call_command('import_notes', self.board.id + 1, self.path, user_id=self.user.id)
+
+
+class ExportBoardTestCase(TestCase):
+    def setUp(self):
+        self.board = model_factories.Board()
+        self.notes = [model_factories.Note(board=self.board) for i in range(3)]
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'board.ndjson.gz')
+
+    def test_export_board(self):
+        stderr = io.StringIO()
+
+        call_command('export_board', self.board.id, self.path, after_id=self.notes[0].id,
+                     page_size=1, stderr=stderr)
+
+        with gzip.open(self.path, 'rt') as f:
+            rows = [json.loads(line) for line in f]
+        self.assertEqual([row['type'] for row in rows], ['board', 'note', 'note'])
+        self.assertIn('Exported 2 notes (last note ID {})'.format(self.notes[-1].id),
+                      stderr.getvalue())
+
+    def test_board_must_exist(self):
+        with self.assertRaises(CommandError):
+            call_command('export_board', self.board.id + 1, self.path)
+
+
+class RunJobsTestCase(TestCase):
+    def test_purge_deleted_board(self):
+        board = model_factories.Board()
+        model_factories.BoardUser(user=model_factories.User(), board=board, role='owner')
+        for i in range(3):
+            model_factories.Note(board=board)
+        board, job = NoteUseCases(DjangoStorage(), jobs=DjangoJobQueue()).start_board_deletion(
+            board.id)
+
+        call_command('run_jobs', once=True, batch_size=2, pause=0)
+
+        job = DjangoJobQueue().get(job.id)
+        self.assertEqual(job.status, 'done', job.error)
+        self.assertEqual(job.progress, {'users': 0, 'notes': 3, 'changes': 1})
+        self.assertFalse(notes_models.Note.objects.filter(board_id=board.id).exists())
@@ -5,12 +5,16 @@ As much as possible we will test use cases with MemoryStorage to enforce indepen
 use cases and the Django ORM.
 """
 
+import datetime
 import unittest
 
 from adapters.memory_storage import MemoryStorage
+from adapters.memory_cache import LRUCache
+from adapters.memory_jobs import MemoryJobQueue
 from notes.use_cases import NoteUseCases
 from notes.entities import Note, Board
 from accounts.entities import User
+from topsy.permissions import RoleCache
 
 
 def set_up_use_cases():
@@ -87,7 +91,7 @@ class SaveNoteTestCase(unittest.TestCase):
         self.use_cases.save_note(note)
 
         new_note = self.storage.get_note(self.note.id)
-        self.assertEqual(note, new_note)
+        self.assertEqual(note.replace(version=note.version + 1), new_note)
         self.assertEqual(new_note.title, new_title)
 
     def test_edit_note_board_and_save(self):
@@ -99,7 +103,7 @@ class SaveNoteTestCase(unittest.TestCase):
         self.use_cases.save_note(note)
 
         new_note = self.storage.get_note(self.note.id)
-        self.assertEqual(note, new_note)
+        self.assertEqual(note.replace(version=note.version + 1), new_note)
         self.assertEqual(new_note.board_id, board.id)
 
 
@@ -141,6 +145,33 @@ class DeleteNoteTestCase(unittest.TestCase):
             self.storage.get_note(self.note.id)
 
 
+class GetBoardNotesTestCase(unittest.TestCase):
+    """Tests for paging through notes in a board."""
+
+    def setUp(self):
+        self.use_cases = set_up_use_cases()
+        self.storage = self.use_cases.storage
+        self.board = self.storage.save_board(Board(name='mediocre notes'))
+        other_board = self.storage.save_board(Board(name='other notes'))
+        self.notes = []
+        for i in range(5):
+            self.notes.append(self.storage.save_note(
+                Note(title='title', body='body', board_id=self.board.id)))
+            self.storage.save_note(Note(title='title', body='body', board_id=other_board.id))
+
+    def test_get_board_notes_page(self):
+        first_page = self.use_cases.get_board_notes(self.board.id, limit=2)
+        second_page = self.use_cases.get_board_notes(
+            self.board.id, after_id=first_page[-1].id, limit=2)
+
+        self.assertEqual(first_page + second_page, self.notes[:4])
+
+    def test_iter_board_notes(self):
+        notes = list(self.use_cases.iter_board_notes(self.board.id, page_size=2))
+
+        self.assertEqual(notes, self.notes)
+
+
 class CreateBoardTestCase(unittest.TestCase):
     """Tests for creating a board."""
 
@@ -214,6 +245,16 @@ class RemoveUserFromBoardTestCase(unittest.TestCase):
         with self.assertRaises(IndexError):
             self.storage.board_users[0]
 
+    def test_remove_user_invalidates_role_cache(self):
+        """Removing user from board should drop their cached role."""
+        role_cache = RoleCache(LRUCache())
+        role_cache.set(self.user.id, self.board.id, 'owner')
+        use_cases = NoteUseCases(self.storage, role_cache=role_cache)
+
+        use_cases.remove_user_from_board(board_id=self.board.id, user_id=self.user.id)
+
+        self.assertIsNone(role_cache.get(self.user.id, self.board.id))
+
 
 class DeleteBoardTestCase(unittest.TestCase):
     """Tests for deleting boards."""
@@ -250,3 +291,315 @@ class DeleteBoardTestCase(unittest.TestCase):
 
 if __name__ == '__main__':
     unittest.main(verbosity=2)
+
+
+class SyncBoardTestCase(unittest.TestCase):
+    """Tests for incremental board sync."""
+
+    def setUp(self):
+        self.use_cases = set_up_use_cases()
+        self.storage = self.use_cases.storage
+        self.board = self.storage.save_board(Board(name='board'))
+        self.other_board = self.storage.save_board(Board(name='other board'))
+        self.notes = [self.storage.save_note(Note(title='note', body='body',
+                                                  board_id=self.board.id))
+                      for i in range(3)]
+        self.token = self.use_cases.sync_board(self.board.id)['token']
+
+    def test_sync_returns_only_changes(self):
+        edited = self.storage.save_note(self.notes[0].replace(title='edited'))
+        self.storage.save_note(edited.replace(title='edited again'))
+        self.storage.delete_note(self.notes[1].id)
+        new = self.storage.save_note(Note(title='new', body='body', board_id=self.board.id))
+        self.storage.save_note(Note(title='elsewhere', body='body', board_id=self.other_board.id))
+
+        changes = self.use_cases.sync_board(self.board.id, token=self.token)
+
+        self.assertEqual([(n.id, n.title) for n in changes['notes']],
+                         [(self.notes[0].id, 'edited again'), (new.id, 'new')])
+        self.assertEqual(changes['deleted_notes'], [self.notes[1].id])
+        self.assertFalse(changes['clear_notes'])
+        self.assertFalse(changes['more'])
+
+    def test_sync_from_new_token_is_empty(self):
+        self.storage.save_note(self.notes[0].replace(title='edited'))
+        token = self.use_cases.sync_board(self.board.id, token=self.token)['token']
+
+        changes = self.use_cases.sync_board(self.board.id, token=token)
+
+        self.assertEqual((changes['notes'], changes['deleted_notes']), ([], []))
+        self.assertEqual(changes['token'], token)
+
+    def test_moved_note_is_deleted_from_old_board(self):
+        self.use_cases.move_note(self.notes[0].id, self.other_board.id)
+
+        changes = self.use_cases.sync_board(self.board.id, token=self.token)
+
+        self.assertEqual(changes['deleted_notes'], [self.notes[0].id])
+        self.assertEqual(changes['notes'], [])
+
+    def test_sync_users(self):
+        self.use_cases.add_user_to_board(self.board.id, 1, role='reader')
+        self.use_cases.add_user_to_board(self.board.id, 2, role='editor')
+        self.use_cases.remove_user_from_board(self.board.id, 1)
+        self.storage.create_user(User(id=2, name='Bob', email='bob@example.com'), 'p4ssw0rd')
+
+        changes = self.use_cases.sync_board(self.board.id, token=self.token)
+
+        self.assertEqual(changes['users'], [{'user_id': 2, 'role': 'editor'}])
+        self.assertEqual(changes['deleted_users'], [1])
+
+    def test_cleared_notes(self):
+        self.storage.save_note(self.notes[0].replace(title='edited'))
+        self.storage.delete_board_notes(self.board.id)
+        new = self.storage.save_note(Note(title='new', body='body', board_id=self.board.id))
+
+        changes = self.use_cases.sync_board(self.board.id, token=self.token)
+
+        self.assertTrue(changes['clear_notes'])
+        self.assertEqual([n.id for n in changes['notes']], [new.id])
+        self.assertEqual(changes['deleted_notes'], [])
+
+    def test_sync_pages(self):
+        for note in self.notes:
+            self.storage.save_note(note.replace(title='edited'))
+
+        first = self.use_cases.sync_board(self.board.id, token=self.token, limit=2)
+        second = self.use_cases.sync_board(self.board.id, token=first['token'], limit=2)
+
+        self.assertTrue(first['more'])
+        self.assertFalse(second['more'])
+        self.assertEqual([n.id for n in first['notes'] + second['notes']],
+                         [n.id for n in self.notes])
+
+    def test_invalid_token(self):
+        with self.assertRaises(ValueError):
+            self.use_cases.sync_board(self.board.id, token='nonsense')
+        other_token = self.use_cases.sync_board(self.other_board.id)['token']
+        with self.assertRaises(ValueError):
+            self.use_cases.sync_board(self.board.id, token=other_token)
+
+
+class SearchNotesTestCase(unittest.TestCase):
+    """Tests for searching notes."""
+
+    def setUp(self):
+        self.use_cases = set_up_use_cases()
+        self.storage = self.use_cases.storage
+
+    def test_search_readable_boards(self):
+        board = self.use_cases.create_board('board', user_id=1)
+        other_board = self.use_cases.create_board('other board', user_id=2)
+        note = self.storage.save_note(Note(title='Owls', body='body', board_id=board.id))
+        self.storage.save_note(Note(title='Owls', body='body', board_id=other_board.id))
+
+        self.assertEqual(self.use_cases.search_notes(1, 'owls'), [note])
+
+    def test_query_required(self):
+        with self.assertRaises(ValueError):
+            self.use_cases.search_notes(1, '  ')
+
+
+class GetUserBoardsTestCase(unittest.TestCase):
+    """Tests for listing a user's boards."""
+
+    def setUp(self):
+        self.use_cases = set_up_use_cases()
+        self.storage = self.use_cases.storage
+
+    def test_get_user_boards(self):
+        board = self.use_cases.create_board('board', user_id=1)
+        shared_board = self.use_cases.create_board('shared', user_id=2)
+        self.use_cases.add_user_to_board(shared_board.id, 1, 'reader')
+        self.use_cases.create_board('other', user_id=2)
+        for i in range(2):
+            self.storage.save_note(Note(title='title', body='body', board_id=board.id))
+
+        boards = self.use_cases.get_user_boards(1)
+
+        self.assertEqual([b['board'].id for b in boards], [board.id, shared_board.id])
+        self.assertEqual([b['role'] for b in boards], ['owner', 'reader'])
+        self.assertEqual([b['note_count'] for b in boards], [2, 0])
+
+    def test_deleted_boards_excluded(self):
+        board = self.use_cases.create_board('board', user_id=1)
+        self.storage.save_board(board.replace(status='deleted'))
+
+        self.assertEqual(self.use_cases.get_user_boards(1), [])
+
+
+class ImportNotesTestCase(unittest.TestCase):
+    """Tests for importing notes from NDJSON."""
+
+    def setUp(self):
+        self.use_cases = set_up_use_cases()
+        self.storage = self.use_cases.storage
+        self.board = self.use_cases.create_board('board', user_id=1)
+
+    def test_import_notes_in_batches(self):
+        lines = ['{{"title": "Note {}", "body": "body"}}\n'.format(i).encode('utf8')
+                 for i in range(5)]
+        saved_batches = []
+        save_notes = self.storage.save_notes
+        self.storage.save_notes = (
+            lambda notes: saved_batches.append(len(notes)) or save_notes(notes))
+
+        result = self.use_cases.import_notes(iter(lines), 1, self.board.id, batch_size=2)
+
+        self.assertEqual(result, {'imported': 5, 'failed': 0, 'errors': []})
+        self.assertEqual(saved_batches, [2, 2, 1])
+        notes = self.storage.get_board_notes(self.board.id)
+        self.assertEqual([n.title for n in notes], ['Note {}'.format(i) for i in range(5)])
+
+    def test_invalid_lines_reported(self):
+        lines = [
+            '{"title": "Owls", "body": "body", "board_id": 99}',
+            '{"title": "No body"}',
+            '',
+            'not json',
+            '{"title": "Log", "body": "body", "size": "small"}',
+            '{"id": 1, "title": "Owls", "body": "body"}',
+            '["title", "body"]',
+            '{"title": "Coffee", "body": "body"}',
+        ]
+
+        result = self.use_cases.import_notes(lines, 1, self.board.id, max_errors=3)
+
+        self.assertEqual(result['imported'], 2)
+        self.assertEqual(result['failed'], 5)
+        self.assertEqual([e['line'] for e in result['errors']], [2, 4, 5])
+        notes = self.storage.get_board_notes(self.board.id)
+        self.assertEqual([n.title for n in notes], ['Owls', 'Coffee'])
+
+    def test_invalid_values_reported(self):
+        lines = [
+            '{"title": "Owls", "body": "body", "created_at": "nope"}',
+            '{"title": 5, "body": "body"}',
+            '{"title": "Log", "body": null}',
+            '{"title": "Log", "body": "body", "created_by": "Margaret"}',
+            '{"title": "Coffee", "body": "body", "created_at": "1990-04-08"}',
+        ]
+
+        result = self.use_cases.import_notes(lines, 1, self.board.id)
+
+        self.assertEqual((result['imported'], result['failed']), (1, 4))
+        self.assertEqual([e['line'] for e in result['errors']], [1, 2, 3, 4])
+        self.assertIn('created_at', result['errors'][0]['error'])
+        note = self.storage.get_board_notes(self.board.id)[0]
+        self.assertEqual(note.created_at, datetime.date(1990, 4, 8))
+
+    def test_user_id_required(self):
+        result = self.use_cases.import_notes(['{"title": "t", "body": "b"}'], None, self.board.id)
+
+        self.assertEqual(result['failed'], 1)
+
+
+class ExportBoardTestCase(unittest.TestCase):
+    """Tests for exporting boards."""
+
+    def setUp(self):
+        self.use_cases = set_up_use_cases()
+        self.storage = self.use_cases.storage
+        self.user = self.storage.create_user(User(name='Bob', email='bob@subgenius.com'), 'sl4ck')
+        self.board = self.use_cases.create_board('board', user_id=self.user.id)
+        self.notes = [
+            self.storage.save_note(Note(title=str(i), body='body', board_id=self.board.id))
+            for i in range(5)]
+
+    def test_export_board(self):
+        rows = list(self.use_cases.export_board(self.board.id, page_size=2))
+
+        self.assertEqual([row['type'] for row in rows], ['board', 'board_user'] + ['note'] * 5)
+        self.assertEqual(rows[0]['board']['name'], 'board')
+        self.assertEqual(rows[1]['board_user']['role'], 'owner')
+        self.assertEqual([row['note']['id'] for row in rows[2:]], [n.id for n in self.notes])
+
+    def test_resume_after_note(self):
+        rows = list(self.use_cases.export_board(self.board.id, after_id=self.notes[2].id))
+
+        self.assertEqual([row['type'] for row in rows], ['board', 'note', 'note'])
+        self.assertEqual([row['note']['id'] for row in rows[1:]], [n.id for n in self.notes[3:]])
+
+    def test_board_must_exist(self):
+        with self.assertRaises(self.storage.DoesNotExist):
+            self.use_cases.export_board(self.board.id + 1)
+
+
+class BulkEditNotesTestCase(unittest.TestCase):
+    """Tests for moving & editing many notes at once."""
+
+    def setUp(self):
+        self.use_cases = set_up_use_cases()
+        self.storage = self.use_cases.storage
+        self.board = self.use_cases.create_board('board', user_id=1)
+        self.other_board = self.use_cases.create_board('other', user_id=1)
+        self.notes = [self.storage.save_note(Note(title='t', body='b', board_id=self.board.id))
+                      for i in range(2)]
+        self.note_ids = [note.id for note in self.notes]
+
+    def test_move_notes(self):
+        moved = self.use_cases.move_notes(self.note_ids, self.other_board.id)
+
+        self.assertEqual(moved, self.note_ids)
+        self.assertEqual(self.use_cases.get_note_board_ids(self.note_ids),
+                         dict.fromkeys(self.note_ids, self.other_board.id))
+
+    def test_move_notes_requires_board(self):
+        with self.assertRaises(ValueError):
+            self.use_cases.move_notes(self.note_ids, None)
+
+    def test_edit_notes(self):
+        edited = self.use_cases.edit_notes(self.note_ids, {'status': 'archived'})
+
+        self.assertEqual(edited, self.note_ids)
+        self.assertEqual([n.status for n in self.use_cases.get_notes(self.note_ids)],
+                         ['archived', 'archived'])
+
+    def test_edit_notes_fields_checked(self):
+        for fields in ({}, {'board_id': self.other_board.id}, {'version': 10}):
+            with self.assertRaises(ValueError):
+                self.use_cases.edit_notes(self.note_ids, fields)
+
+
+class BoardDeletionJobTestCase(unittest.TestCase):
+    """Tests for deleting boards in the background."""
+
+    def setUp(self):
+        self.role_cache = RoleCache(LRUCache())
+        self.use_cases = NoteUseCases(MemoryStorage(), role_cache=self.role_cache,
+                                      jobs=MemoryJobQueue())
+        self.storage = self.use_cases.storage
+        self.board = self.use_cases.create_board('board', user_id=1)
+        for i in range(5):
+            self.storage.save_note(Note(title='t', body='b', board_id=self.board.id))
+
+    def test_start_board_deletion(self):
+        self.role_cache.set(1, self.board.id, 'owner')
+
+        board, job = self.use_cases.start_board_deletion(self.board.id, user_id=1)
+
+        with self.assertRaises(MemoryStorage.DoesNotExist):
+            self.storage.get_board(board.id)
+        self.assertEqual((job.type, job.params, job.status),
+                         ('board.purge', {'board_id': self.board.id}, 'queued'))
+        self.assertEqual(self.use_cases.get_job(job.id, 1), job)
+        with self.assertRaises(MemoryJobQueue.DoesNotExist):
+            self.use_cases.get_job(job.id, 2)
+        # Access is revoked straight away, but notes remain until the job runs
+        self.assertIsNone(self.storage.get_role(1, self.board.id))
+        self.assertIsNone(self.role_cache.get(1, self.board.id))
+        self.assertEqual(len(self.storage.get_board_notes(self.board.id)), 5)
+
+    def test_purge_board(self):
+        self.use_cases.start_board_deletion(self.board.id, user_id=1)
+        progress = []
+
+        totals = self.use_cases.purge_board(self.board.id, batch_size=3, progress=progress.append)
+
+        self.assertEqual(totals, {'users': 0, 'notes': 5, 'changes': 7})
+        self.assertEqual([p['notes'] for p in progress], [3, 5, 5, 5, 5])
+        self.assertEqual(self.storage.get_board_notes(self.board.id), [])
+
+    def test_active_board_not_purged(self):
+        with self.assertRaises(ValueError):
+            self.use_cases.purge_board(self.board.id)
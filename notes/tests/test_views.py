@@ -5,20 +5,46 @@ They don't need to be very detailed. But they do test that view, use case, model
 are all playing nicely together.
 """
 
+import gzip
 import json
+from unittest.mock import patch
 
-from django.test import TestCase, RequestFactory
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, TransactionTestCase, RequestFactory
+from django.test.utils import CaptureQueriesContext
 from django.core.urlresolvers import reverse
 from django.contrib.auth.models import AnonymousUser
 
+from adapters.django_storage import DjangoStorage
 from adapters.tests import model_factories
-from notes.views import (create_board, get_note, edit_note, add_user_to_board, delete_board,
-    remove_user_from_board)
+from notes import models as notes_models
+from notes.views import (create_board, get_note, get_notes, get_board_notes,
+    get_all_board_notes, edit_note, add_user_to_board, delete_board, remove_user_from_board,
+    sync_board, get_board_events, search_notes, get_user_boards, import_notes, export_board, batch,
+    move_notes, edit_notes, get_job, actions, events, get_perms, jobs, role_cache, storage,
+    use_cases)
 
 
-class CreateBoardTestCase(TestCase):
+class ViewTestMixin():
+    """Clears caches shared between requests before each test."""
+
     def setUp(self):
         self.req_factory = RequestFactory()
+        role_cache.cache.clear()
+        storage.cache.clear()
+
+
+class ViewTestCase(ViewTestMixin, TestCase):
+    """Base class for view tests."""
+
+
+class TransactionViewTestCase(ViewTestMixin, TransactionTestCase):
+    """Base class for view tests that need transactions to commit, eg to publish events."""
+
+
+class CreateBoardTestCase(ViewTestCase):
+    def setUp(self):
+        super().setUp()
         self.user = model_factories.User()
 
     def create_request(self, data):
@@ -43,9 +69,9 @@ class CreateBoardTestCase(TestCase):
         self.assertEqual(response_data['response']['board']['name'], name)
 
 
-class DeleteBoardTestCase(TestCase):
+class DeleteBoardTestCase(ViewTestCase):
     def setUp(self):
-        self.req_factory = RequestFactory()
+        super().setUp()
 
     def create_request(self, data, user=None):
         request = self.req_factory.post(
@@ -61,18 +87,73 @@ class DeleteBoardTestCase(TestCase):
         board = model_factories.Board()
         owner = model_factories.User(email='bob@blacklodge.net')
         model_factories.BoardUser(user=owner, board=board, role='owner')
+        model_factories.Note(board=board)
         request = self.create_request({'id': board.id}, user=owner)
         response = delete_board(request)
 
-        self.assertEqual(response.status_code, 200,
+        # Accepted, with the board's contents purged later by a job
+        self.assertEqual(response.status_code, 202,
                          'Error: {}'.format(response.content))
         response_data = json.loads(response.content.decode('utf8'))
         self.assertEqual(response_data['response']['board']['status'], 'deleted')
+        self.assertEqual(response_data['response']['job']['status'], 'queued')
+        self.assertEqual(board.note_set.count(), 1)
 
+        request = self.req_factory.get(
+            reverse('get_job', args=[response_data['response']['job']['id']]))
+        request.user = owner
+        response = get_job(request, response_data['response']['job']['id'])
+        response_data = json.loads(response.content.decode('utf8'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response_data['response']['job']['params'], {'board_id': board.id})
 
-class AddUserToBoardTestCase(TestCase):
+    def test_no_access_after_delete(self):
+        board = model_factories.Board()
+        owner = model_factories.User(email='bob@blacklodge.net')
+        model_factories.BoardUser(user=owner, board=board, role='owner')
+        note = model_factories.Note(board=board)
+        # Load the note first, so the owner's role is cached
+        get_note(self.create_get_note_request(note.id, owner), note.id)
+
+        response = delete_board(self.create_request({'id': board.id}, user=owner))
+        self.assertEqual(response.status_code, 202)
+
+        response = get_note(self.create_get_note_request(note.id, owner), note.id)
+        self.assertEqual(response.status_code, 403)
+
+        request = self.req_factory.post(
+            reverse('edit_note'), content_type='application/json',
+            data=json.dumps({'id': note.id, 'title': 'Owls'}))
+        request.user = owner
+        self.assertEqual(edit_note(request).status_code, 403)
+
+        request = self.req_factory.post(
+            reverse('batch'), content_type='application/json',
+            data=json.dumps({'operations': [{'action': 'create_note', 'params': {
+                'board_id': board.id, 'title': 'Owls', 'body': '...'}}]}))
+        request.user = owner
+        result = json.loads(batch(request).content.decode('utf8'))['response']['results'][0]
+        self.assertEqual(result.get('status'), 403)
+        self.assertEqual(board.note_set.count(), 1)
+
+    def create_get_note_request(self, note_id, user):
+        request = self.req_factory.get(reverse('get_note', args=[note_id]))
+        request.user = user
+        return request
+
+    def test_get_job_of_other_user(self):
+        job = jobs.enqueue('board.purge', {'board_id': 1}, created_by=1000)
+        request = self.req_factory.get(reverse('get_job', args=[job.id]))
+        request.user = model_factories.User()
+
+        response = get_job(request, job.id)
+
+        self.assertEqual(response.status_code, 404)
+
+
+class AddUserToBoardTestCase(ViewTestCase):
     def setUp(self):
-        self.req_factory = RequestFactory()
+        super().setUp()
 
     def create_request(self, data, user=None):
         request = self.req_factory.post(
@@ -103,6 +184,23 @@ class AddUserToBoardTestCase(TestCase):
         response_data = json.loads(response.content.decode('utf8'))
         self.assertEqual(response_data['response']['board']['name'], board.name)
 
+    def test_add_user_to_board_queries(self):
+        board = model_factories.Board()
+        owner = model_factories.User(email='bob@blacklodge.net')
+        model_factories.BoardUser(user=owner, board=board, role='owner')
+        user = model_factories.User(email='mike@blacklodge.net')
+        storage.get_board(board.id)
+        request = self.create_request(
+            {'user_id': user.id, 'board_id': board.id, 'role': 'editor'}, user=owner)
+
+        # Owner's role, then savepoint, insert membership & change, release savepoint; the board
+        # comes from the cache
+        with self.assertNumQueries(5):
+            response = add_user_to_board(request)
+
+        response_data = json.loads(response.content.decode('utf8'))
+        self.assertEqual(response_data['response']['board']['name'], board.name)
+
     def test_no_permission_to_add_user_to_board(self):
         board = model_factories.Board()
         req_user = model_factories.User(email='bob@blacklodge.net')
@@ -120,9 +218,9 @@ class AddUserToBoardTestCase(TestCase):
         )
 
 
-class RemoveUserFromBoardTestCase(TestCase):
+class RemoveUserFromBoardTestCase(ViewTestCase):
     def setUp(self):
-        self.req_factory = RequestFactory()
+        super().setUp()
 
     def create_request(self, data, user=None):
         request = self.req_factory.post(
@@ -149,15 +247,31 @@ class RemoveUserFromBoardTestCase(TestCase):
         self.assertEqual(resp_data['response']['board_user']['user_id'], reader.id)
 
 
-class GetNoteTestCase(TestCase):
+class RevokeRoleTestCase(TransactionViewTestCase):
+    def test_role_invalidated_on_commit(self):
+        board = model_factories.Board()
+        reader = model_factories.User(email='mike@blacklodge.net')
+        model_factories.BoardUser(user=reader, board=board, role='reader')
+
+        with transaction.atomic():
+            use_cases.remove_user_from_board(board.id, reader.id)
+            self.assertFalse(get_perms(reader.id, board.id, 'view_notes'))
+            # Another request that read the role before this commits caches the old one
+            role_cache.set(reader.id, board.id, 'reader')
+
+        self.assertFalse(get_perms(reader.id, board.id, 'view_notes'))
+
+
+class GetNoteTestCase(ViewTestCase):
     def setUp(self):
-        self.req_factory = RequestFactory()
+        super().setUp()
 
-    def create_request(self, id, user=None):
+    def create_request(self, id, user=None, **headers):
         request = self.req_factory.get(
             reverse('get_note', args=[id]),
             content_type='application/json',
-            HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+            **headers)
         request.user = user or AnonymousUser()
         request.session = {}
         return request
@@ -169,7 +283,9 @@ class GetNoteTestCase(TestCase):
         note = model_factories.Note(board_id=board.id)
 
         request = self.create_request(note.id, user=user)
-        response = get_note(request, note.id)
+        # Note & role are loaded together
+        with self.assertNumQueries(1):
+            response = get_note(request, note.id)
         response_data = json.loads(response.content.decode('utf8'))
 
         self.assertEqual(response.status_code, 200,
@@ -187,10 +303,174 @@ class GetNoteTestCase(TestCase):
         self.assertEqual(response.status_code, 403,
                          'Error: {}'.format(response.content))
 
+    def test_get_note_not_modified(self):
+        board = model_factories.Board()
+        user = model_factories.User(email='bob@blacklodge.net')
+        model_factories.BoardUser(user=user, board=board, role='reader')
+        note = model_factories.Note(board_id=board.id)
+        etag = get_note(self.create_request(note.id, user=user), note.id)['ETag']
+        storage.cache.clear()
+
+        request = self.create_request(note.id, user=user, HTTP_IF_NONE_MATCH=etag)
+        # Only the version & role are loaded
+        with self.assertNumQueries(1):
+            response = get_note(request, note.id)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_get_note_modified(self):
+        board = model_factories.Board()
+        user = model_factories.User(email='bob@blacklodge.net')
+        model_factories.BoardUser(user=user, board=board, role='reader')
+        note = model_factories.Note(board_id=board.id)
+        etag = get_note(self.create_request(note.id, user=user), note.id)['ETag']
+        storage.save_note(storage.get_note(note.id).replace(title='new title'))
+
+        request = self.create_request(note.id, user=user, HTTP_IF_NONE_MATCH=etag)
+        response = get_note(request, note.id)
+        response_data = json.loads(response.content.decode('utf8'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response_data['response']['note']['title'], 'new title')
+
+    def test_get_note_not_modified_permission_denied(self):
+        board = model_factories.Board()
+        user = model_factories.User(email='bob@blacklodge.net')
+        note = model_factories.Note(board_id=board.id)
+
+        request = self.create_request(note.id, user=user, HTTP_IF_NONE_MATCH='*')
+        response = get_note(request, note.id)
+
+        self.assertEqual(response.status_code, 403)
+
+
+class GetBoardNotesTestCase(ViewTestCase):
+    def create_request(self, board_id, data, user=None):
+        request = self.req_factory.get(
+            reverse('get_board_notes', args=[board_id]),
+            data=data,
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        request.user = user or AnonymousUser()
+        request.session = {}
+        return request
+
+    def test_get_board_notes_pages(self):
+        board = model_factories.Board()
+        user = model_factories.User(email='bob@blacklodge.net')
+        model_factories.BoardUser(user=user, board=board, role='reader')
+        notes = [model_factories.Note(board_id=board.id) for i in range(3)]
+
+        response = get_board_notes(self.create_request(board.id, {'limit': 2}, user), board.id)
+        first_page = json.loads(response.content.decode('utf8'))['response']
+        response = get_board_notes(
+            self.create_request(board.id, {'limit': 2, 'after': first_page['next']}, user),
+            board.id)
+        second_page = json.loads(response.content.decode('utf8'))['response']
+
+        self.assertEqual([n['id'] for n in first_page['notes'] + second_page['notes']],
+                         [note.id for note in notes])
+        self.assertIsNone(second_page['next'])
+
+    def test_get_board_notes_not_modified(self):
+        board = model_factories.Board()
+        user = model_factories.User(email='bob@blacklodge.net')
+        model_factories.BoardUser(user=user, board=board, role='reader')
+        notes = [model_factories.Note(board_id=board.id) for i in range(2)]
+        etag = get_board_notes(self.create_request(board.id, {}, user), board.id)['ETag']
+
+        request = self.create_request(board.id, {}, user)
+        request.META['HTTP_IF_NONE_MATCH'] = etag
+        response = get_board_notes(request, board.id)
+        self.assertEqual(response.status_code, 304)
+
+        storage.save_note(storage.get_note(notes[1].id).replace(title='new title'))
+        response = get_board_notes(request, board.id)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_get_board_notes_permission_denied(self):
+        board = model_factories.Board()
+        user = model_factories.User(email='bob@blacklodge.net')
+
+        response = get_board_notes(self.create_request(board.id, {}, user), board.id)
+
+        self.assertEqual(response.status_code, 403)
+
+
+class GetAllBoardNotesTestCase(ViewTestCase):
+    def create_request(self, board_id, user=None):
+        request = self.req_factory.get(
+            reverse('get_all_board_notes', args=[board_id]),
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        request.user = user or AnonymousUser()
+        request.session = {}
+        return request
+
+    def test_get_all_board_notes(self):
+        board = model_factories.Board()
+        user = model_factories.User(email='bob@blacklodge.net')
+        model_factories.BoardUser(user=user, board=board, role='reader')
+        notes = [model_factories.Note(board_id=board.id) for i in range(3)]
+
+        response = get_all_board_notes(self.create_request(board.id, user), board.id)
+        content = b''.join(response.streaming_content).decode('utf8')
+        response_data = json.loads(content)['response']
+
+        self.assertEqual([n['id'] for n in response_data['notes']], [note.id for note in notes])
+
+    def test_get_all_board_notes_permission_denied(self):
+        board = model_factories.Board()
+        user = model_factories.User(email='bob@blacklodge.net')
+
+        response = get_all_board_notes(self.create_request(board.id, user), board.id)
+
+        self.assertEqual(response.status_code, 403)
+
+
+class GetNotesTestCase(ViewTestCase):
+    def create_request(self, ids, user=None):
+        request = self.req_factory.get(
+            reverse('get_notes'),
+            data={'ids': ','.join(str(id) for id in ids)},
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        request.user = user or AnonymousUser()
+        request.session = {}
+        return request
+
+    def test_get_notes(self):
+        user = model_factories.User(email='bob@blacklodge.net')
+        boards = [model_factories.Board() for i in range(3)]
+        for board in boards[:2]:
+            model_factories.BoardUser(user=user, board=board, role='reader')
+        notes = [model_factories.Note(board_id=board.id) for board in boards for i in range(2)]
+        ids = [note.id for note in notes] + [5000]
+
+        request = self.create_request(ids, user=user)
+        # One query for notes, one for roles on all of their boards
+        with self.assertNumQueries(2):
+            response = get_notes(request)
+        response_data = json.loads(response.content.decode('utf8'))['response']
+
+        self.assertEqual(response.status_code, 200,
+                         'Error: {}'.format(response.content))
+        self.assertEqual(sorted(n['id'] for n in response_data['notes']),
+                         [note.id for note in notes[:4]])
+        self.assertEqual(sorted(response_data['forbidden']), [note.id for note in notes[4:]])
+        self.assertEqual(response_data['missing'], [5000])
+
+    def test_get_notes_invalid_ids(self):
+        user = model_factories.User(email='bob@blacklodge.net')
+        request = self.create_request(['one', 'two'], user=user)
+        response = get_notes(request)
+
+        self.assertEqual(response.status_code, 400)
 
-class EditNoteTestCase(TestCase):
+
+class EditNoteTestCase(ViewTestCase):
     def setUp(self):
-        self.req_factory = RequestFactory()
+        super().setUp()
 
     def create_request(self, data=None, user=None):
         request = self.req_factory.post(
@@ -210,9 +490,656 @@ class EditNoteTestCase(TestCase):
 
         data = {'id': note.id, 'title': 'new title'}
         request = self.create_request(data, user)
-        response = edit_note(request)
+        # Note & role are loaded together, then note is saved & logged (within a savepoint here)
+        with self.assertNumQueries(5):
+            response = edit_note(request)
         response_data = json.loads(response.content.decode('utf8'))
 
         self.assertEqual(response.status_code, 200,
                          'Error: {}'.format(response.content))
         self.assertEqual(response_data['response']['note']['title'], data['title'])
+
+    def test_reader_cannot_edit_note(self):
+        board = model_factories.Board()
+        user = model_factories.User(email='bob@blacklodge.net')
+        model_factories.BoardUser(user=user, board=board, role='reader')
+        note = model_factories.Note(title='original title', board_id=board.id)
+
+        response = edit_note(self.create_request({'id': note.id, 'title': 'new title'}, user))
+
+        self.assertEqual(response.status_code, 403)
+        note.refresh_from_db()
+        self.assertEqual(note.title, 'original title')
+
+    def test_edit_note_changed_elsewhere(self):
+        board = model_factories.Board()
+        user = model_factories.User(email='bob@blacklodge.net')
+        model_factories.BoardUser(user=user, board=board, role='editor')
+        note = model_factories.Note(title='original title', board_id=board.id, version=1)
+        storage.get_note(note.id)
+        # Saved by another process, so this one's cache isn't invalidated
+        type(note).objects.filter(id=note.id).update(body='new body', version=2)
+
+        response = edit_note(self.create_request({'id': note.id, 'title': 'new title'}, user))
+
+        self.assertEqual(response.status_code, 200, 'Error: {}'.format(response.content))
+        note.refresh_from_db()
+        self.assertEqual((note.title, note.body, note.version), ('new title', 'new body', 3))
+
+    def test_edit_note_conflict(self):
+        board = model_factories.Board()
+        user = model_factories.User(email='bob@blacklodge.net')
+        model_factories.BoardUser(user=user, board=board, role='editor')
+        note = model_factories.Note(title='original title', board_id=board.id)
+
+        edit_note(self.create_request({'id': note.id, 'title': 'first', 'version': 1}, user))
+        response = edit_note(
+            self.create_request({'id': note.id, 'title': 'second', 'version': 1}, user))
+
+        self.assertEqual(response.status_code, 409,
+                         'Error: {}'.format(response.content))
+
+    def test_invalid_version(self):
+        board = model_factories.Board()
+        user = model_factories.User(email='bob@blacklodge.net')
+        model_factories.BoardUser(user=user, board=board, role='editor')
+        note = model_factories.Note(title='original title', board_id=board.id)
+
+        for version in ('abc', [1]):
+            response = edit_note(
+                self.create_request({'id': note.id, 'title': 'new', 'version': version}, user))
+
+            self.assertEqual(response.status_code, 400, version)
+        note.refresh_from_db()
+        self.assertEqual(note.title, 'original title')
+
+
+class SyncBoardTestCase(ViewTestCase):
+    def create_request(self, board_id, data, user=None):
+        request = self.req_factory.get(
+            reverse('sync_board', args=[board_id]),
+            data=data,
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        request.user = user or AnonymousUser()
+        request.session = {}
+        return request
+
+    def test_sync_board(self):
+        board = model_factories.Board()
+        user = model_factories.User(email='bob@blacklodge.net')
+        model_factories.BoardUser(user=user, board=board, role='reader')
+        notes = [model_factories.Note(board_id=board.id) for i in range(2)]
+        response = sync_board(self.create_request(board.id, {}, user), board.id)
+        token = json.loads(response.content.decode('utf8'))['response']['token']
+        storage.save_note(storage.get_note(notes[0].id).replace(title='new title'))
+        storage.delete_note(notes[1].id)
+
+        response = sync_board(self.create_request(board.id, {'token': token}, user), board.id)
+        response_data = json.loads(response.content.decode('utf8'))['response']
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([n['title'] for n in response_data['notes']], ['new title'])
+        self.assertEqual(response_data['deleted_notes'], [notes[1].id])
+        self.assertNotEqual(response_data['token'], token)
+
+    def test_sync_board_invalid_token(self):
+        board = model_factories.Board()
+        user = model_factories.User(email='bob@blacklodge.net')
+        model_factories.BoardUser(user=user, board=board, role='reader')
+
+        response = sync_board(self.create_request(board.id, {'token': 'x'}, user), board.id)
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_sync_board_permission_denied(self):
+        board = model_factories.Board()
+        user = model_factories.User(email='bob@blacklodge.net')
+
+        response = sync_board(self.create_request(board.id, {}, user), board.id)
+
+        self.assertEqual(response.status_code, 403)
+
+
+class GetBoardEventsTestCase(TransactionViewTestCase):
+    def setUp(self):
+        super().setUp()
+        self.board = model_factories.Board()
+        self.user = model_factories.User(email='bob@blacklodge.net')
+        model_factories.BoardUser(user=self.user, board=self.board, role='editor')
+        self.note = model_factories.Note(title='original title', board_id=self.board.id)
+        self.after = events.last_offset
+
+    def create_request(self, board_id, data, user=None, **headers):
+        request = self.req_factory.get(
+            reverse('get_board_events', args=[board_id]),
+            data=data,
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+            **headers)
+        request.user = user or AnonymousUser()
+        request.session = {}
+        return request
+
+    def edit_note(self, title):
+        request = self.req_factory.post(
+            reverse('edit_note'),
+            content_type='application/json',
+            data=json.dumps({'id': self.note.id, 'title': title}))
+        request.user = self.user
+        request.session = {}
+        return edit_note(request)
+
+    def test_long_poll(self):
+        self.edit_note('new title')
+
+        request = self.create_request(self.board.id, {'after': self.after, 'timeout': 0},
+                                      self.user)
+        response = get_board_events(request, self.board.id)
+        response_data = json.loads(response.content.decode('utf8'))['response']
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([e['type'] for e in response_data['events']], ['note.edit'])
+        self.assertEqual(response_data['events'][0]['data']['result']['title'], 'new title')
+        self.assertEqual(response_data['next'], response_data['events'][0]['offset'])
+
+    def test_published_on_commit(self):
+        with transaction.atomic():
+            self.edit_note('new title')
+            self.assertEqual(events.read(self.board.id, after=self.after), [])
+
+        self.assertEqual(len(events.read(self.board.id, after=self.after)), 1)
+
+    def test_conflicting_edit_not_published(self):
+        self.edit_note('new title')
+        request = self.req_factory.post(
+            reverse('edit_note'),
+            content_type='application/json',
+            data=json.dumps({'id': self.note.id, 'title': 'stale', 'version': 1}))
+        request.user = self.user
+        request.session = {}
+        edit_note(request)
+
+        request = self.create_request(self.board.id, {'after': self.after, 'timeout': 0},
+                                      self.user)
+        response_data = json.loads(get_board_events(request, self.board.id).content.decode('utf8'))
+
+        self.assertEqual(len(response_data['response']['events']), 1)
+
+    def test_event_stream(self):
+        self.edit_note('new title')
+
+        request = self.create_request(self.board.id, {}, self.user,
+                                      HTTP_ACCEPT='text/event-stream',
+                                      HTTP_LAST_EVENT_ID=str(self.after))
+        response = get_board_events(request, self.board.id)
+        message = next(iter(response.streaming_content)).decode('utf8')
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertIn('event: note.edit\n', message)
+        self.assertIn('id: {}\n'.format(self.after + 1), message)
+
+    def test_event_stream_ends_when_access_removed(self):
+        self.edit_note('new title')
+        request = self.create_request(self.board.id, {}, self.user,
+                                      HTTP_ACCEPT='text/event-stream',
+                                      HTTP_LAST_EVENT_ID=str(self.after))
+        stream = iter(get_board_events(request, self.board.id).streaming_content)
+        next(stream)
+
+        use_cases.remove_user_from_board(self.board.id, self.user.id)
+        message = next(stream).decode('utf8')
+
+        self.assertIn('event: forbidden\n', message)
+        self.assertEqual(list(stream), [])
+
+    def test_invalid_timeout(self):
+        for timeout in ('nan', 'inf', '-1'):
+            request = self.create_request(self.board.id, {'timeout': timeout}, self.user)
+            response = get_board_events(request, self.board.id)
+
+            self.assertEqual(response.status_code, 400, timeout)
+
+    def test_expired_offset(self):
+        request = self.create_request(self.board.id, {'after': events.last_offset + 1},
+                                      self.user)
+        response = get_board_events(request, self.board.id)
+
+        self.assertEqual(response.status_code, 410)
+
+    def test_permission_denied(self):
+        user = model_factories.User(email='laura@blacklodge.net')
+
+        response = get_board_events(self.create_request(self.board.id, {}, user), self.board.id)
+
+        self.assertEqual(response.status_code, 403)
+
+
+class SearchNotesTestCase(ViewTestCase):
+    def create_request(self, data, user=None):
+        request = self.req_factory.get(
+            reverse('search_notes'),
+            data=data,
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        request.user = user or AnonymousUser()
+        request.session = {}
+        return request
+
+    def test_search_notes(self):
+        board = model_factories.Board()
+        user = model_factories.User(email='bob@blacklodge.net')
+        model_factories.BoardUser(user=user, board=board, role='reader')
+        notes = [model_factories.Note(title='Owls', board_id=board.id) for i in range(2)]
+        model_factories.Note(title='Coffee', board_id=board.id)
+
+        response = search_notes(self.create_request({'q': 'owls', 'limit': 1}, user))
+        response_data = json.loads(response.content.decode('utf8'))['response']
+
+        self.assertEqual(response.status_code, 200, 'Error: {}'.format(response.content))
+        self.assertEqual([n['id'] for n in response_data['notes']], [notes[0].id])
+        self.assertEqual(response_data['next'], 1)
+
+    def test_search_requires_query(self):
+        user = model_factories.User(email='bob@blacklodge.net')
+
+        response = search_notes(self.create_request({}, user))
+
+        self.assertEqual(response.status_code, 400)
+
+
+class GetUserBoardsTestCase(ViewTestCase):
+    def test_get_user_boards(self):
+        user = model_factories.User()
+        board = model_factories.Board(name='Sprints')
+        model_factories.BoardUser(user=user, board=board, role='editor')
+        model_factories.Note(board=board)
+        request = self.req_factory.get(reverse('get_user_boards'),
+                                       HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        request.user = user
+        request.session = {}
+
+        response = get_user_boards(request)
+        response_data = json.loads(response.content.decode('utf8'))['response']
+
+        self.assertEqual(response.status_code, 200, 'Error: {}'.format(response.content))
+        self.assertEqual(len(response_data['boards']), 1)
+        self.assertEqual(response_data['boards'][0]['name'], 'Sprints')
+        self.assertEqual(response_data['boards'][0]['role'], 'editor')
+        self.assertEqual(response_data['boards'][0]['note_count'], 1)
+
+
+class ImportNotesTestCase(ViewTestCase):
+    def setUp(self):
+        super().setUp()
+        self.board = model_factories.Board()
+        self.user = model_factories.User()
+
+    def create_request(self, body):
+        request = self.req_factory.post(
+            reverse('import_notes', args=[self.board.id]),
+            content_type='application/x-ndjson',
+            data=body,
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        request.user = self.user
+        request.session = {}
+        return request
+
+    def test_import_notes(self):
+        model_factories.BoardUser(user=self.user, board=self.board, role='editor')
+        body = ('{"title": "Owls", "body": "..."}\n'
+                '{"title": "Oops"}\n'
+                '{"title": "Log", "body": ""}\n'
+                '{"title": "Nope", "body": "", "created_at": "nope"}\n')
+
+        response = import_notes(self.create_request(body), self.board.id)
+        response_data = json.loads(response.content.decode('utf8'))['response']
+
+        self.assertEqual(response.status_code, 200, 'Error: {}'.format(response.content))
+        self.assertEqual(response_data['imported'], 2)
+        self.assertEqual([e['line'] for e in response_data['errors']], [2, 4])
+        self.assertEqual(self.board.note_set.count(), 2)
+
+    def test_import_notes_requires_permission(self):
+        model_factories.BoardUser(user=self.user, board=self.board, role='reader')
+
+        response = import_notes(self.create_request('{"title": "t", "body": "b"}'), self.board.id)
+
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.board.note_set.count(), 0)
+
+
+class ExportBoardTestCase(ViewTestCase):
+    def setUp(self):
+        super().setUp()
+        self.board = model_factories.Board(name='Sprints')
+        self.user = model_factories.User()
+        self.notes = [model_factories.Note(board=self.board) for i in range(3)]
+
+    def create_request(self, data=None):
+        request = self.req_factory.get(
+            reverse('export_board', args=[self.board.id]),
+            data=data or {},
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        request.user = self.user
+        request.session = {}
+        return request
+
+    def read_rows(self, response):
+        content = gzip.decompress(b''.join(response.streaming_content)).decode('utf8')
+        return [json.loads(line) for line in content.splitlines()]
+
+    def test_export_board(self):
+        model_factories.BoardUser(user=self.user, board=self.board, role='reader')
+
+        response = export_board(self.create_request(), self.board.id)
+        rows = self.read_rows(response)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertEqual([row['type'] for row in rows], ['board', 'board_user'] + ['note'] * 3)
+        self.assertEqual(rows[0]['board']['name'], 'Sprints')
+        self.assertEqual(rows[1]['board_user']['id'], self.user.id)
+        self.assertEqual([row['note']['id'] for row in rows[2:]], [n.id for n in self.notes])
+
+    def test_resume_export(self):
+        model_factories.BoardUser(user=self.user, board=self.board, role='reader')
+
+        response = export_board(self.create_request({'after': self.notes[0].id}), self.board.id)
+        rows = self.read_rows(response)
+
+        self.assertEqual([row['type'] for row in rows], ['board', 'note', 'note'])
+
+    def test_export_requires_permission(self):
+        response = export_board(self.create_request(), self.board.id)
+
+        self.assertEqual(response.status_code, 403)
+
+
+class BatchTestCase(ViewTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = model_factories.User()
+        self.board = model_factories.Board()
+        self.other_board = model_factories.Board()
+        model_factories.BoardUser(user=self.user, board=self.board, role='editor')
+        model_factories.BoardUser(user=self.user, board=self.other_board, role='reader')
+        self.note = model_factories.Note(board=self.board, version=1)
+        self.other_note = model_factories.Note(board=self.other_board, version=1)
+
+    def create_request(self, operations):
+        request = self.req_factory.post(
+            reverse('batch'),
+            content_type='application/json',
+            data=json.dumps({'operations': operations}),
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        request.user = self.user
+        request.session = {}
+        return request
+
+    def run_batch(self, operations):
+        response = batch(self.create_request(operations))
+        self.assertEqual(response.status_code, 200, 'Error: {}'.format(response.content))
+        return json.loads(response.content.decode('utf8'))['response']['results']
+
+    def test_operations_run_in_order(self):
+        results = self.run_batch([
+            {'action': 'create_note', 'params': {'board_id': self.board.id, 'title': 'Owls',
+                                                 'body': '...'}},
+            {'action': 'edit_note', 'params': {'note_id': self.note.id, 'title': 'One'}},
+            {'action': 'edit_note', 'params': {'note_id': self.note.id, 'body': 'Two'}},
+            {'action': 'create_board', 'params': {'name': 'Sprints'}},
+        ])
+
+        self.assertTrue(all(result['success'] for result in results), results)
+        self.assertEqual(results[0]['response']['note']['board_id'], self.board.id)
+        self.note.refresh_from_db()
+        self.assertEqual((self.note.title, self.note.body, self.note.version), ('One', 'Two', 2))
+        self.assertEqual(results[3]['response']['board']['name'], 'Sprints')
+
+    def test_errors_reported_in_place(self):
+        results = self.run_batch([
+            {'action': 'delete_note', 'params': {'note_id': self.other_note.id}},
+            {'action': 'edit_note', 'params': {'note_id': self.note.id, 'title': 'No',
+                                               'version': 0}},
+            {'action': 'delete_note', 'params': {'note_id': self.note.id + 1000}},
+            {'action': 'shred_note', 'params': {}},
+            {'action': 'edit_note', 'params': {'note_id': self.other_note.id, 'title': 'No'}},
+            {'action': 'delete_note', 'params': {'note_id': self.note.id}},
+        ])
+
+        self.assertEqual([result['success'] for result in results],
+                         [False, False, False, False, False, True])
+        self.assertEqual([result.get('status') for result in results[:5]],
+                         [403, 409, 400, 400, 403])
+        self.assertTrue(self.other_board.note_set.exists())
+        self.assertFalse(self.board.note_set.exists())
+
+    def test_notes_and_roles_loaded_in_bulk(self):
+        notes = [model_factories.Note(board=board) for board in (self.board, self.other_board) * 2]
+
+        with CaptureQueriesContext(connection) as context:
+            self.run_batch([{'action': 'edit_note', 'params': {'note_id': note.id, 'title': 'T'}}
+                            for note in notes])
+
+        selects = [q['sql'] for q in context.captured_queries if q['sql'].startswith('SELECT')]
+        self.assertEqual(len([sql for sql in selects if 'FROM "notes_note"' in sql]), 1)
+        self.assertEqual(len([sql for sql in selects if 'FROM "notes_boarduser"' in sql]), 1)
+
+    def test_repeated_edits_written_once(self):
+        with CaptureQueriesContext(connection) as context:
+            results = self.run_batch([
+                {'action': 'edit_note', 'params': {'note_id': self.note.id, 'title': 'One'}},
+                {'action': 'edit_note', 'params': {'note_id': self.note.id, 'body': 'Two'}},
+                {'action': 'edit_note', 'params': {'note_id': self.note.id, 'title': 'Three',
+                                                   'version': 2}},
+            ])
+
+        self.assertTrue(all(result['success'] for result in results), results)
+        self.assertEqual(results[2]['response']['note']['version'], 2)
+        updates = [q['sql'] for q in context.captured_queries
+                   if q['sql'].startswith('UPDATE "notes_note"')]
+        self.assertEqual(len(updates), 1)
+        self.note.refresh_from_db()
+        self.assertEqual((self.note.title, self.note.body, self.note.version), ('Three', 'Two', 2))
+
+    def test_repeated_edits_fail_together(self):
+        """If a note was changed by someone else during the batch, none of its edits are saved."""
+        get_notes = use_cases.get_notes
+
+        def get_notes_then_change(note_ids):
+            notes = get_notes(note_ids)
+            notes_models.Note.objects.filter(id=self.note.id).update(version=5)
+            return notes
+
+        with patch.object(use_cases, 'get_notes', side_effect=get_notes_then_change):
+            results = self.run_batch([
+                {'action': 'edit_note', 'params': {'note_id': self.note.id, 'title': 'One'}},
+                {'action': 'edit_note', 'params': {'note_id': self.note.id, 'body': 'Two'}},
+                {'action': 'edit_note', 'params': {'note_id': self.other_note.id, 'title': 'T'}},
+                {'action': 'delete_note', 'params': {'note_id': self.note.id}},
+            ])
+
+        self.assertEqual([result['success'] for result in results], [False, False, False, True])
+        self.assertEqual([result.get('status') for result in results[:3]], [409, 409, 403])
+        self.assertFalse(self.board.note_set.exists())
+
+    def test_database_error_rolled_back_alone(self):
+        with patch.object(DjangoStorage, 'update_notes', side_effect=IntegrityError('nope')):
+            results = self.run_batch([
+                {'action': 'edit_note', 'params': {'note_id': self.note.id, 'title': 'One'}},
+                {'action': 'edit_notes', 'params': {'note_ids': [self.note.id],
+                                                    'fields': {'status': 'archived'}}},
+                {'action': 'create_note', 'params': {'board_id': self.board.id, 'title': 'Owls',
+                                                     'body': '...'}},
+            ])
+
+        self.assertEqual([result['success'] for result in results], [True, False, True])
+        self.assertEqual(results[1]['status'], 500)
+        self.note.refresh_from_db()
+        self.assertEqual((self.note.title, self.note.status), ('One', 'active'))
+        self.assertEqual(self.board.note_set.count(), 2)
+
+    def test_permissions_memoized_for_request(self):
+        memo_hits = get_perms.stats['memo_hits']
+
+        self.run_batch([{'action': 'edit_note', 'params': {'note_id': note.id, 'title': 'T'}}
+                        for note in (self.note, self.other_note, self.note)])
+
+        self.assertEqual(get_perms.stats['memo_hits'] - memo_hits, 3)
+        self.assertIsNone(get_perms._memo)
+
+    def test_no_access_after_delete_board(self):
+        board = model_factories.Board()
+        model_factories.BoardUser(user=self.user, board=board, role='owner')
+
+        results = self.run_batch([
+            {'action': 'delete_board', 'params': {'id': board.id}},
+            {'action': 'create_note', 'params': {'board_id': board.id, 'title': 'T',
+                                                 'body': '...'}},
+        ])
+
+        self.assertEqual([result['success'] for result in results], [True, False])
+        self.assertEqual(results[1]['status'], 403)
+
+    def test_too_many_operations(self):
+        response = batch(self.create_request([{'action': 'create_board'}] * 101))
+
+        self.assertEqual(response.status_code, 400)
+
+
+class BulkEditNotesTestCase(ViewTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = model_factories.User()
+        self.board = model_factories.Board()
+        self.other_board = model_factories.Board()
+        model_factories.BoardUser(user=self.user, board=self.board, role='editor')
+        self.notes = [model_factories.Note(board=self.board) for i in range(3)]
+        self.note_ids = [note.id for note in self.notes]
+
+    def create_request(self, url_name, data):
+        request = self.req_factory.post(
+            reverse(url_name),
+            content_type='application/json',
+            data=json.dumps(data),
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        request.user = self.user
+        request.session = {}
+        return request
+
+    def test_move_notes(self):
+        model_factories.BoardUser(user=self.user, board=self.other_board, role='editor')
+
+        response = move_notes(self.create_request('move_notes', {
+            'note_ids': self.note_ids + [self.note_ids[-1] + 100],
+            'board_id': self.other_board.id}))
+        response_data = json.loads(response.content.decode('utf8'))['response']
+
+        self.assertEqual(response.status_code, 200, 'Error: {}'.format(response.content))
+        self.assertEqual(sorted(response_data['notes']), self.note_ids)
+        self.assertEqual(response_data['missing'], [self.note_ids[-1] + 100])
+        self.assertEqual(self.other_board.note_set.count(), 3)
+
+    def test_move_notes_requires_permission_on_destination(self):
+        model_factories.BoardUser(user=self.user, board=self.other_board, role='reader')
+
+        response = move_notes(self.create_request('move_notes', {
+            'note_ids': self.note_ids, 'board_id': self.other_board.id}))
+
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.board.note_set.count(), 3)
+
+    def test_move_notes_requires_permission_on_source(self):
+        model_factories.BoardUser(user=self.user, board=self.other_board, role='editor')
+        forbidden_note = model_factories.Note(board=model_factories.Board())
+
+        response = move_notes(self.create_request('move_notes', {
+            'note_ids': self.note_ids + [forbidden_note.id], 'board_id': self.other_board.id}))
+
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.other_board.note_set.count(), 0)
+
+    def test_edit_notes(self):
+        response = edit_notes(self.create_request('edit_notes', {
+            'note_ids': self.note_ids[:2], 'fields': {'status': 'archived'}}))
+
+        self.assertEqual(response.status_code, 200, 'Error: {}'.format(response.content))
+        self.assertEqual(self.board.note_set.filter(status='archived').count(), 2)
+
+    def test_edit_notes_invalid_field(self):
+        response = edit_notes(self.create_request('edit_notes', {
+            'note_ids': self.note_ids, 'fields': {'board_id': self.other_board.id}}))
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_notes_moved_after_lookup_skipped(self):
+        """Notes moved to a board the user can't edit after their boards were looked up are left."""
+        get_note_board_ids = actions.use_cases.get_note_board_ids
+
+        def get_note_board_ids_then_move(note_ids):
+            note_boards = get_note_board_ids(note_ids)
+            notes_models.Note.objects.filter(id=self.note_ids[0]).update(board=self.other_board)
+            return note_boards
+
+        with patch.object(actions.use_cases, 'get_note_board_ids',
+                          side_effect=get_note_board_ids_then_move):
+            response = edit_notes(self.create_request('edit_notes', {
+                'note_ids': self.note_ids, 'fields': {'status': 'archived'}}))
+
+        self.assertEqual(response.status_code, 200, 'Error: {}'.format(response.content))
+        response_data = json.loads(response.content.decode('utf8'))['response']
+        self.assertEqual(response_data['skipped'], [self.note_ids[0]])
+        self.assertEqual(sorted(response_data['notes']), self.note_ids[1:])
+        self.assertEqual(self.other_board.note_set.get().status, 'active')
+
+    def test_edit_notes_invalid_values(self):
+        for fields in ({'status': None}, {'title': {'a': 1}}, {'title': 'x' * 151}):
+            response = edit_notes(self.create_request('edit_notes', {
+                'note_ids': self.note_ids, 'fields': fields}))
+
+            self.assertEqual(response.status_code, 400, fields)
+        self.assertFalse(self.board.note_set.exclude(status='active').exists())
+        self.assertEqual(self.board.note_set.filter(title__startswith='x').count(), 0)
+
+    def test_batch_edit_notes_invalid_values(self):
+        response = batch(self.create_request('batch', {'operations': [
+            {'action': 'edit_notes', 'params': {'note_ids': self.note_ids,
+                                                'fields': {'status': None}}},
+            {'action': 'edit_notes', 'params': {'note_ids': self.note_ids,
+                                                'fields': {'title': 'x' * 151}}},
+        ]}))
+        results = json.loads(response.content.decode('utf8'))['response']['results']
+
+        self.assertEqual([result.get('status') for result in results], [400, 400])
+
+    def test_batch_move_notes(self):
+        model_factories.BoardUser(user=self.user, board=self.other_board, role='owner')
+
+        response = batch(self.create_request('batch', {'operations': [
+            {'action': 'edit_note', 'params': {'note_id': self.note_ids[0], 'title': 'Owls'}},
+            {'action': 'move_notes', 'params': {'note_ids': self.note_ids,
+                                                'board_id': self.other_board.id}},
+        ]}))
+        results = json.loads(response.content.decode('utf8'))['response']['results']
+
+        self.assertTrue(all(result['success'] for result in results), results)
+        self.assertEqual(self.other_board.note_set.count(), 3)
+
+    def test_batch_edit_after_bulk_changes(self):
+        model_factories.BoardUser(user=self.user, board=self.other_board, role='editor')
+        note_id = self.note_ids[0]
+
+        response = batch(self.create_request('batch', {'operations': [
+            {'action': 'move_notes', 'params': {'note_ids': [note_id],
+                                                'board_id': self.other_board.id}},
+            {'action': 'edit_note', 'params': {'note_id': note_id, 'title': 'Owls'}},
+            {'action': 'edit_notes', 'params': {'note_ids': [note_id],
+                                                'fields': {'status': 'archived'}}},
+            {'action': 'edit_note', 'params': {'note_id': note_id, 'body': 'Hoot'}},
+            {'action': 'delete_note', 'params': {'note_id': note_id}},
+        ]}))
+        results = json.loads(response.content.decode('utf8'))['response']['results']
+
+        self.assertTrue(all(result['success'] for result in results), results)
+        self.assertEqual(results[1]['response']['note']['board_id'], self.other_board.id)
+        self.assertEqual(results[3]['response']['note']['status'], 'archived')
+        self.assertEqual(results[3]['response']['note']['title'], 'Owls')
+        self.assertFalse(self.other_board.note_set.exists())
@@ -9,19 +9,47 @@ storage dependency (but could be used to inject other dependencies). When retrie
 stored objects (notes, boards, etc), use cases only operate on entities, which are converted to
 and from ORM objects by the storage layer.
 """
+import datetime
+import json
+import time
+from functools import partial
+
 from .entities import Note, Board
 from topsy.permissions import board_permissions
 
+# Note fields that must be strings, & date fields, when creating notes from user input
+NOTE_STRING_FIELDS = ('title', 'body', 'status')
+NOTE_DATE_FIELDS = ('created_at', 'modified_at')
+
+# Max lengths of note string fields, as stored
+NOTE_MAX_LENGTHS = {'title': 150, 'status': 50}
+
+# Note fields that can be set on many notes at once with edit_notes
+BULK_EDIT_FIELDS = ('title', 'body', 'status')
+
+# Type of job queued by start_board_deletion, which is run with purge_board
+PURGE_BOARD_JOB = 'board.purge'
+
 
 class NoteUseCases():
     """Class containing all Note use cases."""
 
-    def __init__(self, storage):
-        """Instantiate with a storage instance that defines the persistence layer."""
+    def __init__(self, storage, role_cache=None, jobs=None):
+        """Instantiate with a storage instance that defines the persistence layer.
+
+        If a RoleCache is provided, its entries are invalidated whenever board membership changes.
+        A job queue is needed to delete boards in the background (see start_board_deletion).
+        """
         self.storage = storage
+        self.role_cache = role_cache
+        self.jobs = jobs
 
     def create_note(self, note_dict, user_id, board_id=None):
         """Take a dictionary representing a note, save to DB and return entity."""
+        return self.storage.save_note(self._new_note(note_dict, user_id))
+
+    def _new_note(self, note_dict, user_id):
+        """Validate a dictionary representing a new note, and return entity."""
         if user_id is None:
             raise ValueError('User ID required to create note.')
 
@@ -32,19 +60,128 @@ class NoteUseCases():
             raise ValueError('Body required to create note.')
 
         try:
-            note = Note(**note_dict)
+            return Note(**self._check_note_values(note_dict))
         except TypeError:
             raise ValueError('Note initialized with invalid field')
 
-        return self.storage.save_note(note)
+    @staticmethod
+    def _check_note_values(note_dict):
+        """Raise ValueError if any field of a note dictionary has a value of the wrong type.
+
+        Returns a copy of the dictionary, with dates given as strings (YYYY-MM-DD) parsed.
+        """
+        note_dict = dict(note_dict)
+        for field in NOTE_STRING_FIELDS:
+            if field in note_dict and not isinstance(note_dict[field], str):
+                raise ValueError('Note {} must be a string.'.format(field))
+            if len(note_dict.get(field, '')) > NOTE_MAX_LENGTHS.get(field, float('inf')):
+                raise ValueError('Note {} must be at most {} characters.'.format(
+                    field, NOTE_MAX_LENGTHS[field]))
+
+        created_by = note_dict.get('created_by')
+        if created_by is not None and type(created_by) is not int:
+            raise ValueError('Note created_by must be a user ID.')
+
+        for field in NOTE_DATE_FIELDS:
+            value = note_dict.get(field)
+            if isinstance(value, str):
+                try:
+                    note_dict[field] = datetime.datetime.strptime(value, '%Y-%m-%d').date()
+                except ValueError:
+                    raise ValueError('Note {} must be a date (YYYY-MM-DD).'.format(field))
+            elif value is not None and not isinstance(value, datetime.date):
+                raise ValueError('Note {} must be a date (YYYY-MM-DD).'.format(field))
+        return note_dict
+
+    def import_notes(self, lines, user_id, board_id, batch_size=500, max_errors=100):
+        """Create notes in a board from lines of JSON objects (NDJSON), saving them in batches.
+
+        Each line is validated like create_note's note_dict; lines that fail are skipped & reported
+        without stopping the import. Lines may be str or bytes, and only one batch of notes is held
+        at a time, so they can come from a stream of any size, eg a file or request.
+
+        Returns dictionary with the number of notes imported, the number of lines that failed, and
+        errors for the first max_errors of those, eg {'line': 3, 'error': 'Title required...'}.
+        """
+        result = {'imported': 0, 'failed': 0, 'errors': []}
+        batch = []
+
+        for number, line in enumerate(lines, 1):
+            try:
+                note = self._import_note(line, user_id, board_id)
+            except ValueError as e:
+                result['failed'] += 1
+                if len(result['errors']) < max_errors:
+                    result['errors'].append({'line': number, 'error': str(e)})
+                continue
+            if note is None:
+                continue
+
+            batch.append(note)
+            if len(batch) >= batch_size:
+                result['imported'] += len(self.storage.save_notes(batch))
+                batch = []
+
+        if batch:
+            result['imported'] += len(self.storage.save_notes(batch))
+        return result
+
+    def _import_note(self, line, user_id, board_id):
+        """Validate a line of NDJSON, and return a new note entity, or None if the line is blank.
+
+        Raises ValueError if the line is invalid, including if it can't be decoded or parsed.
+        """
+        if isinstance(line, bytes):
+            line = line.decode('utf8')
+        if not line.strip():
+            return None
+        note_dict = json.loads(line)
+        if not isinstance(note_dict, dict):
+            raise ValueError('Line must be a JSON object.')
+        if note_dict.get('id') is not None:
+            raise ValueError('Imported notes cannot have an ID.')
+        return self._new_note(dict(note_dict, board_id=board_id), user_id)
 
     def get_note(self, note_id):
         """Retrieve entity instance for a single note."""
         return self.storage.get_note(id=note_id)
 
-    def edit_note(self, note_id, title=None, body=None):
-        """Edit title and/or body of note."""
-        note = self.storage.get_note(id=note_id)
+    def get_note_with_role(self, note_id, user_id):
+        """Retrieve a note, along with the given user's role on its board."""
+        return self.storage.get_note_with_role(id=note_id, user_id=user_id)
+
+    def get_note_version_with_role(self, note_id, user_id):
+        """Get the current version of a note, along with the given user's role on its board."""
+        return self.storage.get_note_version_with_role(id=note_id, user_id=user_id)
+
+    def get_notes(self, note_ids):
+        """Retrieve entity instances for many notes, skipping any that don't exist."""
+        return self.storage.get_notes(ids=note_ids)
+
+    def search_notes(self, user_id, query, limit=20, offset=0):
+        """Search notes on every board the user can read, best matches first.
+
+        Notes must contain every word in the query.
+        """
+        if not query or not query.strip():
+            raise ValueError('Search query is required.')
+        roles = [role for role, permissions in board_permissions.items()
+                 if 'view_notes' in permissions]
+        return self.storage.search_notes(user_id=user_id, query=query, roles=roles, limit=limit,
+                                         offset=offset)
+
+    def edit_note(self, note_id, title=None, body=None, note=None, version=None):
+        """Edit title and/or body of note. Pass note entity if it has already been loaded.
+
+        If the version of the note that the edit was based on is given, the edit will fail with
+        a storage Conflict error if the note has been changed since.
+        """
+        if note is None:
+            with self.storage.uncached():
+                note = self.storage.get_note(id=note_id)
+
+        if version is not None:
+            note = note.replace(version=version)
 
         if title is not None:
             note = note.replace(title=title)
@@ -64,34 +201,234 @@ class NoteUseCases():
 
     def move_note(self, note_id, board_id):
         """Move a note to another board."""
-        note = self.storage.get_note(id=note_id)
+        with self.storage.uncached():
+            note = self.storage.get_note(id=note_id)
         note = note.replace(board_id=board_id)
         note = self.storage.save_note(note)
         return note
 
+    def move_notes(self, note_ids, board_id, from_board_ids=None):
+        """Move many notes to another board at once. Returns IDs of the notes moved.
+
+        If from_board_ids is given, only notes on those boards are moved.
+        """
+        if board_id is None:
+            raise ValueError('Board ID required to move notes.')
+        return self.storage.move_notes(ids=note_ids, board_id=board_id,
+                                       from_board_ids=from_board_ids)
+
+    def edit_notes(self, note_ids, fields, board_ids=None):
+        """Set the same field values on many notes at once, eg {'status': 'archived'}.
+
+        Only fields in BULK_EDIT_FIELDS can be set, and their values are checked as for new notes.
+        If board_ids is given, only notes on those boards are edited. Returns IDs of notes edited.
+        """
+        if not fields:
+            raise ValueError('Fields to edit are required.')
+        invalid = set(fields).difference(BULK_EDIT_FIELDS)
+        if invalid:
+            raise ValueError('Fields cannot be edited in bulk: {}'.format(
+                ', '.join(sorted(invalid))))
+        self._check_note_values(fields)
+        return self.storage.update_notes(ids=note_ids, fields=fields, board_ids=board_ids)
+
+    def get_note_board_ids(self, note_ids):
+        """Get the board ID of each note, as a dictionary mapping note ID to board ID."""
+        return self.storage.get_note_board_ids(ids=note_ids)
+
     def create_board(self, name, user_id):
         """Create a board to group notes."""
         if user_id is None:
             raise ValueError('User ID required to create board.')
         board = Board(name=name)
         board = self.storage.save_board(board)
-        self.add_user_to_board(board.id, user_id, role='owner')
+        self._join_board(board.id, user_id, 'owner')
         return board
 
     def get_user_boards(self, user_id):
-        """Get metadata for all boards that a given user has access to."""
-        pass
+        """Get metadata for all active boards that a given user has access to.
+
+        Returns list of dictionaries with the board, the user's role, number of notes, and when
+        the board or any of its notes was last modified, ordered by board ID.
+        """
+        return self.storage.get_user_boards(user_id)
 
     def get_board(self, board_id):
         """Get metadata for a single board."""
         pass
 
-    def get_board_notes(self, board_id):
-        """Get all notes within a board."""
-        pass
+    def get_board_notes(self, board_id, after_id=None, limit=None):
+        """Get a page of notes within a board, ordered by ID, starting after note after_id."""
+        return self.storage.get_board_notes(id=board_id, after_id=after_id, limit=limit)
+
+    def iter_board_notes(self, board_id, after_id=None, page_size=500):
+        """Generate all notes within a board, loading one page at a time."""
+        while True:
+            notes = self.storage.get_board_notes(id=board_id, after_id=after_id, limit=page_size)
+            yield from notes
+            if len(notes) < page_size:
+                return
+            after_id = notes[-1].id
+
+    def export_board(self, board_id, after_id=None, page_size=1000):
+        """Get a board's metadata, memberships & notes as rows to export, eg for a backup.
+
+        Returns a generator of dictionaries: first {'type': 'board', 'board': {...}}, then one
+        {'type': 'board_user', 'board_user': {...}} per member, then {'type': 'note', 'note': {...}}
+        per note, ordered by ID. Notes are loaded one page at a time, so boards of any size can be
+        exported. To resume an interrupted export, pass the ID of the last note exported as
+        after_id; the board row is repeated, and only notes after it follow.
+
+        Raises storage DoesNotExist straight away if the board doesn't exist.
+        """
+        board = self.storage.get_board(id=board_id)
+        board_users = self.storage.get_board_users(id=board_id) if after_id is None else []
+        return self._export_rows(board, board_users, after_id, page_size)
+
+    def _export_rows(self, board, board_users, after_id, page_size):
+        yield {'type': 'board', 'board': board.asdict()}
+        for board_user in board_users:
+            yield {'type': 'board_user', 'board_user': board_user}
+        for note in self.iter_board_notes(board.id, after_id=after_id, page_size=page_size):
+            yield {'type': 'note', 'note': note.asdict()}
+
+    def start_board_deletion(self, board_id, user_id=None):
+        """Mark a board deleted & remove its users now, and queue a job to purge its notes in the
+        background.
+
+        Removing users straight away revokes access, so nothing can be read from or added to the
+        board while it waits to be purged. Unlike delete_board, this takes the same time however
+        many notes the board has. Returns the board & the job, whose progress can be followed with
+        get_job.
+        """
+        if self.jobs is None:
+            raise ValueError('A job queue is required to delete boards in the background.')
+        with self.storage.atomic():
+            user_ids = self.storage.delete_board_users(board_id=board_id)
+            board = self.storage.delete_board(id=board_id)
+            job = self.jobs.enqueue(PURGE_BOARD_JOB, {'board_id': board.id}, created_by=user_id)
+
+        self._invalidate_roles(user_ids, board.id)
+        return board, job
+
+    def purge_board(self, board_id, batch_size=500, pause=0, progress=None):
+        """Permanently remove a deleted board's users, notes & change log, a batch at a time.
+
+        Each batch is its own transaction, and pause seconds are slept between batches, so other
+        writers get their turn. progress, if given, is called with running totals after each
+        batch. Returns the totals, eg {'users': 2, 'notes': 1000, 'changes': 1500}.
+        """
+        try:
+            self.storage.get_board(id=board_id)
+        except self.storage.DoesNotExist:
+            pass
+        else:
+            raise ValueError('Board {} must be deleted before it is purged.'.format(board_id))
+
+        totals = {'users': 0, 'notes': 0, 'changes': 0}
+        while True:
+            purged = self.storage.purge_board(board_id=board_id, limit=batch_size)
+            self._invalidate_roles(purged['user_ids'], board_id)
+
+            totals['users'] += len(purged['user_ids'])
+            totals['notes'] += len(purged['note_ids'])
+            totals['changes'] += purged['changes']
+            if progress is not None:
+                progress(dict(totals))
+
+            if len(purged['user_ids']) + len(purged['note_ids']) + purged['changes'] < batch_size:
+                return totals
+            if pause:
+                time.sleep(pause)
+
+    def get_job(self, job_id, user_id):
+        """Get a job started by the given user. Raises job queue DoesNotExist for anyone else's."""
+        job = self.jobs.get(job_id)
+        if job.created_by != user_id:
+            raise self.jobs.DoesNotExist('Job {} does not exist.'.format(job_id))
+        return job
+
+    def sync_board(self, board_id, token=None, limit=1000):
+        """Get what changed on a board since a sync token was issued.
+
+        Without a token, only a token for the board's current state is returned; a client should
+        get one before loading the whole board, then pass it back to get later changes. Tokens are
+        opaque to clients. At most limit log entries are read per call; if more is true, call
+        again with the new token to get the rest.
+
+        Returns dictionary with the current state of notes & users saved since the token, IDs of
+        notes & users deleted since, whether all notes or users were removed at once before those
+        changes (clear_notes & clear_users), and the next token.
+        """
+        if token is None:
+            seq = self.storage.get_last_change_seq(board_id=board_id)
+            return {'token': self._sync_token(board_id, seq)}
+
+        after_seq = self._parse_sync_token(board_id, token)
+        changes = self.storage.get_board_changes(board_id=board_id, after_seq=after_seq,
+                                                 limit=limit)
+
+        # Only the latest change to each entity matters, and nothing before a clear
+        latest = {}
+        cleared = set()
+        for change in reversed(changes):
+            if change.entity in cleared:
+                continue
+            if change.action == 'cleared':
+                cleared.add(change.entity)
+            else:
+                latest.setdefault((change.entity, change.entity_id), change.action)
+
+        saved = {'note': [], 'board_user': []}
+        deleted = {'note': [], 'board_user': []}
+        for (entity, id), action in latest.items():
+            (saved if action == 'saved' else deleted)[entity].append(id)
+
+        # Anything saved since that is now gone was deleted or moved after these changes
+        notes = sorted((note for note in self.storage.get_notes(ids=saved['note'])
+                        if note.board_id == board_id), key=lambda note: note.id)
+        found = {note.id for note in notes}
+        deleted['note'] += [id for id in saved['note'] if id not in found]
+
+        users = []
+        if saved['board_user']:
+            user_ids = set(saved['board_user'])
+            users = [{'user_id': user['id'], 'role': user['role']}
+                     for user in self.storage.get_board_users(id=board_id)
+                     if user['id'] in user_ids]
+            found = {user['user_id'] for user in users}
+            deleted['board_user'] += [id for id in saved['board_user'] if id not in found]
+
+        return {
+            'notes': notes,
+            'deleted_notes': sorted(deleted['note']),
+            'users': users,
+            'deleted_users': sorted(deleted['board_user']),
+            'clear_notes': 'note' in cleared,
+            'clear_users': 'board_user' in cleared,
+            'token': self._sync_token(board_id, changes[-1].seq if changes else after_seq),
+            'more': len(changes) == limit
+        }
+
+    @staticmethod
+    def _sync_token(board_id, seq):
+        return '{}.{}'.format(board_id, seq)
+
+    @staticmethod
+    def _parse_sync_token(board_id, token):
+        try:
+            token_board_id, seq = (int(part) for part in token.split('.'))
+        except (AttributeError, ValueError):
+            raise ValueError('Invalid sync token: {}'.format(token))
+        if token_board_id != board_id:
+            raise ValueError('Sync token is for another board.')
+        return seq
 
     def add_user_to_board(self, board_id, user_id, role='reader'):
-        """Give another user permission to view a board."""
+        """Give another user permission to view a board. Returns the board.
+
+        The board is read separately from saving the membership, so it can come from a cache.
+        """
         if board_id is None:
             raise ValueError('Board ID required to add user to board.')
         if user_id is None:
@@ -99,22 +436,33 @@ class NoteUseCases():
         if role is None or role not in board_permissions.keys():
             raise ValueError('Invalid board role provided: {}'.format(role))
 
-        return self.storage.save_board_user(board_id, user_id, role)
+        self._join_board(board_id, user_id, role)
+        return self.storage.get_board(id=board_id)
+
+    def _join_board(self, board_id, user_id, role):
+        self.storage.save_board_user(board_id, user_id, role)
+        self._invalidate_roles([user_id], board_id)
 
     def remove_user_from_board(self, board_id, user_id):
         """Revoke another user's permission to view a board."""
-        return self.storage.delete_board_user(board_id=board_id, user_id=user_id)
+        result = self.storage.delete_board_user(board_id=board_id, user_id=user_id)
+        self._invalidate_roles([user_id], board_id)
+        return result
+
+    def _invalidate_roles(self, user_ids, board_id):
+        """Drop users' cached roles on a board now, so this request sees its own change, and again
+        once the change is committed, in case another request cached the old role before then."""
+        if self.role_cache is not None and user_ids:
+            self.role_cache.invalidate_many(user_ids, board_id)
+            self.storage.on_commit(partial(self.role_cache.invalidate_many, user_ids, board_id))
 
     def delete_board(self, board_id):
         """Delete a board, all notes within it & all user joins to it."""
-        board = self.storage.get_board(id=board_id)
-        notes = self.storage.get_board_notes(id=board_id)
-        users = self.storage.get_board_users(id=board_id)
-
-        for note in notes:
-            self.storage.delete_note(id=note.id)
+        with self.storage.atomic():
+            board = self.storage.get_board(id=board_id)
+            self.storage.delete_board_notes(board_id=board.id)
+            user_ids = self.storage.delete_board_users(board_id=board.id)
+            board = self.storage.delete_board(id=board.id)
 
-        for user in users:
-            self.storage.delete_board_user(user_id=user['id'], board_id=board.id)
-
-        return self.storage.delete_board(id=board.id)
+        self._invalidate_roles(user_ids, board.id)
+        return board
@@ -6,23 +6,74 @@ formatting responses, and routing the requests to use cases.
 """
 
 import json
+import math
+import time
+from functools import partial
 
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
+from django.db import DatabaseError
+from django.http import StreamingHttpResponse
 
-from topsy.utils import json_success, json_error
+from topsy.utils import (json_success, json_success_stream, json_error, make_etag, versions_etag,
+                         etag_matches, not_modified, sse_message, release_db_connections,
+                         ndjson_gzip_stream)
 from adapters.django_storage import DjangoStorage
+from adapters.caching_storage import CachingStorage
+from adapters.coalescing_storage import CoalescingStorage
+from adapters.unit_of_work import UnitOfWorkStorage
 from adapters.django_logging import django_logging
+from adapters.django_cache import DjangoCache
+from adapters.memory_events import MemoryEventLog
+from adapters.file_events import FileEventLog
+from adapters.django_jobs import DjangoJobQueue
 from .use_cases import NoteUseCases
 from .actions import NoteActions
-from topsy.permissions import PermissionChecker, PermissionError
+from topsy.permissions import PermissionChecker, PermissionError, RoleCache
 
-storage = DjangoStorage()
-use_cases = NoteUseCases(storage)
-actions = NoteActions(storage, django_logging)
-get_perms = PermissionChecker(storage)
+storage = UnitOfWorkStorage(
+    CachingStorage(CoalescingStorage(DjangoStorage()), DjangoCache('storage')))
+role_cache = RoleCache(DjangoCache('permissions'))
+events = (FileEventLog(settings.EVENT_LOG_FILE) if settings.EVENT_LOG_FILE
+          else MemoryEventLog())
+jobs = DjangoJobQueue()
+use_cases = NoteUseCases(storage, role_cache=role_cache, jobs=jobs)
+actions = NoteActions(storage, django_logging, role_cache=role_cache, events=events, jobs=jobs)
+get_perms = PermissionChecker(storage, role_cache=role_cache, logging=django_logging)
+
+# Max number of notes that can be requested at once from get_notes
+MAX_NOTE_IDS = 200
+
+# Default & max page sizes for get_board_notes
+BOARD_NOTES_PAGE_SIZE = 100
+MAX_BOARD_NOTES_PAGE_SIZE = 1000
+
+# Default & max page sizes for search_notes
+SEARCH_PAGE_SIZE = 20
+MAX_SEARCH_PAGE_SIZE = 100
+
+# Number of notes saved per transaction by import_notes
+IMPORT_BATCH_SIZE = 500
+
+# Max number of notes that can be moved or edited at once
+MAX_BULK_NOTE_IDS = 500
+
+# Max number of operations in a batch request
+MAX_BATCH_OPERATIONS = 100
+
+# Max number of change log entries read per sync_board request
+SYNC_PAGE_SIZE = 1000
+
+# Max number of events per get_board_events response, default & max seconds to wait for them,
+# and seconds before an event stream is closed (clients reconnect with Last-Event-ID)
+EVENTS_PAGE_SIZE = 100
+EVENTS_WAIT = 25
+MAX_EVENTS_WAIT = 60
+EVENT_STREAM_DURATION = 300
 
 
 @login_required
+@storage.unit_of_work()
 def create_board(request):
     """Create a new board."""
     req_data = json.loads(request.body.decode('utf8'))
@@ -37,7 +88,11 @@ def create_board(request):
 
 
 @login_required
+@storage.unit_of_work()
 def delete_board(request):
+    """Delete a board. It is marked deleted & its users removed straight away, and its notes are
+    removed in the background by a job (see run_jobs), whose progress can be followed with get_job.
+    """
     req_data = json.loads(request.body.decode('utf8'))
     try:
         board_id = req_data['id']
@@ -45,17 +100,30 @@ def delete_board(request):
         return json_error('Board id is required')
 
     try:
-        board = actions.delete_board(
+        result = actions.start_board_deletion(
             id=board_id,
+            user_id=request.user.id,
             permissions=get_perms(request.user.id, board_id)
         )
     except PermissionError as e:
         return json_error(str(e), status=403)
 
-    return json_success({'board': board.asdict()})
+    return json_success({'board': result['board'], 'job': result['job']}, status=202)
+
+
+@login_required
+def get_job(request, job_id):
+    """Get the status & progress of a background job the user started, eg deleting a board."""
+    try:
+        job = use_cases.get_job(int(job_id), request.user.id)
+    except jobs.DoesNotExist:
+        return json_error('Job {} does not exist'.format(job_id), status=404)
+
+    return json_success({'job': job.asdict()})
 
 
 @login_required
+@storage.unit_of_work()
 def add_user_to_board(request):
     """Add user to a board."""
     req_data = json.loads(request.body.decode('utf8'))
@@ -76,6 +144,7 @@ def add_user_to_board(request):
 
 
 @login_required
+@storage.unit_of_work()
 def remove_user_from_board(request):
     """Remove user from a board."""
     req_data = json.loads(request.body.decode('utf8'))
@@ -92,22 +161,329 @@ def remove_user_from_board(request):
 
     return json_success({'board_user': board_user})
 
+@login_required
+def get_user_boards(request):
+    """Dashboard of the user's active boards, with their role, note count & last modified date."""
+    boards = actions.get_user_boards(request.user.id)
+    return json_success({
+        'boards': [
+            dict(board['board'].asdict(), role=board['role'], note_count=board['note_count'],
+                 last_modified=board['last_modified'])
+            for board in boards
+        ]
+    })
+
+
+@login_required
+def get_board_notes(request, board_id):
+    """Display a page of notes within a board.
+
+    Pages are ordered by note ID. The response includes the cursor for the next page, which should
+    be passed back as the `after` parameter, or null if this is the last page.
+    """
+    board_id = int(board_id)
+    try:
+        after_id = int(request.GET['after']) if 'after' in request.GET else None
+        limit = int(request.GET.get('limit', BOARD_NOTES_PAGE_SIZE))
+    except ValueError:
+        return json_error('Parameters after and limit must be integers')
+
+    if not 0 < limit <= MAX_BOARD_NOTES_PAGE_SIZE:
+        return json_error('Limit must be between 1 and {}'.format(MAX_BOARD_NOTES_PAGE_SIZE))
+
+    try:
+        notes = actions.get_board_notes(
+            board_id,
+            after_id=after_id,
+            limit=limit,
+            permissions=get_perms(request.user.id, board_id)
+        )
+    except PermissionError as e:
+        return json_error(str(e), status=403)
+
+    # The page still has to be loaded, but an unchanged one isn't serialized or sent again
+    etag = versions_etag('board-{}-notes-{}-{}'.format(board_id, after_id, limit), notes)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    return json_success({
+        'notes': [note.asdict() for note in notes],
+        'next': notes[-1].id if len(notes) == limit else None
+    }, etag=etag)
+
+
+@login_required
+def get_all_board_notes(request, board_id):
+    """Stream every note within a board in a single response."""
+    board_id = int(board_id)
+    try:
+        notes = actions.iter_board_notes(
+            board_id,
+            permissions=get_perms(request.user.id, board_id)
+        )
+    except PermissionError as e:
+        return json_error(str(e), status=403)
+
+    return json_success_stream({'notes': notes})
+
+
+@login_required
+def export_board(request, board_id):
+    """Download a board's metadata, members & notes as gzip-compressed NDJSON, eg for a backup.
+
+    Each line is a JSON object with a type ('board', 'board_user' or 'note') and the item under
+    that key. The file is compressed as it is streamed, one page of notes at a time. Notes are in
+    ID order, so an interrupted download can be resumed by passing the ID of the last note received
+    as the `after` parameter, which returns another gzip file with the board & later notes only.
+    """
+    board_id = int(board_id)
+    try:
+        after_id = int(request.GET['after']) if 'after' in request.GET else None
+    except ValueError:
+        return json_error('Parameter after must be an integer')
+
+    try:
+        rows = actions.export_board(
+            board_id,
+            after_id=after_id,
+            permissions=get_perms(request.user.id, board_id)
+        )
+    except PermissionError as e:
+        return json_error(str(e), status=403)
+    except DjangoStorage.DoesNotExist:
+        return json_error('Board {} does not exist'.format(board_id))
+
+    response = StreamingHttpResponse(ndjson_gzip_stream(rows), content_type='application/gzip')
+    response['Content-Disposition'] = 'attachment; filename="board-{}{}.ndjson.gz"'.format(
+        board_id, '-after-{}'.format(after_id) if after_id is not None else '')
+    return response
+
+
+@login_required
+def import_notes(request, board_id):
+    """Create notes in a board from the request body, which has one JSON object per line.
+
+    Each object is a note, eg {"title": "Owls", "body": "..."}. The body is read a line at a time,
+    and notes are saved in batches, so files of any size can be imported. Invalid lines are skipped
+    and reported in the response, along with the number of notes imported.
+
+    This runs outside a unit of work, so each batch is committed as soon as it is saved.
+    """
+    board_id = int(board_id)
+    try:
+        result = actions.import_notes(
+            board_id,
+            request,
+            user_id=request.user.id,
+            batch_size=IMPORT_BATCH_SIZE,
+            permissions=get_perms(request.user.id, board_id)
+        )
+    except PermissionError as e:
+        return json_error(str(e), status=403)
+
+    return json_success(result)
+
+
+@login_required
+def sync_board(request, board_id):
+    """Get changes to a board's notes & users since the sync token passed as `token`.
+
+    Without a token, only a token for the board's current state is returned.
+    """
+    board_id = int(board_id)
+    try:
+        changes = actions.sync_board(
+            board_id,
+            token=request.GET.get('token'),
+            limit=SYNC_PAGE_SIZE,
+            permissions=get_perms(request.user.id, board_id)
+        )
+    except ValueError as e:
+        return json_error(str(e))
+    except PermissionError as e:
+        return json_error(str(e), status=403)
+
+    if 'notes' in changes:
+        changes['notes'] = [note.asdict() for note in changes['notes']]
+    return json_success(changes)
+
+
+@login_required
+def get_board_events(request, board_id):
+    """Follow a board's change feed, from the offset passed as `after` (default: from now on).
+
+    Clients that accept text/event-stream get server-sent events, resuming from Last-Event-ID when
+    they reconnect. Others get a long-poll response with the next events, once there are some or
+    `timeout` seconds have passed. The database connection is released before waiting either way.
+    If events after the offset are no longer kept, 410 is returned, and the board should be
+    resynced (see sync_board).
+    """
+    board_id = int(board_id)
+    try:
+        last_event_id = request.META.get('HTTP_LAST_EVENT_ID')
+        after = int(last_event_id or request.GET.get('after', events.last_offset))
+        timeout = float(request.GET.get('timeout', EVENTS_WAIT))
+    except ValueError:
+        return json_error('Parameters after and timeout must be numbers')
+    if not math.isfinite(timeout) or timeout < 0:
+        return json_error('Timeout must be a number of seconds, at least 0')
+    timeout = min(timeout, MAX_EVENTS_WAIT)
+
+    permissions = get_perms(request.user.id, board_id)
+    stream = 'text/event-stream' in request.META.get('HTTP_ACCEPT', '')
+    try:
+        board_events = actions.get_board_events(
+            board_id,
+            after=after,
+            limit=EVENTS_PAGE_SIZE,
+            permissions=permissions
+        )
+        if not (board_events or stream):
+            release_db_connections()
+            board_events = actions.get_board_events(
+                board_id,
+                after=after,
+                limit=EVENTS_PAGE_SIZE,
+                timeout=timeout,
+                permissions=permissions
+            )
+    except events.Expired as e:
+        return json_error(str(e), status=410)
+    except PermissionError as e:
+        return json_error(str(e), status=403)
+
+    if stream:
+        release_db_connections()
+        response = StreamingHttpResponse(
+            _event_stream(board_id, request.user.id, board_events, after),
+            content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+    return json_success({
+        'events': [event.asdict() for event in board_events],
+        'next': board_events[-1].offset if board_events else after
+    })
+
+
+def _event_stream(board_id, user_id, board_events, after):
+    """Generate server-sent events for a board, until EVENT_STREAM_DURATION has passed.
+
+    Permissions are checked again before each wait, so the stream ends soon after the user loses
+    access to the board.
+    """
+    deadline = time.monotonic() + EVENT_STREAM_DURATION
+    while True:
+        for event in board_events:
+            yield sse_message(event.asdict(), id=event.offset, event=event.type)
+            after = event.offset
+        if not board_events:
+            # Keep the connection from being closed as idle
+            yield sse_message(comment='keepalive')
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        permissions = get_perms(user_id, board_id)
+        release_db_connections()
+        try:
+            board_events = actions.get_board_events(
+                board_id,
+                after=after,
+                limit=EVENTS_PAGE_SIZE,
+                timeout=min(remaining, EVENTS_WAIT),
+                permissions=permissions
+            )
+        except events.Expired as e:
+            yield sse_message({'message': str(e)}, event='expired')
+            return
+        except PermissionError as e:
+            yield sse_message({'message': str(e)}, event='forbidden')
+            return
+
+
 @login_required
 def get_note(request, note_id):
-    """Display an individual note."""
+    """Display an individual note.
+
+    Responses have an ETag that changes whenever the note is saved. If the client sends it back in
+    If-None-Match and the note is unchanged, 304 Not Modified is returned without loading it.
+    """
 
     try:
-        note = storage.get_note(note_id)
-        note = actions.get_note(note_id, permissions=get_perms(request.user.id, note.board_id))
+        if request.META.get('HTTP_IF_NONE_MATCH'):
+            version, role = use_cases.get_note_version_with_role(note_id, request.user.id)
+            version = actions.get_note_version(
+                note_id, version=version, permissions=get_perms.for_role(role))
+            etag = make_etag('note', note_id, version)
+            if etag_matches(request, etag):
+                return not_modified(etag)
+
+        note, role = use_cases.get_note_with_role(note_id, request.user.id)
+        note = actions.get_note(note_id, note=note, permissions=get_perms.for_role(role))
     except DjangoStorage.DoesNotExist:
         return json_error('Note {} does not exist'.format(note_id))
     except PermissionError as e:
         return json_error(str(e), status=403)
 
-    return json_success({'note': note.asdict()})
+    return json_success({'note': note.asdict()}, etag=make_etag('note', note.id, note.version))
+
+
+@login_required
+def get_notes(request):
+    """Display many notes, requested by comma separated IDs, eg /notes/?ids=1,2,3"""
+    try:
+        note_ids = [int(id) for id in request.GET.get('ids', '').split(',') if id]
+    except ValueError:
+        return json_error('Note ids must be integers')
+
+    note_ids = list(dict.fromkeys(note_ids))
+    if not note_ids:
+        return json_error('Note ids are required')
+    if len(note_ids) > MAX_NOTE_IDS:
+        return json_error('No more than {} notes can be requested at once'.format(MAX_NOTE_IDS))
+
+    result = actions.get_notes(note_ids, permissions=partial(get_perms.many, request.user.id))
+
+    return json_success({
+        'notes': [note.asdict() for note in result['notes']],
+        'missing': result['missing'],
+        'forbidden': result['forbidden']
+    })
+
+
+@login_required
+def search_notes(request):
+    """Search notes on all of the user's boards, eg /notes/search/?q=black+lodge
+
+    Results are ranked best first. The response includes the offset of the next page, which should
+    be passed back as the `offset` parameter, or null if this is the last page.
+    """
+    query = request.GET.get('q', '')
+    try:
+        limit = int(request.GET.get('limit', SEARCH_PAGE_SIZE))
+        offset = int(request.GET.get('offset', 0))
+    except ValueError:
+        return json_error('Parameters limit and offset must be integers')
+
+    if not 0 < limit <= MAX_SEARCH_PAGE_SIZE:
+        return json_error('Limit must be between 1 and {}'.format(MAX_SEARCH_PAGE_SIZE))
+    if offset < 0:
+        return json_error('Offset must not be negative')
+
+    try:
+        notes = actions.search_notes(request.user.id, query, limit=limit, offset=offset)
+    except ValueError as e:
+        return json_error(str(e))
+
+    return json_success({
+        'notes': [note.asdict() for note in notes],
+        'next': offset + limit if len(notes) == limit else None
+    })
 
 
 @login_required
+@storage.unit_of_work()
 def edit_note(request):
     """Edit content/metadata of individual note."""
     req_data = json.loads(request.body.decode('utf8'))
@@ -118,18 +494,382 @@ def edit_note(request):
 
     title = req_data.get('title')
     body = req_data.get('body')
+    # Version of the note the client edited, to detect conflicting edits
+    version = req_data.get('version')
+    if version is not None:
+        try:
+            version = int(version)
+        except (ValueError, TypeError):
+            return json_error('Version must be an integer')
 
     try:
-        note = storage.get_note(note_id)
+        # The edit is based on this note, so it mustn't come from a cache
+        with storage.uncached():
+            note, role = use_cases.get_note_with_role(note_id, request.user.id)
         note = actions.edit_note(
             note_id,
             title=title,
             body=body,
-            permissions=get_perms(request.user.id, note.board_id)
+            note=note,
+            version=version,
+            permissions=get_perms.for_role(role)
         )
+        # Write now rather than at the end of the unit of work, so conflicts can be reported
+        storage.flush()
     except DjangoStorage.DoesNotExist:
         return json_error('Note {} does not exist'.format(note_id))
+    except DjangoStorage.Conflict as e:
+        return json_error(str(e), status=409)
+    except PermissionError as e:
+        return json_error(str(e), status=403)
+
+    return json_success({'note': note.asdict()}, etag=make_etag('note', note.id, note.version))
+
+
+def _bulk_note_ids(req_data):
+    """Validate note_ids from a bulk request, raising ValueError if invalid."""
+    note_ids = req_data.get('note_ids')
+    if not isinstance(note_ids, list) or not note_ids:
+        raise ValueError('Parameter note_ids must be a list of note IDs')
+    if len(note_ids) > MAX_BULK_NOTE_IDS:
+        raise ValueError('At most {} notes can be changed at once'.format(MAX_BULK_NOTE_IDS))
+    try:
+        return [int(id) for id in note_ids]
+    except (ValueError, TypeError):
+        raise ValueError('Note IDs must be integers')
+
+
+@login_required
+@storage.unit_of_work()
+def move_notes(request):
+    """Move many notes to another board at once, eg {"note_ids": [1, 2, 3], "board_id": 4}.
+
+    Needs delete_note permission on each note's board, and add_note on the new one. Notes that
+    don't exist are listed as missing, and notes moved elsewhere while this runs as skipped; if any
+    permission is missing, nothing is moved.
+    """
+    req_data = json.loads(request.body.decode('utf8'))
+    try:
+        note_ids = _bulk_note_ids(req_data)
+        board_id = int(req_data['board_id'])
+    except KeyError:
+        return json_error('Board ID is required')
+    except (ValueError, TypeError) as e:
+        return json_error(str(e))
+
+    try:
+        result = actions.move_notes(partial(get_perms.many, request.user.id),
+                                    note_ids=note_ids, board_id=board_id)
+    except PermissionError as e:
+        return json_error(str(e), status=403)
+
+    return json_success({'notes': result['notes'], 'missing': result['missing'],
+                         'skipped': result['skipped']})
+
+
+@login_required
+@storage.unit_of_work()
+def edit_notes(request):
+    """Set the same fields on many notes at once, eg {"note_ids": [1, 2], "fields": {"status":
+    "archived"}}. Fields that can be set are title, body & status.
+
+    Needs edit_note permission on each note's board. Notes that don't exist are listed as missing,
+    and notes moved elsewhere while this runs as skipped; if any permission is missing, nothing is
+    edited.
+    """
+    req_data = json.loads(request.body.decode('utf8'))
+    fields = req_data.get('fields')
+    try:
+        note_ids = _bulk_note_ids(req_data)
+    except ValueError as e:
+        return json_error(str(e))
+    if not isinstance(fields, dict):
+        return json_error('Fields to edit are required')
+
+    try:
+        result = actions.edit_notes(partial(get_perms.many, request.user.id),
+                                    note_ids=note_ids, fields=fields)
     except PermissionError as e:
         return json_error(str(e), status=403)
+    except ValueError as e:
+        return json_error(str(e))
+
+    return json_success({'notes': result['notes'], 'missing': result['missing'],
+                         'skipped': result['skipped']})
+
+
+@login_required
+@storage.unit_of_work()
+@get_perms.request_scope()
+def batch(request):
+    """Run many actions in one request, in order & in a single transaction.
+
+    The body lists operations, each an action name & its parameters, eg:
+    {"operations": [{"action": "edit_note", "params": {"note_id": 1, "title": "Owls"}}, ...]}
+
+    Actions & their parameters are create_board (name), delete_board (id), create_note (board_id,
+    title, body), edit_note (note_id, title, body, version), delete_note (note_id), move_notes
+    (note_ids, board_id), edit_notes (note_ids, fields), add_user_to_board (board_id, user_id,
+    role) and remove_user_from_board (board_id, user_id). The notes & permissions needed are loaded
+    up front, with one bulk lookup each, and permissions are memoized for the request, so they are
+    as they were before the batch, apart from boards it creates or deletes. move_notes & edit_notes
+    look up their notes' boards themselves.
+
+    The response has a result for each operation in the same order, either {"success": true,
+    "response": {...}} or {"success": false, "message": "...", "status": 403}. An operation that
+    fails is rolled back alone, and the rest are still committed. Consecutive edit_note operations
+    on the same note are written to the note once, so if that write fails they all fail.
+    """
+    try:
+        operations = json.loads(request.body.decode('utf8'))['operations']
+    except (ValueError, KeyError, TypeError):
+        return json_error('Operations are required')
+    if not isinstance(operations, list):
+        return json_error('Operations must be a list')
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        return json_error('At most {} operations are allowed'.format(MAX_BATCH_OPERATIONS))
+
+    parsed = []
+    for operation in operations:
+        try:
+            parsed.append(_parse_operation(operation))
+        except ValueError as e:
+            parsed.append(e)
+    valid = [operation for operation in parsed if not isinstance(operation, ValueError)]
+
+    note_ids = {params['note_id'] for action, params in valid if 'note_id' in params}
+    notes = {note.id: note for note in use_cases.get_notes(note_ids)} if note_ids else {}
+    board_ids = {_operation_board_id(action, params, notes) for action, params in valid}
+    board_ids.discard(None)
+    if board_ids:
+        get_perms.many(request.user.id, board_ids)
+    context = _Batch(request.user.id, notes)
+
+    results = []
+    with storage.atomic():
+        for run in _edit_runs(parsed):
+            results.extend(_run_operations(context, run))
+
+    return json_success({'results': results})
+
+
+class _Batch():
+    """Notes & permissions loaded for a batch request, kept up to date as operations run."""
+
+    def __init__(self, user_id, notes):
+        self.user_id = user_id
+        self.notes = notes
+        # Permissions on boards created or deleted by the batch, which override memoized ones
+        self.perms = {}
+
+    def note(self, note_id):
+        try:
+            return self.notes[note_id]
+        except KeyError:
+            raise DjangoStorage.DoesNotExist('Note {} does not exist'.format(note_id))
+
+    def reload(self, note_ids):
+        """Reload notes changed by a bulk operation, so later operations see their new state."""
+        note_ids = [note_id for note_id in note_ids if note_id in self.notes]
+        if note_ids:
+            self.notes.update((note.id, note) for note in use_cases.get_notes(note_ids))
+
+    def permissions(self, board_id):
+        if board_id in self.perms:
+            return self.perms[board_id]
+        return get_perms(self.user_id, board_id)
+
+    def many_permissions(self, board_ids):
+        """Get permissions on many boards, looking up any that weren't loaded up front."""
+        perms = get_perms.many(self.user_id, set(board_ids).difference(self.perms))
+        perms.update((board_id, self.perms[board_id])
+                     for board_id in board_ids if board_id in self.perms)
+        return perms
+
+
+def _parse_operation(operation):
+    """Validate an operation from a batch request, returning (action, params)."""
+    if not isinstance(operation, dict) or operation.get('action') not in BATCH_ACTIONS:
+        raise ValueError('Operation must have one of these actions: {}'.format(
+            ', '.join(sorted(BATCH_ACTIONS))))
+    params = operation.get('params', {})
+    if not isinstance(params, dict):
+        raise ValueError('Operation params must be an object')
+
+    params = dict(params)
+    for name in ('id', 'note_id', 'board_id', 'user_id', 'version'):
+        if params.get(name) is not None:
+            try:
+                params[name] = int(params[name])
+            except (ValueError, TypeError):
+                raise ValueError('Parameter {} must be an integer'.format(name))
+    return operation['action'], params
+
+
+def _operation_board_id(action, params, notes):
+    """ID of the board whose permissions an operation needs, if any."""
+    if action == 'delete_board':
+        return params.get('id')
+    if 'note_id' in params:
+        note = notes.get(params['note_id'])
+        return note.board_id if note is not None else None
+    return params.get('board_id')
+
+
+def _edit_runs(operations):
+    """Group parsed operations into runs, where consecutive edits of the same note share a run."""
+    run = []
+    for operation in operations:
+        note_id = _edited_note_id(operation)
+        if run and (note_id is None or note_id != _edited_note_id(run[-1])):
+            yield run
+            run = []
+        run.append(operation)
+    if run:
+        yield run
+
+
+def _edited_note_id(operation):
+    """ID of the note an edit_note operation edits, or None for other operations."""
+    if isinstance(operation, ValueError) or operation[0] != 'edit_note':
+        return None
+    return operation[1].get('note_id')
+
+
+def _run_operations(context, run):
+    """Run operations, then write any changes buffered by them, returning their results."""
+    results = [_run_operation(context, operation) for operation in run]
+    flushed = _run(storage.flush)
+    if not flushed['success']:
+        # Edits in the run were buffered, so none of them were saved
+        results = [result if not result['success'] else flushed for result in results]
+        context.reload([_edited_note_id(operation) for operation in run])
+    return results
+
+
+def _run_operation(context, operation):
+    """Run a parsed operation in its own savepoint, returning its result or error."""
+    if isinstance(operation, ValueError):
+        return {'success': False, 'message': str(operation), 'status': 400}
+
+    action, params = operation
+    return _run(BATCH_ACTIONS[action], context, params)
+
+
+def _run(function, *args):
+    """Call function in its own savepoint, returning a batch operation result or error."""
+    try:
+        with storage.atomic():
+            response = function(*args)
+    except PermissionError as e:
+        return {'success': False, 'message': str(e), 'status': 403}
+    except DjangoStorage.Conflict as e:
+        return {'success': False, 'message': str(e), 'status': 409}
+    except (DjangoStorage.DoesNotExist, ValueError) as e:
+        return {'success': False, 'message': str(e), 'status': 400}
+    except DatabaseError:
+        django_logging.exception('batch.operation_failed')
+        return {'success': False, 'message': 'Operation failed', 'status': 500}
+    return {'success': True, 'response': response}
+
+
+def _required(params, name):
+    if params.get(name) is None:
+        raise ValueError('Parameter {} is required'.format(name))
+    return params[name]
+
+
+def _batch_create_board(context, params):
+    board = actions.create_board(name=_required(params, 'name'), user_id=context.user_id)
+    context.perms[board.id] = get_perms.for_role('owner')
+    return {'board': board.asdict()}
+
+
+def _batch_delete_board(context, params):
+    board_id = _required(params, 'id')
+    result = actions.start_board_deletion(id=board_id, user_id=context.user_id,
+                                          permissions=context.permissions(board_id))
+    context.perms[board_id] = get_perms.for_role(None)
+    return {'board': result['board'], 'job': result['job']}
+
+
+def _batch_create_note(context, params):
+    board_id = _required(params, 'board_id')
+    if 'id' in params:
+        raise ValueError('New notes cannot have an ID')
+    note_dict = {k: v for k, v in params.items() if k != 'board_id'}
+    note = actions.create_note(board_id, note_dict, user_id=context.user_id,
+                               permissions=context.permissions(board_id))
+    context.notes[note.id] = note
+    return {'note': note.asdict()}
+
+
+def _batch_edit_note(context, params):
+    note = context.note(_required(params, 'note_id'))
+    note = actions.edit_note(
+        note.id,
+        title=params.get('title'),
+        body=params.get('body'),
+        note=note,
+        version=params.get('version'),
+        permissions=context.permissions(note.board_id)
+    )
+    context.notes[note.id] = note
+    return {'note': note.asdict()}
+
+
+def _batch_delete_note(context, params):
+    note = context.note(_required(params, 'note_id'))
+    actions.delete_note(note.id, note=note, permissions=context.permissions(note.board_id))
+    del context.notes[note.id]
+    return {'note': note.asdict()}
+
+
+def _batch_move_notes(context, params):
+    board_id = _required(params, 'board_id')
+    result = actions.move_notes(context.many_permissions, note_ids=_bulk_note_ids(params),
+                                board_id=board_id)
+    context.reload(result['notes'])
+    return {'notes': result['notes'], 'missing': result['missing'], 'skipped': result['skipped']}
+
+
+def _batch_edit_notes(context, params):
+    fields = params.get('fields')
+    if not isinstance(fields, dict):
+        raise ValueError('Parameter fields is required')
+    result = actions.edit_notes(context.many_permissions, note_ids=_bulk_note_ids(params),
+                                fields=fields)
+    context.reload(result['notes'])
+    return {'notes': result['notes'], 'missing': result['missing'], 'skipped': result['skipped']}
+
+
+def _batch_add_user_to_board(context, params):
+    board_id = _required(params, 'board_id')
+    board = actions.add_user_to_board(
+        user_id=_required(params, 'user_id'),
+        board_id=board_id,
+        role=params.get('role'),
+        permissions=context.permissions(board_id))
+    return {'board': board.asdict()}
+
+
+def _batch_remove_user_from_board(context, params):
+    board_id = _required(params, 'board_id')
+    board_user = actions.remove_user_from_board(
+        user_id=_required(params, 'user_id'),
+        board_id=board_id,
+        permissions=context.permissions(board_id))
+    return {'board_user': board_user}
+
 
-    return json_success({'note': note.asdict()})
+BATCH_ACTIONS = {
+    'create_board': _batch_create_board,
+    'delete_board': _batch_delete_board,
+    'create_note': _batch_create_note,
+    'edit_note': _batch_edit_note,
+    'delete_note': _batch_delete_note,
+    'move_notes': _batch_move_notes,
+    'edit_notes': _batch_edit_notes,
+    'add_user_to_board': _batch_add_user_to_board,
+    'remove_user_from_board': _batch_remove_user_from_board,
+}
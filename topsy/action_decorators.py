@@ -1,12 +1,17 @@
 """Actions wrap use cases with permission checking and event logging behaviors."""
 
-from functools import wraps
+from functools import partial, wraps
 from django.utils.decorators import available_attrs
 
-from topsy.permissions import PermissionError
+from topsy.permissions import PermissionError, PermissionSet, permission_bit
 
 def permission(permission_required):
-    """Decorator to apply to action methods to check permissions."""
+    """Decorator to apply to action methods to check permissions.
+
+    The permissions argument is normally a PermissionSet, in which case the check is a bitwise AND
+    against the bit compiled for permission_required here. Any other container is checked with `in`.
+    """
+    bit = permission_bit(permission_required)
 
     def decorator(method, permission_required=permission_required):
         @wraps(method, assigned=available_attrs(method))
@@ -15,7 +20,11 @@ def permission(permission_required):
                 permissions = kwargs.pop('permissions')
             except KeyError:
                 raise ValueError('Action requires a permissions argument.')
-            if permission_required in permissions:
+            if type(permissions) is PermissionSet:
+                allowed = permissions.mask & bit
+            else:
+                allowed = permission_required in permissions
+            if allowed:
                 return method(self, *args, **kwargs)
 
             raise PermissionError('User lacks permission: {}'.format(permission_required))
@@ -39,3 +48,36 @@ def log(action_name):
         return _wrapped_method
 
     return decorator
+
+
+def publish(event_type):
+    """Decorator to apply to action methods to publish an event to the board's change feed.
+
+    The event's data is the action's simple keyword arguments (eg IDs, role), and its result as a
+    dictionary. Its board is the result's board_id, or its id if the result is a board; if the
+    result has board_ids, eg because notes were moved between boards, it is published to each. The
+    event is only published once the action's writes are committed (see Storage.on_commit).
+    """
+
+    def decorator(method, event_type=event_type):
+        @wraps(method, assigned=available_attrs(method))
+        def _wrapped_method(self, *args, **kwargs):
+            result = method(self, *args, **kwargs)
+            if self.events is None:
+                return result
+
+            result_dict = result if isinstance(result, dict) else result.asdict()
+            board_ids = result_dict.get('board_ids')
+            if board_ids is None:
+                board_ids = [result_dict.get('board_id', result_dict.get('id'))]
+            data = {
+                'params': {k: v for k, v in kwargs.items() if isinstance(v, (int, str))},
+                'result': result_dict
+            }
+            for board_id in board_ids:
+                self.storage.on_commit(partial(self.events.append, board_id, event_type, data))
+            return result
+
+        return _wrapped_method
+
+    return decorator
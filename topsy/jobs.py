@@ -0,0 +1,66 @@
+"""Worker that runs background jobs from a job queue (see adapters.memory_jobs).
+
+Handlers are functions that take a job's params as keyword arguments, plus a progress function to
+call with a dictionary describing progress so far:
+>>> def purge_board(board_id, progress):
+...     ...
+>>> worker = JobWorker(DjangoJobQueue(), {'board.purge': purge_board}, django_logging)
+>>> worker.run()
+
+Each worker runs one job at a time; start more worker processes to run more at once (see the
+run_jobs management command).
+"""
+
+import os
+import socket
+import time
+
+
+class JobWorker():
+    """Claims jobs from a queue & runs them with the handler for their type."""
+
+    def __init__(self, queue, handlers, logging, name=None, poll_interval=1.0):
+        self.queue = queue
+        self.handlers = handlers
+        self.logging = logging
+        self.name = name or '{}:{}'.format(socket.gethostname(), os.getpid())
+        self.poll_interval = poll_interval
+
+    def _sleep(self, seconds):
+        time.sleep(seconds)
+
+    def run_once(self):
+        """Run the next job, if there is one. Returns the finished job, or None."""
+        job = self.queue.claim(self.name)
+        if job is None:
+            return None
+
+        self.logging.info('job.start: id={}, type={}, worker={}'.format(
+            job.id, job.type, self.name))
+        try:
+            handler = self.handlers[job.type]
+        except KeyError:
+            return self._fail(job, 'No handler for job type {}'.format(job.type))
+
+        try:
+            handler(progress=lambda progress: self.queue.update(job.id, progress), **job.params)
+        except Exception as e:
+            return self._fail(job, '{}: {}'.format(type(e).__name__, e))
+
+        self.logging.info('job.done: id={}'.format(job.id))
+        return self.queue.finish(job.id)
+
+    def _fail(self, job, error):
+        self.logging.error('job.failed: id={}, error={}'.format(job.id, error))
+        return self.queue.finish(job.id, error=error)
+
+    def run(self, once=False):
+        """Run jobs as they are queued, waiting poll_interval seconds whenever there are none.
+
+        If once is true, return when there are no more jobs instead of waiting.
+        """
+        while True:
+            if self.run_once() is None:
+                if once:
+                    return
+                self._sleep(self.poll_interval)
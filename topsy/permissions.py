@@ -1,11 +1,89 @@
-"""Interface for checking a given user's permissions on a given board."""
+"""Interface for checking a given user's permissions on a given board.
 
-board_permissions = {
-    'reader': ('view_notes', ),
-    'editor': ('view_notes', 'add_note', 'delete_note', 'edit_note'),
-    'owner': ('view_notes', 'add_note', 'delete_note', 'edit_note', 'add_user', 'remove_user',
-              'edit_name', 'delete')
-}
+Permissions are compiled into integer bitmasks: each permission name is assigned a bit the first
+time it is seen, and each role maps to a PermissionSet containing the bits for its permissions.
+Checking whether a permission is in a set is then a single bitwise AND.
+"""
+
+import contextlib
+import threading
+
+_permission_bits = {}
+_permission_bits_lock = threading.Lock()
+
+
+def permission_bit(name):
+    """Return bit for a permission name, assigning a new one if needed."""
+    try:
+        return _permission_bits[name]
+    except KeyError:
+        with _permission_bits_lock:
+            # Another thread may have assigned the bit while we waited for the lock
+            return _permission_bits.setdefault(name, 1 << len(_permission_bits))
+
+
+class PermissionSet():
+    """Immutable set of permission names, stored as a bitmask.
+
+    >>> perms = PermissionSet(('view_notes', 'edit_note'))
+    >>> 'edit_note' in perms
+    True
+    >>> 'delete' in perms
+    False
+    """
+
+    __slots__ = ('mask', )
+
+    def __init__(self, permissions=()):
+        mask = 0
+        for name in permissions:
+            mask |= permission_bit(name)
+        object.__setattr__(self, 'mask', mask)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('PermissionSet is immutable')
+
+    def __contains__(self, name):
+        bit = _permission_bits.get(name)
+        return bit is not None and self.mask & bit != 0
+
+    def __iter__(self):
+        bits = list(_permission_bits.items())
+        return (name for name, bit in bits if self.mask & bit)
+
+    def __len__(self):
+        return bin(self.mask).count('1')
+
+    def __bool__(self):
+        return self.mask != 0
+
+    def __eq__(self, other):
+        if isinstance(other, PermissionSet):
+            return self.mask == other.mask
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.mask)
+
+    def __repr__(self):
+        return 'PermissionSet({!r})'.format(tuple(self))
+
+
+no_permissions = PermissionSet()
+
+board_permissions = {}
+
+
+def register_role(role, permissions):
+    """Define a board role (or redefine an existing one) with the given permission names."""
+    board_permissions[role] = PermissionSet(permissions)
+    return board_permissions[role]
+
+
+register_role('reader', ('view_notes', ))
+register_role('editor', ('view_notes', 'add_note', 'delete_note', 'edit_note'))
+register_role('owner', ('view_notes', 'add_note', 'delete_note', 'edit_note', 'add_user',
+                        'remove_user', 'edit_name', 'delete'))
 
 
 class PermissionError(Exception):
@@ -13,21 +91,78 @@ class PermissionError(Exception):
     pass
 
 
+class RoleCache():
+    """Shared cache of user roles on boards, keyed on (user_id, board_id).
+
+    Wraps a cache adapter (eg LRUCache or DjangoCache). Users without a role on a board are cached
+    too, so entries must be invalidated whenever a membership is created, changed or removed.
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    @staticmethod
+    def key(user_id, board_id):
+        return 'role:{}:{}'.format(user_id, board_id)
+
+    def get(self, user_id, board_id):
+        """Return (role, ) tuple if cached, or None on a miss."""
+        return self.cache.get(self.key(user_id, board_id))
+
+    def get_many(self, user_id, board_ids):
+        """Return dictionary mapping board ID to (role, ) tuple for every cached board."""
+        keys = {self.key(user_id, board_id): board_id for board_id in board_ids}
+        return {keys[key]: value for key, value in self.cache.get_many(keys).items()}
+
+    def set(self, user_id, board_id, role):
+        self.cache.set(self.key(user_id, board_id), (role, ))
+
+    def set_many(self, user_id, roles):
+        """Cache roles from a dictionary mapping board ID to role."""
+        self.cache.set_many({self.key(user_id, board_id): (role, )
+                             for board_id, role in roles.items()})
+
+    def invalidate(self, user_id, board_id):
+        self.cache.delete(self.key(user_id, board_id))
+
+    def invalidate_many(self, user_ids, board_id):
+        self.cache.delete_many([self.key(user_id, board_id) for user_id in user_ids])
+
+
 class PermissionChecker():
     """Check user's permissions on a board.
 
     Examples:
     >>> get_perms = PermissionChecker(DjangoStorage())
     >>> get_perms(user_id, board_id)
-    ('view_notes', 'add_note', 'delete_note', 'edit_note')
+    PermissionSet(('view_notes', 'add_note', 'delete_note', 'edit_note'))
 
     >>> get_perms = PermissionChecker(DjangoStorage())
     >>> get_perms(user_id, board_id, 'edit_note')
     True
+
+    Roles are looked up in two cache layers before falling back to storage: a memo that lives as
+    long as a request_scope() (ie one request, in the current thread), and an optional RoleCache
+    shared across requests:
+    >>> get_perms = PermissionChecker(DjangoStorage(), role_cache=RoleCache(DjangoCache()))
+    >>> @get_perms.request_scope()
+    ... def view(request):
+    ...     get_perms(user_id, board_id)
+    >>> get_perms.stats
+    {'memo_hits': 0, 'hits': 0, 'misses': 1}
+
+    If logging is given, the lookups made within each request scope are logged at debug level.
+    These are counted separately for each thread's scope, so they don't include lookups made by
+    other requests at the same time.
     """
 
-    def __init__(self, storage):
+    def __init__(self, storage, role_cache=None, logging=None):
         self._storage = storage
+        self._role_cache = role_cache
+        self._logging = logging
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self.stats = {'memo_hits': 0, 'hits': 0, 'misses': 0}
 
     def __call__(self, user_id, board_id, permission_required=None):
         permissions = self._get_permissions(user_id, board_id)
@@ -35,8 +170,124 @@ class PermissionChecker():
             return permission_required in permissions
         return permissions
 
-    def _get_permissions(self, user_id, board_id):
-        role = self._storage.get_role(user_id=user_id, board_id=board_id)
+    @staticmethod
+    def for_role(role):
+        """Get permissions for a role that has already been looked up, eg with a note."""
         if role is None:
-            return []
+            return no_permissions
         return board_permissions[role]
+
+    def many(self, user_id, board_ids):
+        """Get user's permissions on many boards, with a single storage lookup for cache misses.
+
+        Returns dictionary mapping board ID to permissions.
+        """
+        roles = self._get_roles(user_id, set(board_ids))
+        return {board_id: self.for_role(role) for board_id, role in roles.items()}
+
+    @property
+    def _memo(self):
+        """Current thread's memo of (user_id, board_id) -> role, or None outside a request scope."""
+        return getattr(self._local, 'memo', None)
+
+    def request_scope(self):
+        """Return context manager/decorator within which roles are memoized. Scopes can be nested.
+
+        Roles changed within the scope aren't seen by later checks in it, so a scope should be
+        short, eg one request (but not a long-lived stream).
+        """
+        return _RequestScope(self)
+
+    def begin(self):
+        if self._memo is None:
+            self._local.memo = {}
+            self._local.depth = 0
+            self._local.stats = dict.fromkeys(self.stats, 0)
+        self._local.depth += 1
+
+    def end(self):
+        self._local.depth -= 1
+        if self._local.depth > 0:
+            return
+        if self._logging is not None:
+            self._logging.debug('permissions.request: {}'.format(', '.join(
+                '{}={}'.format(name, count) for name, count in sorted(self._local.stats.items()))))
+        self._local.memo = None
+        self._local.stats = None
+
+    def _count(self, name, count=1):
+        """Add to shared stats, and to the current request scope's, if any."""
+        if not count:
+            return
+        with self._stats_lock:
+            self.stats[name] += count
+        if self._memo is not None:
+            self._local.stats[name] += count
+
+    def _get_permissions(self, user_id, board_id):
+        return self.for_role(self._get_role(user_id, board_id))
+
+    def _get_role(self, user_id, board_id):
+        key = (user_id, board_id)
+        if self._memo is not None and key in self._memo:
+            self._count('memo_hits')
+            return self._memo[key]
+
+        cached = None
+        if self._role_cache is not None:
+            cached = self._role_cache.get(user_id, board_id)
+
+        if cached is not None:
+            self._count('hits')
+            role = cached[0]
+        else:
+            self._count('misses')
+            role = self._storage.get_role(user_id=user_id, board_id=board_id)
+            if self._role_cache is not None:
+                self._role_cache.set(user_id, board_id, role)
+
+        if self._memo is not None:
+            self._memo[key] = role
+        return role
+
+    def _get_roles(self, user_id, board_ids):
+        roles = {}
+        if self._memo is not None:
+            for board_id in board_ids:
+                key = (user_id, board_id)
+                if key in self._memo:
+                    roles[board_id] = self._memo[key]
+            self._count('memo_hits', len(roles))
+
+        missing = [board_id for board_id in board_ids if board_id not in roles]
+        if missing and self._role_cache is not None:
+            cached = self._role_cache.get_many(user_id, missing)
+            self._count('hits', len(cached))
+            roles.update((board_id, value[0]) for board_id, value in cached.items())
+            missing = [board_id for board_id in missing if board_id not in cached]
+
+        if missing:
+            self._count('misses', len(missing))
+            fetched = self._storage.get_roles(user_id=user_id, board_ids=missing)
+            if self._role_cache is not None:
+                self._role_cache.set_many(user_id, fetched)
+            roles.update(fetched)
+
+        if self._memo is not None:
+            self._memo.update(((user_id, board_id), role) for board_id, role in roles.items())
+        return roles
+
+
+class _RequestScope(contextlib.ContextDecorator):
+    """Context manager & decorator that memoizes a PermissionChecker's roles within it."""
+
+    def __init__(self, checker):
+        self.checker = checker
+
+    def __enter__(self):
+        self.checker.begin()
+        return self.checker
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.checker.end()
+        return False
@@ -85,6 +85,37 @@ DATABASES = {
 }
 
 
+# Caches
+# https://docs.djangoproject.com/en/1.10/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # User roles on boards, used by PermissionChecker. Invalidation only reaches other processes if
+    # this is a shared backend (eg memcached), so keep the timeout short with local memory.
+    'permissions': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'permissions',
+        'TIMEOUT': 60,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+    # Notes, boards & board user lists, used by CachingStorage. Entry timeouts are set by the
+    # adapter. Each process has its own local memory cache, so writes made by other processes are
+    # only seen once entries expire (up to 5 minutes for notes); when running more than one
+    # process, use a backend they share, eg memcached.
+    'storage': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'storage',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/1.10/ref/settings/#auth-password-validators
 
@@ -126,3 +157,8 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/1.10/howto/static-files/
 
 STATIC_URL = '/static/'
+
+
+# Board change feeds are kept in each process's memory, unless a file is given to share them
+# between processes on the same host.
+EVENT_LOG_FILE = None
@@ -2,9 +2,12 @@
 
 import unittest
 
-from ..action_decorators import permission, log
-from ..permissions import PermissionError
+from ..action_decorators import permission, log, publish
+from ..permissions import PermissionError, PermissionSet
+from adapters.memory_events import MemoryEventLog
 from adapters.memory_logging import MemoryLogging
+from adapters.memory_storage import MemoryStorage
+from notes.entities import Note
 
 
 class PermissionTestCase(unittest.TestCase):
@@ -20,6 +23,14 @@ class PermissionTestCase(unittest.TestCase):
         with self.assertRaises(PermissionError):
             self.future_python(permissions=('see_the_past', ))
 
+    def test_permission_set_pass(self):
+        future = self.future_python(permissions=PermissionSet(('see_the_future', )))
+        self.assertIsNotNone(future)
+
+    def test_permission_set_fail(self):
+        with self.assertRaises(PermissionError):
+            self.future_python(permissions=PermissionSet(('see_the_past', )))
+
 
 class LogTestCase(unittest.TestCase):
     def setUp(self):
@@ -33,3 +44,33 @@ class LogTestCase(unittest.TestCase):
         result = self.add_user_to_board(user_id=1, board_id=1, role='editor')
         self.assertTrue('editor' in self.logging.dump()[0][1], self.logging.dump()[0])
         self.assertEqual(result, True)
+
+
+class PublishTestCase(unittest.TestCase):
+    def setUp(self):
+        self.storage = MemoryStorage()
+        self.events = MemoryEventLog()
+
+    @publish('note.edit')
+    def edit_note(self, note_id, title=None, note=None):
+        return note.replace(title=title)
+
+    def test_publish(self):
+        note = Note(id=1, title='title', body='body', board_id=2)
+
+        self.edit_note(1, title='new title', note=note)
+
+        event = self.events.read(2)[0]
+        self.assertEqual(event.type, 'note.edit')
+        self.assertEqual(event.data['params'], {'title': 'new title'})
+        self.assertEqual(event.data['result']['title'], 'new title')
+
+    @publish('note.move_many')
+    def move_notes(self, note_ids, board_id):
+        return {'board_id': board_id, 'board_ids': [1, board_id], 'notes': note_ids}
+
+    def test_publish_to_many_boards(self):
+        self.move_notes(note_ids=[5], board_id=2)
+
+        self.assertEqual([e.type for e in self.events.read(1)], ['note.move_many'])
+        self.assertEqual([e.data['params'] for e in self.events.read(2)], [{'board_id': 2}])
@@ -0,0 +1,44 @@
+"""Test background job worker."""
+
+import unittest
+
+from adapters.memory_jobs import MemoryJobQueue
+from adapters.memory_logging import MemoryLogging
+from ..jobs import JobWorker
+
+
+class JobWorkerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.queue = MemoryJobQueue()
+        self.handled = []
+
+        def count(number, progress):
+            for i in range(number):
+                self.handled.append(i)
+                progress({'counted': i + 1})
+
+        def fail(progress):
+            raise ValueError('Bad job')
+
+        self.worker = JobWorker(self.queue, {'count': count, 'fail': fail}, MemoryLogging(),
+                                name='worker')
+
+    def test_run_job(self):
+        job = self.queue.enqueue('count', {'number': 3})
+
+        finished = self.worker.run_once()
+
+        self.assertEqual(finished.id, job.id)
+        self.assertEqual((finished.status, finished.progress), ('done', {'counted': 3}))
+        self.assertEqual(self.handled, [0, 1, 2])
+        self.assertIsNone(self.worker.run_once())
+
+    def test_failed_jobs(self):
+        failed = self.queue.enqueue('fail', {})
+        unknown = self.queue.enqueue('shred', {})
+
+        self.worker.run(once=True)
+
+        self.assertEqual(self.queue.get(failed.id).status, 'failed')
+        self.assertEqual(self.queue.get(failed.id).error, 'ValueError: Bad job')
+        self.assertEqual(self.queue.get(unknown.id).error, 'No handler for job type shred')
@@ -1,11 +1,15 @@
 """Test permission checker class, which is used to get user permissions on board."""
 
+import threading
 import unittest
+from unittest.mock import MagicMock
 
-from ..permissions import PermissionChecker
+from ..permissions import (PermissionChecker, PermissionSet, RoleCache, board_permissions,
+    permission_bit, register_role)
 from notes.entities import Board
 from accounts.entities import User
 from adapters.memory_storage import MemoryStorage
+from adapters.memory_cache import LRUCache
 
 storage = MemoryStorage()
 
@@ -41,3 +45,130 @@ class PermissionCheckerTestCase(unittest.TestCase):
         perms = self.get_perms(10, 12)
 
         self.assertTrue(len(perms) == 0)
+
+
+class PermissionSetTestCase(unittest.TestCase):
+    def test_membership(self):
+        perms = PermissionSet(('view_notes', 'edit_note'))
+
+        self.assertTrue('edit_note' in perms)
+        self.assertFalse('delete' in perms)
+        self.assertFalse('never_registered' in perms)
+        self.assertEqual(set(perms), {'view_notes', 'edit_note'})
+
+    def test_register_role(self):
+        """Roles defined at runtime should be usable by the checker."""
+        register_role('commenter', ('view_notes', 'add_comment'))
+        self.addCleanup(board_permissions.pop, 'commenter')
+        board = storage.save_board(Board(name='Fox & Raccoon'))
+        user = storage.create_user(User(name='Bird', email='bird@forest.com'), 'w0rm')
+        storage.save_board_user(board.id, user.id, 'commenter')
+
+        perms = PermissionChecker(storage)(user.id, board.id)
+
+        self.assertEqual(perms, PermissionSet(('add_comment', 'view_notes')))
+
+    def test_concurrent_bits_distinct(self):
+        """Permissions first seen in different threads at once should get different bits."""
+        names = ['concurrent_{}'.format(i) for i in range(16)]
+        barrier = threading.Barrier(len(names))
+        bits = {}
+
+        def assign(name):
+            barrier.wait()
+            bits[name] = permission_bit(name)
+
+        threads = [threading.Thread(target=assign, args=(name, )) for name in names]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(set(bits.values())), len(names))
+        self.assertEqual({name: permission_bit(name) for name in names}, bits)
+
+
+class CachedPermissionCheckerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.storage = MemoryStorage()
+        self.role_cache = RoleCache(LRUCache())
+        self.get_perms = PermissionChecker(self.storage, role_cache=self.role_cache)
+        self.board = self.storage.save_board(Board(name='Fox & Raccoon'))
+        self.user = self.storage.create_user(User(name='Bird', email='bird@forest.com'), 'w0rm')
+        self.storage.save_board_user(self.board.id, self.user.id, 'editor')
+
+    def test_shared_cache_hit(self):
+        """Second lookup should be served from the shared cache."""
+        self.get_perms(self.user.id, self.board.id)
+        perms = self.get_perms(self.user.id, self.board.id)
+
+        self.assertTrue('edit_note' in perms)
+        self.assertEqual(self.get_perms.stats, {'memo_hits': 0, 'hits': 1, 'misses': 1})
+
+    def test_request_memo_hit(self):
+        """Repeated lookups within a request scope should be memoized."""
+        @self.get_perms.request_scope()
+        def view():
+            self.get_perms(self.user.id, self.board.id)
+            self.get_perms(self.user.id, self.board.id)
+
+        view()
+
+        self.assertEqual(self.get_perms.stats, {'memo_hits': 1, 'hits': 0, 'misses': 1})
+
+    def test_request_memo_ends_with_scope(self):
+        """Memo should last until the outermost scope ends, and not be used after it."""
+        with self.get_perms.request_scope():
+            with self.get_perms.request_scope():
+                self.get_perms(self.user.id, self.board.id)
+            self.get_perms(self.user.id, self.board.id)
+        self.get_perms(self.user.id, self.board.id)
+
+        self.assertEqual(self.get_perms.stats, {'memo_hits': 1, 'hits': 1, 'misses': 1})
+
+    def test_request_stats_logged(self):
+        """Lookups made within a request scope should be logged when it ends."""
+        logging = MagicMock()
+        get_perms = PermissionChecker(self.storage, role_cache=self.role_cache, logging=logging)
+        self.get_perms(self.user.id, self.board.id)
+
+        with get_perms.request_scope():
+            get_perms(self.user.id, self.board.id)
+            get_perms(self.user.id, self.board.id)
+
+        logging.debug.assert_called_once_with('permissions.request: hits=1, memo_hits=1, misses=0')
+
+    def test_request_stats_exclude_other_threads(self):
+        """Lookups made by other threads during a request scope shouldn't be logged for it."""
+        logging = MagicMock()
+        get_perms = PermissionChecker(self.storage, logging=logging)
+
+        with get_perms.request_scope():
+            get_perms(self.user.id, self.board.id)
+            thread = threading.Thread(target=get_perms, args=(self.user.id, self.board.id))
+            thread.start()
+            thread.join()
+
+        logging.debug.assert_called_once_with('permissions.request: hits=0, memo_hits=0, misses=1')
+        self.assertEqual(get_perms.stats, {'memo_hits': 0, 'hits': 0, 'misses': 2})
+
+    def test_invalidate(self):
+        """Invalidated entries should be looked up in storage again."""
+        self.get_perms(self.user.id, self.board.id)
+        self.storage.delete_board_user(self.board.id, self.user.id)
+        self.role_cache.invalidate(self.user.id, self.board.id)
+
+        perms = self.get_perms(self.user.id, self.board.id)
+
+        self.assertEqual(len(perms), 0)
+
+    def test_many(self):
+        """Bulk lookup should use cached roles and fetch the rest from storage."""
+        other_board = self.storage.save_board(Board(name='Owl & Pussycat'))
+        self.get_perms(self.user.id, self.board.id)
+
+        perms = self.get_perms.many(self.user.id, [self.board.id, other_board.id])
+
+        self.assertTrue('edit_note' in perms[self.board.id])
+        self.assertEqual(len(perms[other_board.id]), 0)
+        self.assertEqual(self.get_perms.stats, {'memo_hits': 0, 'hits': 1, 'misses': 2})
@@ -0,0 +1,70 @@
+"""Test JSON response helpers."""
+
+import gzip
+import json
+import unittest
+
+from django.test import RequestFactory
+
+from ..utils import json_success_stream, make_etag, etag_matches, ndjson_gzip_stream
+from notes.entities import Note
+
+
+class JsonSuccessStreamTestCase(unittest.TestCase):
+    def test_stream_generator_of_entities(self):
+        notes = (Note(id=i, title='title', body='body') for i in range(3))
+
+        response = json_success_stream({'notes': notes, 'count': 3})
+        content = b''.join(response.streaming_content).decode('utf8')
+        data = json.loads(content)
+
+        self.assertTrue(data['success'])
+        self.assertEqual([n['id'] for n in data['response']['notes']], [0, 1, 2])
+        self.assertEqual(data['response']['count'], 3)
+
+    def test_stream_is_lazy(self):
+        def notes():
+            yield Note(id=1, title='title', body='body')
+            raise AssertionError('Iterator consumed before response was read')
+
+        json_success_stream({'notes': notes()})
+
+
+class NdjsonGzipStreamTestCase(unittest.TestCase):
+    def test_round_trip(self):
+        rows = ({'id': i, 'title': 'Note {}'.format(i)} for i in range(2000))
+
+        content = gzip.decompress(b''.join(ndjson_gzip_stream(rows))).decode('utf8')
+
+        lines = content.splitlines()
+        self.assertEqual(len(lines), 2000)
+        self.assertEqual(json.loads(lines[-1]), {'id': 1999, 'title': 'Note 1999'})
+
+    def test_stream_is_lazy(self):
+        def rows():
+            yield {'id': 1}
+            raise AssertionError('Iterator consumed before stream was read')
+
+        ndjson_gzip_stream(rows())
+
+
+class EtagMatchesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.etag = make_etag('note', 1, 2)
+
+    def create_request(self, if_none_match):
+        return RequestFactory().get('/', HTTP_IF_NONE_MATCH=if_none_match)
+
+    def test_matches_any_listed_etag(self):
+        request = self.create_request('"note-1-1", {}'.format(self.etag))
+        self.assertTrue(etag_matches(request, self.etag))
+
+    def test_matches_weak_etag(self):
+        self.assertTrue(etag_matches(self.create_request('W/' + self.etag), self.etag))
+
+    def test_matches_wildcard(self):
+        self.assertTrue(etag_matches(self.create_request('*'), self.etag))
+
+    def test_no_match(self):
+        self.assertFalse(etag_matches(self.create_request('"note-1-1"'), self.etag))
+        self.assertFalse(etag_matches(RequestFactory().get('/'), self.etag))
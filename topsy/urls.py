@@ -13,11 +13,29 @@ urlpatterns = [
     url(r'^logout/$', accounts_views.logout, name='logout'),
 
     # Notes & Boards
+    url(r'^batch/$', notes_views.batch, name='batch'),
+    url(r'^notes/$', notes_views.get_notes, name='get_notes'),
+    url(r'^notes/search/$', notes_views.search_notes, name='search_notes'),
     url(r'^notes/(?P<note_id>[0-9]+)/$', notes_views.get_note, name='get_note'),
     url(r'^notes/edit/$', notes_views.edit_note, name='edit_note'),
+    url(r'^notes/edit-many/$', notes_views.edit_notes, name='edit_notes'),
+    url(r'^notes/move/$', notes_views.move_notes, name='move_notes'),
+    url(r'^boards/$', notes_views.get_user_boards, name='get_user_boards'),
     url(r'^boards/create/$', notes_views.create_board, name='create_board'),
+    url(r'^boards/(?P<board_id>[0-9]+)/notes/$', notes_views.get_board_notes,
+        name='get_board_notes'),
+    url(r'^boards/(?P<board_id>[0-9]+)/notes/all/$', notes_views.get_all_board_notes,
+        name='get_all_board_notes'),
+    url(r'^boards/(?P<board_id>[0-9]+)/export/$', notes_views.export_board,
+        name='export_board'),
+    url(r'^boards/(?P<board_id>[0-9]+)/import/$', notes_views.import_notes,
+        name='import_notes'),
+    url(r'^boards/(?P<board_id>[0-9]+)/sync/$', notes_views.sync_board, name='sync_board'),
+    url(r'^boards/(?P<board_id>[0-9]+)/events/$', notes_views.get_board_events,
+        name='get_board_events'),
     url(r'^boards/add-user/$', notes_views.add_user_to_board, name='add_user_to_board'),
     url(r'^boards/remove-user/$', notes_views.remove_user_from_board,
         name='remove_user_from_board'),
-    url(r'^boards/delete/$', notes_views.delete_board, name='delete_board')
+    url(r'^boards/delete/$', notes_views.delete_board, name='delete_board'),
+    url(r'^jobs/(?P<job_id>[0-9]+)/$', notes_views.get_job, name='get_job')
 ]
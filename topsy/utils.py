@@ -1,7 +1,127 @@
-from django.http import JsonResponse
+import hashlib
+import zlib
+from collections.abc import Iterator
 
-def json_success(response, status=200):
-    return JsonResponse({'success': True, 'response': response}, status=status)
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.http import HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+from django.utils.http import parse_etags, quote_etag
+
+from topsy.entities import Entity
+
+# Approximate size of each chunk written by json_success_stream
+STREAM_CHUNK_SIZE = 8192
+
+def json_success(response, status=200, etag=None):
+    json_response = JsonResponse({'success': True, 'response': response}, status=status)
+    if etag is not None:
+        json_response['ETag'] = etag
+    return json_response
 
 def json_error(message, status=400):
     return JsonResponse({'success': False, 'message': message}, status=status)
+
+def json_success_stream(response, status=200):
+    """Like json_success, but encodes the response incrementally as it is sent.
+
+    Any iterator in the response (eg a generator of entities) is encoded as a JSON array, one item
+    at a time, so it never needs to be held in memory in full. Entities are converted with asdict.
+    """
+    chunks = _chunked(_iter_json({'success': True, 'response': response}, DjangoJSONEncoder()))
+    return StreamingHttpResponse(chunks, status=status, content_type='application/json')
+
+def _iter_json(value, encoder):
+    """Generate JSON encoding of value in pieces."""
+    if isinstance(value, Entity):
+        yield encoder.encode(value.asdict())
+    elif isinstance(value, dict):
+        yield '{'
+        for i, (key, item) in enumerate(value.items()):
+            yield '{}{}: '.format(', ' if i else '', encoder.encode(str(key)))
+            yield from _iter_json(item, encoder)
+        yield '}'
+    elif isinstance(value, (list, tuple, Iterator)):
+        yield '['
+        for i, item in enumerate(value):
+            if i:
+                yield ', '
+            yield from _iter_json(item, encoder)
+        yield ']'
+    else:
+        yield encoder.encode(value)
+
+def _chunked(pieces, size=STREAM_CHUNK_SIZE):
+    """Join small strings into chunks of roughly size characters, encoded as UTF-8."""
+    buffer, length = [], 0
+    for piece in pieces:
+        buffer.append(piece)
+        length += len(piece)
+        if length >= size:
+            yield ''.join(buffer).encode('utf8')
+            buffer, length = [], 0
+    if buffer:
+        yield ''.join(buffer).encode('utf8')
+
+def iter_ndjson(rows):
+    """Encode each row as a line of JSON, for newline-delimited JSON (NDJSON)."""
+    encoder = DjangoJSONEncoder()
+    for row in rows:
+        yield encoder.encode(row) + '\n'
+
+def gzip_stream(chunks, level=6):
+    """Compress chunks of bytes into a gzip stream, incrementally, yielding compressed chunks."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+def ndjson_gzip_stream(rows):
+    """Encode rows as gzip-compressed NDJSON, one chunk at a time, eg for a streamed download."""
+    return gzip_stream(_chunked(iter_ndjson(rows)))
+
+def make_etag(*parts):
+    """Strong ETag for a representation fully identified by parts, eg ('note', id, version)."""
+    return quote_etag('-'.join(str(part) for part in parts))
+
+def versions_etag(prefix, entities):
+    """Strong ETag for a list of versioned entities, changing if any is added, removed or saved."""
+    versions = ','.join('{}:{}'.format(entity.id, entity.version) for entity in entities)
+    return make_etag(prefix, hashlib.sha1(versions.encode('utf8')).hexdigest())
+
+def etag_matches(request, etag):
+    """Whether request's If-None-Match header matches etag, so the client's copy is current."""
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    return etag.strip('"') in parse_etags(if_none_match)
+
+def not_modified(etag):
+    response = HttpResponseNotModified()
+    response['ETag'] = etag
+    return response
+
+def sse_message(data=None, id=None, event=None, comment=None):
+    """Encode a server-sent event. data is encoded as JSON."""
+    lines = []
+    if comment is not None:
+        lines.append(': {}'.format(comment))
+    if id is not None:
+        lines.append('id: {}'.format(id))
+    if event is not None:
+        lines.append('event: {}'.format(event))
+    if data is not None:
+        lines.append('data: {}'.format(DjangoJSONEncoder().encode(data)))
+    return ('\n'.join(lines) + '\n\n').encode('utf8')
+
+def release_db_connections():
+    """Close this thread's database connections, eg before waiting a long time for something else.
+
+    They are reopened if needed. Connections within a transaction are left alone.
+    """
+    for connection in connections.all():
+        if not connection.in_atomic_block:
+            connection.close()